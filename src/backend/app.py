@@ -1,14 +1,15 @@
-from fastapi import FastAPI, Depends, Request, HTTPException, Query, UploadFile, File, Form, Body
+from fastapi import FastAPI, Depends, Request, HTTPException, Query, UploadFile, File, Form, Body, Header
 from fastapi_login import LoginManager
 from pymongo import MongoClient
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response as RawResponse
 from passlib.context import CryptContext
 from src.backend.classes.models import *
 from src.backend.server.service import *
 from src.backend.classes.datastore import data_store as ds
 from src.backend.server.auth import *
-from src.backend.classes.Manager import manager as _manager, blacklist_user_token, clear_blacklist
-from src.backend.database import db
+from src.backend.classes.Manager import manager as _manager, blacklist_user_token, clear_blacklist, revoked_tokens
+from src.backend.database import db, write_queue, db_load_datastore
 from src.backend.server.tags import *
 from src.backend.server.admin import *
 from src.backend.server.upload import *
@@ -16,9 +17,11 @@ from src.backend.server.user import *
 from src.backend.server.review import *
 from src.backend.server.upload import import_yaml_wrapper
 from src.backend.server.dummy import *
+from src.backend.server.email import email_dispatcher
+from src.backend.server.pagination import Page, get_page, with_next_cursor, NEXT_CURSOR_HEADER
 from json import dumps
 import asyncio
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime, timezone, timedelta
 
 
@@ -32,7 +35,7 @@ def admin_required():
    '''
        Used to verify that the user is an admin
    '''
-   def admin_checker(user=Depends(manager)):
+   async def admin_checker(user=Depends(manager)):
        if user is None:
            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
        if not user["is_admin"]:
@@ -43,35 +46,39 @@ def admin_required():
    return admin_checker
 
 
-def purge_expired_tokens():
-   '''
-       Used to purge expired tokens in blacklisted token
-   '''
-   current_time = datetime.now(timezone.utc)
-   expired_tokens = [token for token, expiry in blacklisted_tokens.items() if expiry < current_time]
-
-
-   for token in expired_tokens:
-       del blacklisted_tokens[token]
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
    '''
        Lifespan context manager for FastAPI to manage background tasks
    '''
-   async def periodic_purge():
-       '''
-           Process that runs in the background to call purge_expired_tokens()
-       '''
-       while True:
-           purge_expired_tokens()
-           await asyncio.sleep(1800)
+   # Warm start from MongoDB, so a restart (or another replica) keeps the stored data
+   try:
+       timings = await db_load_datastore(ds)
+       print(f"Loaded datastore from MongoDB in {timings['total']:.2f}s "
+             f"({ds.num_users()} users, {ds.num_apis()} services, {ds.num_reviews()} reviews)")
+   except Exception as e:
+       print(f"Failed to load datastore from MongoDB, starting empty: {e}")
+
+   # Expires revoked tokens, and shares revocations with other workers
+   revocations = asyncio.create_task(revoked_tokens.run())
+   flusher = asyncio.create_task(write_queue.run())
+   mailer = asyncio.create_task(email_dispatcher.run())
+   yield
+   revocations.cancel()
+   await revoked_tokens.sync()
 
+   # Persist any writes still waiting in the write-behind queue, once a
+   # flush in progress has finished (or re-queued its batch)
+   flusher.cancel()
+   with suppress(asyncio.CancelledError):
+       await flusher
+   await write_queue.flush()
 
-   task = asyncio.create_task(periodic_purge())
-   yield
-   task.cancel()
+   # Make one last attempt at queued emails (kept in MongoDB if persisted)
+   mailer.cancel()
+   await email_dispatcher.flush()
+
+   await tag_generator.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -90,6 +97,7 @@ app.add_middleware(
    allow_credentials=True,
    allow_methods=["*"],
    allow_headers=["*"],
+   expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -110,9 +118,10 @@ async def clear():
        Internal Testing function to clear datastore
    '''
    ds.clear_datastore()
-   clear_all_users()
-   clear_all_services()
-   create_super_admin()
+   await clear_all_users()
+   await clear_all_services()
+   await clear_all_content()
+   await create_super_admin()
    clear_blacklist()
    assert ds.num_apis() == 0
    return {"message" : "Clear Successful"}
@@ -123,7 +132,7 @@ async def add_dummy():
     '''
         Internal Testing function to add some data for testing
     '''
-    import_dummy_data()
+    await import_dummy_data()
 
 @app.post("/upload/pdfs")
 async def upload_pdf(file: UploadFile = File(...)):
@@ -147,7 +156,7 @@ async def get_id(user: User = Depends(manager)):
    '''
     Returns user's id
    '''
-   user = data_store.get_user_by_id(user['id'])
+   user = user['user']
    return {'uid': user.get_id()}
 
 #####################################
@@ -160,8 +169,8 @@ async def add_service(service: ServiceAdd, user: User = Depends(manager)):
    '''
    # Unpack request body
    request = service.model_dump()
-   user = data_store.get_user_by_id(user['id'])
-   id = add_service_wrapper(request, user)
+   user = user['user']
+   id = await add_service_wrapper(request, user)
    return {'id' : id}
 
 
@@ -170,7 +179,7 @@ async def upload_yaml(file: UploadFile = File(...), user: User = Depends(manager
    '''
        Endpoint to upload a YAML file
    '''
-   user = data_store.get_user_by_id(user['id'])
+   user = user['user']
    id = await import_yaml_wrapper(file, user)
    return {'id': id}
 
@@ -192,7 +201,7 @@ async def update_service(service: ServiceGlobalUpdate, user: User = Depends(mana
 
    request = service.model_dump()
  
-   update_service_wrapper(request)
+   await update_service_wrapper(request)
    return None
 
 @app.post("/service/upload_docs")
@@ -208,14 +217,16 @@ async def upload_docs(info: ServiceUpload, user: User=Depends(manager)):
 
 
 @app.get("/service/my_services")
-async def get_user_apis(user: User = Depends(manager)):
+async def get_user_apis(response: RawResponse,
+                        user: User = Depends(manager),
+                        page: Optional[Page] = Depends(get_page)):
    '''
        Method to get the list of APIs owned by the currently authenticated user.
        Returns a list of APIs with specific fields: id, name, owner, description, icon_url, and tags.
    '''
    uid = user['id']
-   user_apis = ds.get_user_apis(uid)
-   return user_apis
+   user_apis = user_apis_wrapper(uid, page)
+   return with_next_cursor(user_apis, page, response)
 
 
 @app.get("/service/filter")
@@ -225,15 +236,18 @@ async def filter(
     pay_models: Optional[List[str]] = Query(None),
     hide_pending: bool = True,
     sort_rating: bool = False,
+    page: Optional[Page] = Depends(get_page)
 ):
-    return api_tag_filter(tags, providers, pay_models, hide_pending, sort_rating)
+    return with_next_cursor(api_tag_filter(tags, providers, pay_models, hide_pending, sort_rating, page),
+                            page, None)
 
 @app.get("/service/search")
 async def search(
     name: Optional[str] = Query(None),
-    hide_pending: bool = True
+    hide_pending: bool = True,
+    page: Optional[Page] = Depends(get_page)
 ):
-   return api_name_search(name, hide_pending)
+   return with_next_cursor(api_name_search(name, hide_pending, page), page, None)
 
 
 @app.delete("/service/delete")
@@ -241,7 +255,7 @@ async def delete_api(sid: str, user: User = Depends(manager)):
    """
        Delete an API service by its service id (id).
    """
-   return delete_service(sid, user['id'], user['is_admin'])
+   return await delete_service(sid, user['id'], user['is_admin'])
 
 
 @app.post("/service/add_icon")
@@ -263,11 +277,12 @@ async def api_delete_icon(info: Annotated[ServiceIconDeleteInfo, Query()], user:
 
 
 @app.get("/service/get/icon")
-async def api_get_icon(sid: str):
+async def api_get_icon(sid: str, size: Optional[int] = None, accept: Optional[str] = Header(None)):
    '''
-       Retrieves service icon as image file
+       Retrieves service icon as image file, resized to fit size pixels
+       square if given
    '''
-   return service_get_icon_wrapper(sid)
+   return await service_get_icon_wrapper(sid, size, accept)
 
 
 @app.post("/service/review/add")
@@ -289,13 +304,15 @@ async def api_get_rating(sid: str):
 
 
 @app.get("/service/get/reviews")
-async def api_get_reviews(sid: str, filter: str = '', uid: str = ''):
+async def api_get_reviews(response: RawResponse,
+                          sid: str, filter: str = '', uid: str = '',
+                          page: Optional[Page] = Depends(get_page)):
    '''
        Endpoint to retrieve a service's reviews
    '''
-   return {
-       'reviews' : service_get_reviews_wrapper(sid, filter=filter, uid=uid)
-   }
+   return with_next_cursor({
+       'reviews' : service_get_reviews_wrapper(sid, filter=filter, uid=uid, page=page)
+   }, page, response)
 
 
 @app.get("/get/doc")
@@ -340,7 +357,7 @@ async def generate_tags_endpoint(description: str, user: User = Depends(manager)
     '''
         Method used to generate tags using ollama
     '''
-    tags = auto_generate_tags(description) 
+    tags = await auto_generate_tags(description)
     return {"tags": tags}
                                                                                                                                
 #####################################
@@ -441,7 +458,7 @@ async def register(user: UserCreate):
    '''
        Register a user onto the platform
    '''
-   uid = register_wrapper(user.displayname, user.username, user.password, user.email)
+   uid = await register_wrapper(user.displayname, user.username, user.password, user.email)
    return {'uid' : uid}
 
 
@@ -452,7 +469,7 @@ async def login(credentials: LoginModel):
    '''
    username = credentials.username
    password = credentials.password
-   access_token = login_wrapper(username, password)
+   access_token = await login_wrapper(username, password)
    return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -468,7 +485,7 @@ async def verify_email(token: str):
 
 
    user.verify_user()
-   db_update_user(uid, user.to_json())
+   await db_update_user(uid, user)
    return {"message": "Email verified successfully."}
 
 @app.post("/auth/resend-verification")
@@ -479,7 +496,7 @@ async def resend_verification(email: GeneralString):
         raise HTTPException(status_code=400, detail="User not found")
     uid = user.get_id()
     verification_token = generate_verification_token(uid)
-    send_email(email.content, verification_token)
+    queue_email(email.content, verification_token)
     return {"message": "Email has been sent!"}
 
 @app.post("/auth/reset-password")
@@ -512,7 +529,7 @@ async def reset_password_form(token: str, password: Password):
    user = data_store.get_user_by_id(uid)
    if not user:
        raise HTTPException(status_code=400, detail="User not found")
-   change_password(uid, password.newpass)
+   await change_password(uid, password.newpass)
    return {"message": "Password changed successfully."}
 
 
@@ -591,11 +608,14 @@ async def get_tags_ranked(num: int, custom: bool = False):
 
 
 @app.get("/admin/dashboard/users")
-async def get_users(user: User = Depends(manager), role: str = Depends(admin_required())):
+async def get_users(response: RawResponse,
+                    user: User = Depends(manager),
+                    role: str = Depends(admin_required()),
+                    page: Optional[Page] = Depends(get_page)):
    '''
        Endpoint to get all users
    '''
-   return get_all_users()
+   return with_next_cursor(get_all_users(page), page, response)
 
 
 @app.post("/admin/promote")
@@ -603,7 +623,7 @@ async def promote(uid: str, user: User = Depends(manager), role: str = Depends(a
    '''
        Endpoint to promote given their id
    '''
-   return promote_user(uid, user["is_super"])
+   return await promote_user(uid, user["is_super"])
 
 
 @app.post("/admin/demote")
@@ -611,7 +631,7 @@ async def demote(uid: str, user: User = Depends(manager), role: str = Depends(ad
    '''
        Endpoint to demote a user given their id
    '''
-   return demote_user(uid, user["is_super"])
+   return await demote_user(uid, user["is_super"])
 
 
 @app.delete("/admin/delete/user")
@@ -619,17 +639,20 @@ async def user_delete(uid: str, user: User = Depends(manager), role: str = Depen
    '''
        Endpoint to delete a user given their id
    '''
-   return delete_user(uid, user["is_super"])
+   return await delete_user(uid, user["is_super"])
 
 
 @app.get("/admin/get/reviews")
-async def admin_get_reviews(user: User = Depends(manager), role: str = Depends(admin_required())):
+async def admin_get_reviews(response: RawResponse,
+                            user: User = Depends(manager),
+                            role: str = Depends(admin_required()),
+                            page: Optional[Page] = Depends(get_page)):
    '''
        Endpoint which retrieves all pending reviews
    '''
-   return {
-       'reviews': admin_get_reviews_wrapper()
-   }
+   return with_next_cursor({
+       'reviews': admin_get_reviews_wrapper(page)
+   }, page, response)
 
 
 @app.get("/admin/get/services")
@@ -647,7 +670,7 @@ async def admin_service_approve(info: ServiceApprove, user: User = Depends(manag
    '''
   
    request = info.model_dump()
-   approve_service_wrapper(request["sid"],
+   await approve_service_wrapper(request["sid"],
                            request["approved"],
                            request["reason"],
                            request["service_global"],
@@ -671,6 +694,23 @@ async def admin_check_user_role(uid: str, user: User = Depends(manager), role: s
    return admin_check_if_admin(uid)
 
 
+@app.get("/admin/metrics/hashing")
+async def admin_hashing_metrics(user: User = Depends(manager), role: str = Depends(admin_required())):
+   '''
+       Endpoint which reports the password hashing pool's load, incl. its
+       queue depth and how many logins/registrations were rejected
+   '''
+   return _manager.get_hash_stats()
+
+@app.get("/admin/metrics/email")
+async def admin_email_metrics(user: User = Depends(manager), role: str = Depends(admin_required())):
+   '''
+       Endpoint which reports the email dispatcher's queue, incl. how many
+       emails were sent, given up on or dropped
+   '''
+   return email_dispatcher.get_stats()
+
+
 #####################################
 #   User Paths
 #####################################
@@ -698,11 +738,12 @@ async def user_get(user: User=Depends(manager)):
 
 
 @app.get("/user/get/icon")
-async def user_get_icon(user: User=Depends(manager)):
+async def user_get_icon(size: Optional[int] = None, accept: Optional[str] = Header(None), user: User=Depends(manager)):
    '''
-       Endpoint which retrieves user's icon (if one exists)
+       Endpoint which retrieves user's icon (if one exists), resized to fit
+       size pixels square if given
    '''
-   return user_get_icon_wrapper(user['id'])
+   return await user_get_icon_wrapper(user['id'], size, accept)
 
 
 @app.get("/user/get/reviews")
@@ -728,7 +769,7 @@ async def delete_user_self(user: User = Depends(manager)):
    '''
        Endpoint which allows the user to un-register themselves
    '''
-   return user_self_delete(user['id'])
+   return await user_self_delete(user['id'])
 
 
 @app.get("/user/get/replies")
@@ -744,7 +785,7 @@ async def update_user_displayname(new_displayname: GeneralString, user: User = D
    '''
        Endpoint which allows the user to update their displayname
    '''
-   return user_update_displayname(user['id'], new_displayname.content)
+   return await user_update_displayname(user['id'], new_displayname.content)
 
 
 @app.get("/user/permission_check")
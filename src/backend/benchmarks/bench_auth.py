@@ -0,0 +1,89 @@
+'''
+    Benchmark for the cost of authenticating a request.
+
+    Sends n requests through the ASGI app to /auth/account (which only
+    authenticates) and to /auth/guest (which does not), and reports the
+    difference per request - the auth overhead. It is measured with the
+    token and principal caches, without them, and with the previous loader
+    (synchronous, so run on a worker thread, and decoding every token).
+    As with timeit, garbage collection is paused while timing.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_auth [n]
+'''
+import os
+os.environ.setdefault("EMAIL", "False")
+
+import asyncio
+import functools
+import gc
+import sys
+import time
+import httpx
+from src.backend.app import app
+from src.backend.classes.Manager import _manager, load_user, TokenCache, PRINCIPAL_TTL, PRINCIPAL_CACHE_SIZE
+from src.backend.classes.User import User
+from src.backend.classes.datastore import data_store
+
+
+DEFAULT_REQUESTS = 5_000
+
+
+def sync_load_user(uid: str):
+    '''
+        The previous, synchronous user loader
+    '''
+    user = data_store.get_user_by_id(uid)
+    return {
+        'id' : user.get_id(),
+        'username' : user.get_name(),
+        'email' : user.get_email(),
+        'password' : user.get_password(),
+        'is_admin' : user.get_is_admin(),
+        'is_super' : user.get_is_super(),
+    }
+
+
+def configure(cached: bool, loader) -> None:
+    size = PRINCIPAL_CACHE_SIZE if cached else 0
+    _manager.payloads = TokenCache(PRINCIPAL_TTL, size)
+    _manager.principals = TokenCache(PRINCIPAL_TTL, size)
+    _manager._user_callback = functools.partial(loader)
+
+
+async def timed(client: httpx.AsyncClient, path: str, headers: dict, n: int) -> float:
+    '''
+        Returns mean microseconds per request
+    '''
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    for _ in range(n):
+        response = await client.get(path, headers=headers)
+    seconds = time.perf_counter() - start
+    gc.enable()
+    assert response.status_code == 200
+    return seconds / n * 1e6
+
+
+async def main(n: int) -> None:
+    data_store.clear_datastore()
+    user = User('0', 'bench', 'bench', 'hash', 'bench@bench', False, False)
+    data_store.add_user(user)
+    token = _manager.create_access_token(data={'sub': user.get_id()})
+    user.update_token(token)
+    headers = {'Authorization': f"Bearer {token}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for name, cached, loader in [('previous loader', False, sync_load_user),
+                                     ('uncached', False, load_user),
+                                     ('cached', True, load_user)]:
+            configure(cached, loader)
+            guest = await timed(client, '/auth/guest', {}, n)
+            account = await timed(client, '/auth/account', headers, n)
+            print(f"{name:>16} {account - guest:8.1f} us auth overhead per request")
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS))
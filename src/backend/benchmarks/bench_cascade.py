@@ -0,0 +1,103 @@
+'''
+    Benchmark for deleting a prolific user.
+
+    Loads a user who has reviewed n services (owned by n / 10 other users),
+    and owns n / 100 services reviewed by the others, with every review
+    voted on by a few users, into the global datastore. Then reports the
+    seconds taken to delete the user from the datastore with a Cascade,
+    alongside deleting their votes, reviews and services one at a time, as
+    user_delete_association used to. MongoDB is not involved - the cascade
+    persists with one delete_many per collection. As with timeit, garbage
+    collection is paused while timing.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_cascade [reviews]
+'''
+import gc
+import sys
+import time
+from src.backend.classes.API import API
+from src.backend.classes.Review import Review
+from src.backend.classes.User import User
+from src.backend.classes.datastore import data_store
+from src.backend.server.cascade import Cascade
+from src.backend.server.review import review_delete_wrapper, review_remove_vote_wrapper
+
+
+DEFAULT_REVIEWS = 10_000
+VOTERS = 3
+
+
+def build(n: int) -> str:
+    '''
+        Loads the datastore, returning the prolific user's id
+    '''
+    others = [User(str(uid), f"user {uid}", f"user{uid}", 'hash', f"user{uid}@bench", False, False)
+              for uid in range(1, max(n // 10, VOTERS + 1) + 1)]
+    target = User('0', 'prolific', 'prolific', 'hash', 'prolific@bench', False, False)
+    users = [target] + others
+
+    apis, reviews = [], []
+    def review(reviewer: User, api: API) -> None:
+        rid = str(len(reviews))
+        r = Review(rid, reviewer.get_id(), api.get_id(), 'positive', 'review')
+        for voter in others[len(reviews) % len(others):][:VOTERS]:
+            if voter is not reviewer:
+                r.update_vote(voter.get_id(), 'positive')
+                voter.add_vote(rid, 'positive')
+        reviewer.add_review(rid)
+        api.add_review(rid, 'positive')
+        reviews.append(r)
+
+    for sid in range(n):
+        api = API(str(sid), f"service {sid}", others[sid % len(others)], '', 'a service',
+                  ['API'], [], 'v1', '', 'Free')
+        apis.append(api)
+        review(target, api)
+    for sid in range(n, n + max(n // 100, 1)):
+        api = API(str(sid), f"service {sid}", target, '', 'a service', ['API'], [], 'v1', '', 'Free')
+        apis.append(api)
+        for reviewer in others[:10]:
+            review(reviewer, api)
+
+    data_store.load(users, apis, reviews, [], [], [])
+    return target.get_id()
+
+
+def one_at_a_time(uid: str) -> None:
+    '''
+        The previous user_delete_association, without MongoDB
+    '''
+    user = data_store.get_user_by_id(uid)
+    for rid in user.get_upvotes() + user.get_downvotes():
+        review_remove_vote_wrapper(rid, uid)
+    for rid in list(user.get_reviews()):
+        review_delete_wrapper(rid, '0', True)
+    for service in data_store.get_user_api_objects(uid):
+        for rid in list(service.get_reviews()):
+            review_delete_wrapper(rid, '0', True)
+        data_store.delete_item(service.get_id(), 'api')
+    data_store.delete_item(uid, 'user')
+
+
+def cascade(uid: str) -> None:
+    deletion = Cascade()
+    deletion.add_user(uid)
+    deletion.apply()
+
+
+def main(n: int) -> None:
+    for name, delete in [('one at a time', one_at_a_time), ('cascade', cascade)]:
+        uid = build(n)
+        reviews = data_store.num_reviews()
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        delete(uid)
+        seconds = time.perf_counter() - start
+        gc.enable()
+        print(f"{name:>14} deleted {reviews - data_store.num_reviews()} reviews in {seconds:.3f}s")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REVIEWS)
@@ -0,0 +1,108 @@
+'''
+    Load test for request concurrency over MongoDB I/O.
+
+    Fires n concurrent /service/add requests (each awaiting a Mongo insert)
+    through the ASGI app and reports wall time, throughput, and speedup over
+    running the round trips back to back (n * latency / wall time, so ~1
+    means requests were serialized behind Mongo I/O). Every collection call is delayed
+    by the given round-trip latency, either awaited (the Motor backend) or
+    blocking the event loop (as the previous synchronous pymongo calls did),
+    so the two can be compared against any database.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_concurrency [n] [latency_ms]
+'''
+import os
+os.environ.setdefault("EMAIL", "False")
+
+import asyncio
+import sys
+import time
+import httpx
+from src.backend import database
+from src.backend.app import app
+
+
+DEFAULT_REQUESTS = 200
+DEFAULT_LATENCY_MS = 20
+
+
+class SlowCollection:
+    '''
+        Delays every call on a Motor collection by a simulated round trip
+    '''
+    def __init__(self, collection, latency: float, blocking: bool) -> None:
+        self._collection = collection
+        self._latency = latency
+        self._blocking = blocking
+
+    def __getattr__(self, name: str):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            if self._blocking:
+                time.sleep(self._latency)
+            else:
+                await asyncio.sleep(self._latency)
+            return await method(*args, **kwargs)
+        return call
+
+
+class SlowDatabase:
+    def __init__(self, db, latency: float, blocking: bool) -> None:
+        self._db = db
+        self._latency = latency
+        self._blocking = blocking
+
+    def __getattr__(self, name: str) -> SlowCollection:
+        return SlowCollection(self._db[name], self._latency, self._blocking)
+
+    def __getitem__(self, name: str) -> SlowCollection:
+        return self.__getattr__(name)
+
+
+async def run(n: int) -> float:
+    '''
+        Returns wall seconds taken by n concurrent adds
+    '''
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/testing/clear")
+        creds = {"displayname": "bench", "username": "bench",
+                 "password": "password", "email": "bench@bench"}
+        await client.post("/auth/register", json=creds)
+        response = await client.post("/auth/login", json=creds)
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        async def add(i: int) -> None:
+            response = await client.post("/service/add", headers=headers, json={
+                'name': f"service {i}",
+                'description': 'bench service',
+                'tags': ['API'],
+                'endpoints': [{'link': f"/v1/{i}", 'title_description': 'get', 'main_description': '',
+                               'tab': '', 'parameters': [], 'method': 'GET', 'responses': []}],
+                'version_name': 'v1'
+            })
+            assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(add(i) for i in range(n)))
+        return time.perf_counter() - start
+
+
+def main(n: int, latency_ms: float) -> None:
+    real_db = database.db
+    print(f"{n} concurrent /service/add requests, {latency_ms:g}ms Mongo round trip")
+    print(f"{'backend':>10} {'wall s':>8} {'req/s':>8} {'x serial':>9}")
+    for name, blocking in [('blocking', True), ('async', False)]:
+        database.db = SlowDatabase(real_db, latency_ms / 1000, blocking)
+        try:
+            wall = asyncio.run(run(n))
+        finally:
+            database.db = real_db
+        print(f"{name:>10} {wall:>8.2f} {n / wall:>8.0f} {n * latency_ms / 1000 / wall:>9.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS,
+         float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LATENCY_MS)
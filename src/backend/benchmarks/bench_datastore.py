@@ -0,0 +1,88 @@
+'''
+    Benchmark for Datastore primary-key lookups.
+
+    Populates a fresh Datastore with n users, apis, docs, reviews and replies
+    and times random get_*_by_id calls for each size, so that lookup cost can
+    be compared from 1k up to 1M entities.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_datastore [n ...]
+'''
+import random
+import sys
+import time
+from src.backend.classes.datastore import Datastore
+from src.backend.classes.Document import Document
+from src.backend.classes.Review import Review
+from src.backend.classes.ReviewReply import ReviewReply
+from src.backend.classes.User import User
+
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+LOOKUPS = 100_000
+
+
+class _Item:
+    '''
+        Minimal id-only stand-in used for apis, so the benchmark measures the
+        datastore rather than Service construction
+    '''
+
+    __slots__ = ('_id',)
+
+    def __init__(self, eid: str) -> None:
+        self._id = eid
+
+    def get_id(self) -> str:
+        return self._id
+
+
+def populate(n: int) -> Datastore:
+    '''
+        Builds a datastore with n entities of each kind
+    '''
+    store = Datastore()
+    for i in range(n):
+        eid = str(i)
+        store.add_user(User(eid, eid, eid, '', f"{eid}@bench", False, False))
+        store.add_api(_Item(eid))
+        store.add_docs(Document(str(i + 1), '', 'application/pdf'))
+        store.add_review(Review(eid, eid, eid, 'positive', ''))
+        store.add_reply(ReviewReply(eid, eid, eid, '', eid))
+    return store
+
+
+def time_lookups(store: Datastore, n: int) -> dict[str, float]:
+    '''
+        Returns the mean time (ns) per lookup for each get_*_by_id method
+    '''
+    keys = [str(random.randrange(n)) for _ in range(LOOKUPS)]
+    methods = {
+        'user': store.get_user_by_id,
+        'api': store.get_api_by_id,
+        'doc': store.get_doc_by_id,
+        'review': store.get_review_by_id,
+        'reply': store.get_reply_by_id,
+    }
+
+    results = {}
+    for name, method in methods.items():
+        start = time.perf_counter_ns()
+        for key in keys:
+            method(key)
+        results[name] = (time.perf_counter_ns() - start) / LOOKUPS
+    return results
+
+
+def main(sizes: list[int]) -> None:
+    print(f"{'n':>10} " + " ".join(f"{name:>10}" for name in
+                                   ['user', 'api', 'doc', 'review', 'reply']) + "   (ns/lookup)")
+    for n in sizes:
+        store = populate(n)
+        results = time_lookups(store, n)
+        print(f"{n:>10} " + " ".join(f"{v:>10.1f}" for v in results.values()))
+        del store
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,82 @@
+'''
+    Benchmark for /service/filter at catalogue scale.
+
+    Populates the global datastore with n live services spread over a pool of
+    tags, providers and pay models, then times api_tag_filter for queries of
+    increasing selectivity. Query cost should track the result size rather
+    than the catalogue size.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_filter [n]
+'''
+import json
+import random
+import sys
+import time
+from src.backend.classes.API import API
+from src.backend.classes.datastore import data_store
+from src.backend.classes.Service import ServiceStatus, PAY_MODEL_OPTIONS
+from src.backend.classes.User import User
+from src.backend.server.service import api_tag_filter
+
+
+DEFAULT_SIZE = 100_000
+NUM_TAGS = 200
+NUM_PROVIDERS = 1_000
+REPEATS = 20
+
+
+def populate(n: int) -> list[User]:
+    '''
+        Fills the global datastore with n live services
+    '''
+    data_store.clear_datastore()
+    rng = random.Random(0)
+    owners = [User(str(i), f"user{i}", f"user{i}", '', f"user{i}@bench", False, False)
+              for i in range(NUM_PROVIDERS)]
+    for owner in owners:
+        data_store.add_user(owner)
+
+    for i in range(n):
+        tags = rng.sample([f"tag{t}" for t in range(NUM_TAGS)], 3)
+        api = API(str(i), f"service {i}", rng.choice(owners), '', 'bench service',
+                  tags, [], 'v1', '', rng.choice(PAY_MODEL_OPTIONS))
+        api.update_status(ServiceStatus.LIVE, '')
+        data_store.add_api(api)
+    return owners
+
+
+def time_query(**query) -> tuple[int, float]:
+    '''
+        Returns (result size, mean ms) for a filter query
+    '''
+    params = {'tags': None, 'providers': None, 'pay_models': None}
+    params.update(query)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = api_tag_filter(params['tags'], params['providers'], params['pay_models'],
+                                True, False)
+    return len(json.loads(result.body)), (time.perf_counter() - start) * 1000 / REPEATS
+
+
+def main(n: int) -> None:
+    start = time.perf_counter()
+    populate(n)
+    print(f"populated {n} services in {time.perf_counter() - start:.1f}s")
+
+    queries = {
+        'one provider': {'providers': ['7']},
+        'one tag + provider': {'tags': ['tag3'], 'providers': ['7', '8', '9']},
+        'one tag': {'tags': ['tag3']},
+        'one tag + pay model': {'tags': ['tag3'], 'pay_models': ['Premium']},
+        'five tags': {'tags': [f"tag{t}" for t in range(5)]},
+        'twenty tags': {'tags': [f"tag{t}" for t in range(20)]},
+    }
+    print(f"{'query':>22} {'results':>8} {'ms':>8}")
+    for name, query in queries.items():
+        size, ms = time_query(**query)
+        print(f"{name:>22} {size:>8} {ms:>8.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
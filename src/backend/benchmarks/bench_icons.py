@@ -0,0 +1,56 @@
+'''
+    Benchmark for icon variants.
+
+    Writes a noisy n x n pixel photo (as JPEG) and a screenshot-like image
+    (as PNG) to a temporary directory, then reports the seconds taken to
+    render every variant of each on the thumbnail pool, and the bytes of
+    the original against each variant - the bytes a listing downloads per
+    icon, with and without size=.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_icons [edge]
+'''
+import os
+import sys
+import tempfile
+import time
+from PIL import Image, ImageDraw
+from src.backend.classes.Document import Document
+from src.backend.server import documents, thumbnails
+from src.backend.server.documents import ICON_SIZES, VARIANT_EXTENSIONS, variant_path
+from src.backend.server.thumbnails import schedule_variants
+
+
+DEFAULT_EDGE = 2_048
+
+
+def images(edge: int) -> dict[str, Image.Image]:
+    photo = Image.effect_noise((edge, edge), 64).convert('RGB')
+    screenshot = Image.new('RGBA', (edge, edge), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(screenshot)
+    for i in range(0, edge // 2, edge // 32):
+        draw.rectangle((i, i, edge - i, edge - i), outline=(i % 256, 80, 160, 255), width=4)
+    return {'photo.jpg': photo, 'screenshot.png': screenshot}
+
+
+def main(edge: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        documents.VARIANT_PATH = thumbnails.VARIANT_PATH = directory
+        for i, (name, image) in enumerate(images(edge).items()):
+            path = os.path.join(directory, name)
+            image.save(path, **({'quality': 90} if name.endswith('.jpg') else {}))
+            doc = Document(str(i), path, 'image/png', f"bench{i}")
+
+            start = time.perf_counter()
+            schedule_variants(doc).result()
+            seconds = time.perf_counter() - start
+
+            print(f"{name:>15} {os.path.getsize(path):>10,} bytes, variants rendered in {seconds:.3f}s")
+            for size in ICON_SIZES:
+                sizes = ', '.join(f"{os.path.getsize(variant_path(doc.get_hash(), size, content_type)):,} {ext[1:]}"
+                                  for content_type, ext in VARIANT_EXTENSIONS.items())
+                print(f"{size:>15}px {sizes}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_EDGE)
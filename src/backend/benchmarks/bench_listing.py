@@ -0,0 +1,84 @@
+'''
+    Benchmark for serializing service listings at catalogue scale.
+
+    Populates the global datastore with n live services, then reports the
+    throughput (services/s) of a full /service/filter listing and of
+    Service.to_json, cold (every service just modified, so each cache entry
+    is rebuilt) and warm (caches reused). The cold listing figure includes
+    the orjson encode that the warm path skips; FastAPI's own encoding of the
+    plain summary dicts is shown for reference.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_listing [n]
+'''
+import json
+import sys
+import time
+from fastapi.encoders import jsonable_encoder
+from src.backend.classes.API import API
+from src.backend.classes.datastore import data_store
+from src.backend.classes.Service import ServiceStatus
+from src.backend.classes.User import User
+from src.backend.server.service import api_tag_filter
+
+
+DEFAULT_SIZE = 50_000
+REPEATS = 5
+
+
+def populate(n: int) -> None:
+    '''
+        Fills the global datastore with n live services
+    '''
+    data_store.clear_datastore()
+    owner = User('0', 'owner', 'owner', '', 'owner@bench', False, False)
+    data_store.add_user(owner)
+    for i in range(n):
+        endpoints = [{'title_description': f"endpoint {j}", 'link': f"/v1/{i}/{j}"} for j in range(3)]
+        api = API(str(i), f"service {i}", owner, '', 'bench service ' * 10,
+                  ['API', f"tag{i % 100}"], endpoints, 'v1', '', 'Free')
+        api.update_status(ServiceStatus.LIVE, '')
+        data_store.add_api(api)
+
+
+def invalidate() -> None:
+    '''
+        Marks every service as modified, so its caches are rebuilt
+    '''
+    for api in data_store.get_apis():
+        api._touch()
+
+
+def throughput(n: int, run, cold: bool) -> float:
+    '''
+        Returns services serialized per second by run()
+    '''
+    total = 0.0
+    for _ in range(REPEATS):
+        if cold:
+            invalidate()
+        start = time.perf_counter()
+        run()
+        total += time.perf_counter() - start
+    return n * REPEATS / total
+
+
+def main(n: int) -> None:
+    start = time.perf_counter()
+    populate(n)
+    print(f"populated {n} services in {time.perf_counter() - start:.1f}s")
+
+    apis = data_store.get_apis()
+    listing = lambda: api_tag_filter(None, None, None, True, False).body
+    fastapi_listing = lambda: json.dumps(jsonable_encoder([api.to_summary_json() for api in apis])).encode()
+    details = lambda: [api.to_json() for api in apis]
+
+    print(f"{'':>24} {'cold/s':>12} {'warm/s':>12}")
+    for name, run in [('listing (bytes)', listing),
+                      ('listing (jsonable)', fastapi_listing),
+                      ('to_json', details)]:
+        print(f"{name:>24} {throughput(n, run, True):>12,.0f} {throughput(n, run, False):>12,.0f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
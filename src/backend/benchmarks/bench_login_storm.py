@@ -0,0 +1,107 @@
+'''
+    Load test for read latency during a login storm.
+
+    Fires n concurrent /auth/login requests through the ASGI app while a
+    reader polls /tags/get/ranked on a fixed schedule, and reports read
+    latency percentiles. Latency is measured from when each read was due,
+    so reads delayed by a blocked event loop count their wait.
+    bcrypt runs either on the bounded hashing pool or inline on the event
+    loop (as every login did before the pool), so the two can be compared.
+    Logins rejected with a 429 (pool saturated) are counted separately.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_login_storm [n]
+'''
+import os
+os.environ.setdefault("EMAIL", "False")
+
+import asyncio
+import sys
+import time
+from concurrent.futures import Future
+import httpx
+from src.backend.app import app
+from src.backend.classes.Manager import manager
+
+
+DEFAULT_LOGINS = 16
+READ_INTERVAL = 0.005
+
+
+class InlineExecutor:
+    '''
+        Executor running each call immediately on the calling thread
+    '''
+    def submit(self, fn, *args) -> Future:
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def percentile(samples: list[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+
+async def run(n: int) -> tuple[list[float], int, float]:
+    '''
+        Returns read latencies (s), logins rejected and storm duration (s)
+    '''
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/testing/clear")
+        creds = {"displayname": "bench", "username": "bench",
+                 "password": "password", "email": "bench@bench"}
+        await client.post("/auth/register", json=creds)
+
+        done = asyncio.Event()
+        latencies = []
+
+        async def read(due: float) -> None:
+            response = await client.get("/tags/get/ranked", params={'num': 10})
+            latencies.append(time.perf_counter() - due)
+            assert response.status_code == 200, response.text
+
+        async def reader() -> None:
+            reads = []
+            due = time.perf_counter()
+            while not done.is_set():
+                # Issue every read that fell due, incl. any missed while blocked
+                while due <= time.perf_counter():
+                    reads.append(asyncio.create_task(read(due)))
+                    due += READ_INTERVAL
+                await asyncio.sleep(due - time.perf_counter())
+            await asyncio.gather(*reads)
+
+        async def login() -> int:
+            response = await client.post("/auth/login", json=creds)
+            assert response.status_code in [200, 429], response.text
+            return response.status_code
+
+        polling = asyncio.create_task(reader())
+        await asyncio.sleep(0.1)
+        start = time.perf_counter()
+        codes = await asyncio.gather(*(login() for _ in range(n)))
+        storm = time.perf_counter() - start
+        done.set()
+        await polling
+        return latencies, codes.count(429), storm
+
+
+def main(n: int) -> None:
+    pool = manager._hash_pool
+    print(f"{n} concurrent logins, {manager.get_hash_stats()['workers']} hashing workers")
+    print(f"{'hashing':>8} {'reads':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'429s':>5} {'storm s':>8}")
+    for name, executor in [('inline', InlineExecutor()), ('pool', pool)]:
+        manager._hash_pool = executor
+        try:
+            latencies, rejected, storm = asyncio.run(run(n))
+        finally:
+            manager._hash_pool = pool
+        print(f"{name:>8} {len(latencies):>6} {percentile(latencies, 0.5) * 1000:>8.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.1f} {max(latencies) * 1000:>8.1f} "
+              f"{rejected:>5} {storm:>8.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LOGINS)
@@ -0,0 +1,75 @@
+'''
+    Benchmark for the admin approval queue.
+
+    Populates the global datastore with n live services, of which one in a
+    thousand is awaiting approval of a new version, then times
+    admin_get_pending_services against the previous scan over every service
+    and version. The queue's cost should track the number of pending
+    services rather than the catalogue size.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_pending [n]
+'''
+import sys
+import time
+from src.backend.classes.API import API
+from src.backend.classes.datastore import data_store
+from src.backend.classes.Service import ServiceStatus, PENDING_OPTIONS
+from src.backend.classes.User import User
+from src.backend.server.admin import admin_get_pending_services
+
+
+DEFAULT_SIZE = 100_000
+PENDING_EVERY = 1_000
+REPEATS = 20
+
+
+def populate(n: int) -> None:
+    '''
+        Fills the global datastore with n live services, a few pending
+    '''
+    data_store.clear_datastore()
+    owner = User('0', 'owner', 'owner', '', 'owner@bench', False, False)
+    data_store.add_user(owner)
+    for i in range(n):
+        api = API(str(i), f"service {i}", owner, '', 'bench service', ['API'], [], 'v1', '', 'Free')
+        api.update_status(ServiceStatus.LIVE, '')
+        api.update_newly_created()
+        api.get_latest_version().update_status(ServiceStatus.LIVE, '')
+        data_store.add_api(api)
+        if i % PENDING_EVERY == 0:
+            api.add_service_version('v2', [], '')
+
+
+def scan() -> int:
+    '''
+        The previous admin_get_pending_services walk, counting what it finds
+    '''
+    found = 0
+    for service in data_store.get_apis():
+        if service.get_status() in PENDING_OPTIONS:
+            found += 1
+        for version in service.get_all_versions():
+            if version.get_status() in PENDING_OPTIONS:
+                found += 1
+    return found
+
+
+def timed(call) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        call()
+    return (time.perf_counter() - start) * 1000 / REPEATS
+
+
+def main(n: int) -> None:
+    populate(n)
+    pending = len(admin_get_pending_services()['version_updates'])
+    assert pending == scan()
+    print(f"{n} services, {pending} pending")
+    print(f"{'full scan':>14} {timed(scan):9.3f} ms")
+    print(f"{'status index':>14} {timed(admin_get_pending_services):9.3f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
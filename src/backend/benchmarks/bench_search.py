@@ -0,0 +1,104 @@
+'''
+    Benchmark for /service/search at catalogue scale.
+
+    Populates the global datastore with n services whose names, descriptions,
+    tags and endpoint titles are drawn from a synthetic vocabulary, then
+    reports p50/p99 latency of the search index for whole-word, prefix,
+    infix and multi-word queries, plus the full api_name_search wrapper.
+    One and two character queries, and prefixes shared by many common
+    words and tags, exercise the prefix and infix posting budgets.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_search [n]
+'''
+import random
+import string
+import sys
+import time
+from src.backend.classes.API import API
+from src.backend.classes.datastore import data_store
+from src.backend.classes.Service import ServiceStatus
+from src.backend.classes.User import User
+from src.backend.server.service import api_name_search
+
+
+DEFAULT_SIZE = 100_000
+VOCAB_SIZE = 30_000
+QUERIES = 500
+
+
+def make_vocab(rng: random.Random) -> list[str]:
+    '''
+        Returns a list of distinct pseudo-words
+    '''
+    vocab = set()
+    while len(vocab) < VOCAB_SIZE:
+        vocab.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))))
+    return sorted(vocab)
+
+
+def populate(n: int, rng: random.Random, vocab: list[str]) -> None:
+    '''
+        Fills the global datastore with n live services
+    '''
+    data_store.clear_datastore()
+    owner = User('0', 'owner', 'owner', '', 'owner@bench', False, False)
+    data_store.add_user(owner)
+    # Zipf-like skew so some words are common and most are rare
+    cum_weights, total = [], 0.0
+    for rank in range(len(vocab)):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+    for i in range(n):
+        words = rng.choices(vocab, cum_weights=cum_weights, k=20)
+        endpoints = [{'title_description': ' '.join(words[14:17])},
+                     {'title_description': ' '.join(words[17:20])}]
+        api = API(str(i), ' '.join(words[:2]), owner, '', ' '.join(words[2:14]),
+                  [f"tag{rng.randrange(200)}" for _ in range(3)], endpoints, 'v1', '', 'Free')
+        api.update_status(ServiceStatus.LIVE, '')
+        data_store.add_api(api)
+
+
+def percentiles(samples: list[float]) -> tuple[float, float]:
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main(n: int) -> None:
+    rng = random.Random(0)
+    vocab = make_vocab(rng)
+    start = time.perf_counter()
+    populate(n, rng, vocab)
+    print(f"indexed {n} services in {time.perf_counter() - start:.1f}s")
+
+    query_sets = {
+        'word': [rng.choice(vocab) for _ in range(QUERIES)],
+        'prefix (4)': [rng.choice(vocab)[:4] for _ in range(QUERIES)],
+        'infix (3)': [rng.choice(vocab)[1:4] for _ in range(QUERIES)],
+        'two words': [f"{rng.choice(vocab[:500])} {rng.choice(vocab)}" for _ in range(QUERIES)],
+        'one char': [rng.choice(string.ascii_lowercase) for _ in range(QUERIES)],
+        'two chars': [''.join(rng.choices(string.ascii_lowercase, k=2)) for _ in range(QUERIES)],
+        'common (3)': [rng.choice(vocab[:100])[:3] for _ in range(QUERIES)],
+        'tag prefix': [rng.choice(['ta', 'tag', f"tag{rng.randrange(1, 20)}"]) for _ in range(QUERIES)],
+    }
+
+    print(f"{'query':>12} {'hits':>8} {'index p50':>10} {'index p99':>10} {'wrapper p99':>12}   (ms)")
+    for name, queries in query_sets.items():
+        index_times, wrapper_times, hits = [], [], 0
+        for query in queries:
+            start = time.perf_counter()
+            result = data_store.search_apis(query)
+            index_times.append((time.perf_counter() - start) * 1000)
+            hits += len(result)
+
+            start = time.perf_counter()
+            api_name_search(query, True)
+            wrapper_times.append((time.perf_counter() - start) * 1000)
+
+        p50, p99 = percentiles(index_times)
+        print(f"{name:>12} {hits // QUERIES:>8} {p50:>10.2f} {p99:>10.2f} "
+              f"{percentiles(wrapper_times)[1]:>12.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
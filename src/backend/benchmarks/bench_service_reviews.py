@@ -0,0 +1,92 @@
+'''
+    Benchmark for listing the reviews of a popular service.
+
+    Loads a service with n reviews (with a few votes each) written by n / 10
+    users into the global
+    datastore, then reports the seconds taken to list them through
+    service_get_reviews_wrapper (for each filter), alongside resolving the
+    same reviews and reviewers one id at a time, as the wrapper used to.
+    The first listing also formats each review's timestamp, which later
+    listings reuse, so it is reported separately. The first page of the
+    best/worst reviews is also timed, which reads only the page from the
+    service's vote ranking.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_service_reviews [reviews]
+'''
+import sys
+import time
+from src.backend.classes.API import API
+from src.backend.classes.Review import Review
+from src.backend.classes.User import User
+from src.backend.classes.datastore import data_store
+from src.backend.server.pagination import Page
+from src.backend.server.service import service_get_reviews_wrapper
+
+
+DEFAULT_REVIEWS = 50_000
+REPEATS = 5
+PAGE_SIZE = 50
+
+
+def build(n: int) -> API:
+    users = [User(str(uid), f"user {uid}", f"user{uid}", 'hash', f"user{uid}@bench", False, False)
+             for uid in range(max(n // 10, 1))]
+    api = API('0', 'popular', users[0], '', 'a popular service', ['API'], [], 'v1', '', 'Free')
+    reviews = []
+    for rid in range(n):
+        reviewer = users[rid % len(users)]
+        review = Review(str(rid), reviewer.get_id(), '0', 'positive' if rid % 3 else 'negative', 'review')
+        for voter in range(rid % 7):
+            review.update_vote(str(voter), 'positive' if (rid + voter) % 3 else 'negative')
+        reviewer.add_review(str(rid))
+        api.add_review(str(rid), review.get_rating())
+        reviews.append(review)
+
+    data_store.load(users, [api], reviews, [], [], [])
+    return api
+
+
+def per_id(sid: str) -> list:
+    '''
+        Resolves each review and reviewer with its own lookup
+    '''
+    output = []
+    for rid in data_store.get_api_by_id(sid).get_reviews():
+        review = data_store.get_review_by_id(rid)
+        r = review.to_json()
+        r['reviewerName'] = data_store.get_user_by_id(review.get_owner()).get_displayname()
+        output.append(r)
+    return output
+
+
+def best(fn) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(n: int) -> None:
+    api = build(n)
+    sid = api.get_id()
+    start = time.perf_counter()
+    assert len(service_get_reviews_wrapper(sid)) == n
+    print(f"first listing of {n} reviews {time.perf_counter() - start:.3f}s")
+
+    print(f"listing {n} reviews (best of {REPEATS})")
+    print(f"{'per id':>10} {best(lambda: per_id(sid)):>8.3f}s")
+    for name in ['', 'best', 'worst']:
+        seconds = best(lambda: service_get_reviews_wrapper(sid, name))
+        print(f"{name or 'batched':>10} {seconds:>8.3f}s")
+
+    print(f"first page of {PAGE_SIZE} (best of {REPEATS})")
+    for name in ['best', 'worst']:
+        seconds = best(lambda: service_get_reviews_wrapper(sid, name, page=Page(PAGE_SIZE, None)))
+        print(f"{name:>10} {seconds * 1000:>8.3f}ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REVIEWS)
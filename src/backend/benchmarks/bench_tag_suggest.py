@@ -0,0 +1,72 @@
+'''
+    Benchmark for local tag suggestions.
+
+    Loads n live services into a datastore, each described by words drawn
+    from a vocabulary with a few topic words shared by services carrying
+    the same tags, then reports the latency of suggesting tags for
+    descriptions of unseen services.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_tag_suggest [services] [queries]
+'''
+import random
+import sys
+import time
+from src.backend.classes.API import API
+from src.backend.classes.Service import ServiceStatus
+from src.backend.classes.User import User
+from src.backend.classes.datastore import Datastore
+from src.backend.server.tags import n_tags_max
+
+
+DEFAULT_SERVICES = 100_000
+DEFAULT_QUERIES = 1_000
+VOCABULARY = 20_000
+TOPICS = 500
+TOPIC_WORDS = 8
+DESCRIPTION_WORDS = 30
+
+
+def describe(rng: random.Random, topic: int) -> str:
+    words = [f"topic{topic}word{rng.randrange(TOPIC_WORDS)}" for _ in range(5)]
+    words += [f"word{rng.randrange(VOCABULARY)}" for _ in range(DESCRIPTION_WORDS - 5)]
+    return ' '.join(words)
+
+
+def build(n: int, rng: random.Random) -> Datastore:
+    owner = User('0', 'bench', 'bench', 'hash', 'bench@bench', False, False)
+    apis = []
+    for sid in range(n):
+        topic = rng.randrange(TOPICS)
+        tags = [f"Topic {topic}", f"Area {topic % 50}"]
+        api = API(str(sid), f"service {sid}", owner, '', describe(rng, topic), tags, [], 'v1', '', 'Free')
+        api.update_status(ServiceStatus.LIVE, '')
+        apis.append(api)
+
+    store = Datastore()
+    store.load([owner], apis, [], [], [], [])
+    return store
+
+
+def main(n: int, m: int) -> None:
+    rng = random.Random(0)
+    start = time.perf_counter()
+    store = build(n, rng)
+    print(f"loaded {n} live services in {time.perf_counter() - start:.1f}s")
+
+    queries = [describe(rng, rng.randrange(TOPICS)) for _ in range(m)]
+    latencies = []
+    for query in queries:
+        began = time.perf_counter()
+        store.suggest_tags(query, n_tags_max)
+        latencies.append(time.perf_counter() - began)
+
+    latencies.sort()
+    print(f"{m} suggestions: p50 {latencies[m // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[min(int(m * 0.99), m - 1)] * 1000:.2f} ms, "
+          f"max {latencies[-1] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SERVICES,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_QUERIES)
@@ -0,0 +1,75 @@
+'''
+    Benchmark for review vote bookkeeping.
+
+    Loads a service and n voters into the global datastore, then has every
+    voter vote on one review, and one voter vote on n reviews, through
+    review_vote_wrapper, before removing every vote again. Reports the mean
+    cost of a vote over each tenth of the votes, which stays flat when
+    checking and removing a vote does not depend on how many were cast.
+    As with timeit, garbage collection is paused while timing.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_votes [votes]
+'''
+import gc
+import sys
+import time
+from src.backend.classes.API import API
+from src.backend.classes.Review import Review
+from src.backend.classes.User import User
+from src.backend.classes.datastore import data_store
+from src.backend.server.review import review_vote_wrapper, review_remove_vote_wrapper
+
+
+DEFAULT_VOTES = 100_000
+CHUNKS = 10
+
+
+def build(n: int) -> None:
+    users = [User(str(uid), f"user {uid}", f"user{uid}", 'hash', f"user{uid}@bench", False, False)
+             for uid in range(n + 1)]
+    api = API('0', 'popular', users[0], '', 'a popular service', ['API'], [], 'v1', '', 'Free')
+    reviews = [Review(str(rid), users[0].get_id(), '0', 'positive', 'review') for rid in range(n)]
+    for review in reviews:
+        api.add_review(review.get_id(), review.get_rating())
+    data_store.load(users, [api], reviews, [], [], [])
+
+
+def timed(name: str, calls: list) -> None:
+    '''
+        Runs the calls, printing the mean microseconds per call of each chunk
+    '''
+    size = max(len(calls) // CHUNKS, 1)
+    means = []
+    gc.collect()
+    gc.disable()
+    for start in range(0, len(calls), size):
+        began = time.perf_counter()
+        for call in calls[start:start + size]:
+            call()
+        means.append((time.perf_counter() - began) / size * 1e6)
+    gc.enable()
+    print(f"{name:>28} " + ' '.join(f"{mean:6.2f}" for mean in means) + " us/vote")
+
+
+def remove(rid: str, uid: str) -> None:
+    review_remove_vote_wrapper(rid, uid)
+    data_store.get_user_by_id(uid).remove_vote(rid)
+
+
+def main(n: int) -> None:
+    build(n)
+    voters = [str(uid) for uid in range(1, n + 1)]
+    rids = [str(rid) for rid in range(n)]
+
+    print(f"{n} votes, mean cost per tenth")
+    timed("voters on one review", [lambda uid=uid: review_vote_wrapper('0', uid, 'positive')
+                                   for uid in voters])
+    timed("removing them", [lambda uid=uid: remove('0', uid) for uid in voters])
+    timed("one voter on every review", [lambda rid=rid: review_vote_wrapper(rid, '1', 'negative')
+                                        for rid in rids])
+    timed("removing them", [lambda rid=rid: remove(rid, '1') for rid in rids])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_VOTES)
@@ -0,0 +1,163 @@
+'''
+    Benchmark for warm starting the datastore from MongoDB.
+
+    Seeds a scratch database with n services (each owned by one of n / 10
+    users) and m reviews spread across them, then reports the seconds taken
+    to stream each collection into objects and rebuild the datastore's
+    indexes. Uses the configured MongoDB (see MONGO_ENV) unless --memory is
+    given, in which case documents are served from in-process lists, to
+    measure object construction and indexing alone.
+
+    Run from the repo root with:
+        python -m src.backend.benchmarks.bench_warmstart [services] [reviews] [--memory]
+'''
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+from src.backend import database
+from src.backend.classes.datastore import Datastore
+
+
+DEFAULT_SERVICES = 100_000
+DEFAULT_REVIEWS = 1_000_000
+SEED_BATCH = 10_000
+BENCH_DB = 'bench_warmstart'
+
+
+def user_doc(uid: int) -> dict:
+    return {
+        'id': str(uid), 'displayname': f"user {uid}", 'username': f"user{uid}",
+        'email': f"user{uid}@bench", 'icon_url': None, 'is_admin': False,
+        'is_super': False, 'is_verified': True, 'reviews': [], 'replies': [],
+        'icon': '0', 'upvotes': [], 'downvotes': [], 'password': 'hash'
+    }
+
+def service_doc(sid: int, owner: dict, reviews: list[str]) -> dict:
+    return {
+        'id': str(sid), 'name': f"service {sid}",
+        'owner': {'id': owner['id'], 'name': owner['username'],
+                  'displayName': owner['displayname'], 'email': owner['email']},
+        'icon_url': '', 'description': 'bench service ' * 10,
+        'tags': ['API', f"tag{sid % 100}"], 'users': [], 'reviews': reviews,
+        'upvotes': len(reviews), 'type': 'api', 'icon': '0', 'downvotes': 0,
+        'status': 'LIVE', 'status_reason': '', 'newly_created': False, 'pay_model': 'Free',
+        'versions': [{
+            'version_name': 'v1',
+            'endpoints': [{'link': f"/v1/{sid}/{i}", 'title_description': f"endpoint {i}"}
+                          for i in range(3)],
+            'version_description': '', 'docs': [], 'status': 'LIVE',
+            'status_reason': '', 'newly_created': False
+        }]
+    }
+
+def review_doc(rid: int, reviewer: str, sid: int, now: datetime) -> dict:
+    return {
+        'rid': str(rid), 'reviewer': reviewer, 'service': str(sid), 'comment': 'bench review',
+        'timestamp': now, 'edited': False, 'e_timestamp': None, 'type': 'positive',
+        'upvote_ids': [], 'downvote_ids': [], 'reply': None
+    }
+
+
+class MemoryCursor:
+    def __init__(self, documents: list) -> None:
+        self._documents = documents
+        self._pos = 0
+
+    async def to_list(self, length: int) -> list:
+        batch = self._documents[self._pos:self._pos + length]
+        self._pos += length
+        return batch
+
+
+class MemoryCollection:
+    '''
+        Serves documents from a list, supporting what seeding and loading use
+    '''
+    def __init__(self) -> None:
+        self._documents = []
+
+    async def insert_many(self, documents: list) -> None:
+        self._documents.extend(documents)
+
+    async def delete_many(self, query: dict) -> None:
+        self._documents = []
+
+    def find(self, query: dict, projection: dict, batch_size: int) -> MemoryCursor:
+        return MemoryCursor(self._documents)
+
+
+class MemoryDatabase(dict):
+    def __missing__(self, name: str) -> MemoryCollection:
+        collection = self[name] = MemoryCollection()
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        return self[name]
+
+
+async def insert_batched(collection, documents) -> None:
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == SEED_BATCH:
+            await collection.insert_many(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch)
+
+
+async def seed(db, n: int, m: int) -> None:
+    '''
+        Fills db with n services, m reviews and the users owning/writing them
+    '''
+    for collection in ['users', 'services', 'reviews', 'replies', 'tags', 'docs']:
+        await db[collection].delete_many({})
+
+    users = [user_doc(uid) for uid in range(max(n // 10, 1))]
+    now = datetime.now(timezone.utc)
+    service_reviews = [[] for _ in range(n)]
+    reviews = []
+    for rid in range(m):
+        sid = rid % n
+        reviewer = users[rid % len(users)]
+        service_reviews[sid].append(str(rid))
+        reviewer['reviews'].append(str(rid))
+        reviews.append(review_doc(rid, reviewer['id'], sid, now))
+
+    await insert_batched(db.users, users)
+    await insert_batched(db.services, (service_doc(sid, users[sid % len(users)], service_reviews[sid])
+                                       for sid in range(n)))
+    await insert_batched(db.reviews, reviews)
+
+
+async def run(db, n: int, m: int) -> None:
+    start = time.perf_counter()
+    await seed(db, n, m)
+    print(f"seeded {n} services and {m} reviews in {time.perf_counter() - start:.1f}s")
+
+    store = Datastore()
+    timings = await database.db_load_datastore(store, db)
+    assert store.num_apis() == n and store.num_reviews() == m
+
+    for name, seconds in timings.items():
+        print(f"{name:>10} {seconds:>8.2f}s")
+    print(f"{n / timings['services']:,.0f} services/s, {m / timings['reviews']:,.0f} reviews/s")
+
+
+def main(n: int, m: int, memory: bool) -> None:
+    if memory:
+        asyncio.run(run(MemoryDatabase(), n, m))
+        return
+
+    try:
+        asyncio.run(run(database.client[BENCH_DB], n, m))
+    finally:
+        asyncio.run(database.client.drop_database(BENCH_DB))
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if arg != '--memory']
+    main(int(args[0]) if len(args) > 0 else DEFAULT_SERVICES,
+         int(args[1]) if len(args) > 1 else DEFAULT_REVIEWS,
+         '--memory' in sys.argv)
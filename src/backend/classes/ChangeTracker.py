@@ -0,0 +1,82 @@
+from typing import *
+
+T = TypeVar("T")
+K = TypeVar("K")
+
+
+class ChangeTracker:
+
+    '''
+        Records which top-level fields of an object's stored document have
+        changed since it was last persisted, so only those are written
+
+        Stores:
+            - sets:     Fields to overwrite with their current value
+            - pushes:   field -> values appended to that list field
+            - pulls:    field -> values removed from that list field
+    '''
+
+    def __init__(self) -> None:
+        self._sets: Set[str] = set()
+        self._pushes: Dict[str, List[T]] = {}
+        self._pulls: Dict[str, List[T]] = {}
+
+    def set(self, *fields: str) -> None:
+        '''
+            Marks fields as changed
+        '''
+        self._sets.update(fields)
+
+    def push(self, field: str, value: T) -> None:
+        '''
+            Records a value appended to a list field
+        '''
+        self._pushes.setdefault(field, []).append(value)
+
+    def pull(self, field: str, value: T) -> None:
+        '''
+            Records a value removed from a list field
+        '''
+        self._pulls.setdefault(field, []).append(value)
+
+    def clear(self) -> None:
+        '''
+            Forgets all recorded changes
+        '''
+        self._sets.clear()
+        self._pushes.clear()
+        self._pulls.clear()
+
+    def pop_update(self, document: dict[T, K], sets: Optional[dict[T, K]] = None) -> dict[T, K]:
+        '''
+            Returns the MongoDB update document ($set/$push/$pull) bringing
+            the stored copy up to date with document, the object's current
+            json, and clears the recorded changes. Extra paths to $set may be
+            given. A list field both pushed to and pulled from (or pulled
+            from while still holding a pulled value) is $set in full instead,
+            as Mongo cannot apply both to one path. Returns {} if unchanged
+        '''
+        sets = dict(sets or {})
+        for field in self._sets:
+            sets[field] = document[field]
+
+        for field in self._pushes.keys() & self._pulls.keys():
+            sets[field] = document[field]
+        for field, values in self._pulls.items():
+            if field not in sets and any(value in document[field] for value in values):
+                sets[field] = document[field]
+
+        update = {}
+        if sets:
+            update['$set'] = sets
+        pushes = {field: {'$each': values} for field, values in self._pushes.items()
+                  if field not in sets}
+        if pushes:
+            update['$push'] = pushes
+        pulls = {field: {'$in': values} for field, values in self._pulls.items()
+                 if field not in sets}
+        if pulls:
+            update['$pull'] = pulls
+
+        self.clear()
+        return update
@@ -1,6 +1,8 @@
-from datetime import datetime
+from datetime import datetime, timezone
 import pytz
 
+TIMEZONE = pytz.timezone('Australia/Sydney')
+
 class Comment:
 
     '''
@@ -16,6 +18,8 @@ class Comment:
             - timestamp:        Timestamp of when comment was created
             - edited:           Bool indicating whether comment has been edited
             - e_timestamp:      Timestamp of last edit made, if any
+            - formatted:        Timestamps already formatted for display, as
+                                listing many comments is dominated by formatting
 
     '''
 
@@ -26,10 +30,11 @@ class Comment:
         self._content = body
 
         # Internal timestamp
-        self._tz = pytz.timezone('Australia/Sydney')
+        self._tz = TIMEZONE
         self._timestamp = datetime.now(self._tz)
         self._edited = False
         self._e_timestamp = None
+        self._formatted = {}
 
     #############################
     #   Update methods
@@ -41,6 +46,7 @@ class Comment:
         self._content = body
         self._edited = True
         self._e_timestamp = datetime.now(self._tz)
+        self._formatted.pop('e_timestamp', None)
 
     #############################
     #   Get methods
@@ -73,7 +79,10 @@ class Comment:
         '''
             Returns timestamp of comment when created
         '''
-        return self._timestamp.strftime("%-I:%M%p AEST on %-d %b %Y")
+        text = self._formatted.get('timestamp')
+        if text is None:
+            text = self._formatted['timestamp'] = format_timestamp(self._timestamp)
+        return text
     
     def is_edited(self) -> bool:
         '''
@@ -87,4 +96,74 @@ class Comment:
         '''
         if self._e_timestamp is None:
             return None
-        return self._e_timestamp.strftime("%-I:%M%p AEST on %-d %b %Y")
+        text = self._formatted.get('e_timestamp')
+        if text is None:
+            text = self._formatted['e_timestamp'] = format_timestamp(self._e_timestamp)
+        return text
+
+    #############################
+    #   Storage methods
+    #############################
+    def _to_storage_json(self) -> dict:
+        '''
+            Returns the fields shared by all comments as stored in MongoDB,
+            with raw timestamps
+        '''
+        return {
+            'rid': self._id,
+            'reviewer': self._owner,
+            'service': self._service,
+            'comment': self._content,
+            'timestamp': self._timestamp,
+            'edited': self._edited,
+            'e_timestamp': self._e_timestamp
+        }
+
+    def pop_changes(self) -> dict:
+        '''
+            Returns the MongoDB update document writing the comment in full
+            (see to_storage_json) - comments are small, so their changes
+            aren't tracked
+        '''
+        return {'$set': self.to_storage_json()}
+
+    def mark_all_changed(self) -> None:
+        '''
+            Comments are always written in full (see pop_changes)
+        '''
+
+    @classmethod
+    def _from_storage_json(cls, data: dict) -> 'Comment':
+        '''
+            Rebuilds the fields shared by all comments from a stored
+            document, bypassing the constructor (which would timestamp the
+            comment as created now). Timestamps are kept as stored and only
+            converted to local time when formatted
+        '''
+        comment = cls.__new__(cls)
+        comment._id = data['rid']
+        comment._owner = data['reviewer']
+        comment._service = data['service']
+        comment._content = data['comment']
+        comment._tz = TIMEZONE
+        comment._timestamp = data['timestamp']
+        comment._edited = data['edited']
+        comment._e_timestamp = data['e_timestamp']
+        comment._formatted = {}
+        return comment
+
+
+def localise(timestamp: datetime) -> datetime:
+    '''
+        Converts a timestamp into the platform's timezone. MongoDB returns
+        naive UTC datetimes
+    '''
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(TIMEZONE)
+
+def format_timestamp(timestamp: datetime) -> str:
+    '''
+        Formats a timestamp for display, in the platform's timezone
+    '''
+    return localise(timestamp).strftime("%-I:%M%p AEST on %-d %b %Y")
@@ -1,13 +1,19 @@
+from typing import Optional
+
 class Document:
 
     '''
         Document class representing a document uploaded to the platform
+
+        Uploaded documents are stored by content - path is named after the
+        SHA-256 digest of the file, which identical uploads share
     '''
 
-    def __init__(self, id: str, path: str, type: str) -> None:
+    def __init__(self, id: str, path: str, type: str, sha256: Optional[str] = None) -> None:
         self._id = id
         self._path = path
         self._type = type
+        self._sha256 = sha256
     
     ################################
     #   Get Methods
@@ -28,4 +34,43 @@ class Document:
         '''
             Method which gets document type
         '''
-        return self._type
\ No newline at end of file
+        return self._type
+
+    def get_hash(self) -> Optional[str]:
+        '''
+            Method which gets the SHA-256 digest of the document's contents,
+            None for documents stored before uploads were hashed
+        '''
+        return self._sha256
+
+    ################################
+    #   Storage Methods
+    ################################
+    def to_json(self) -> dict[str, str]:
+        '''
+            Converts document into json
+        '''
+        return {
+            'id': self._id,
+            'path': self._path,
+            'type': self._type,
+            'sha256': self._sha256
+        }
+
+    def pop_changes(self) -> dict[str, dict[str, str]]:
+        '''
+            Returns the MongoDB update document writing the document in full
+        '''
+        return {'$set': self.to_json()}
+
+    def mark_all_changed(self) -> None:
+        '''
+            Documents are always written in full (see pop_changes)
+        '''
+
+    @classmethod
+    def from_json(cls, data: dict[str, str]) -> 'Document':
+        '''
+            Rebuilds a document from its stored json
+        '''
+        return cls(data['id'], data['path'], data['type'], data.get('sha256'))
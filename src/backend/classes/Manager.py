@@ -1,32 +1,193 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request
+from fastapi.security import SecurityScopes
 from fastapi_login import LoginManager
 from pydantic import BaseModel
 from passlib.context import CryptContext
 from src.backend.classes.datastore import data_store
+from src.backend.classes.RevocationStore import RevocationStore
 from src.backend.database import *
 from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set, Tuple
+import asyncio
+import os
+import time
 
 TOKEN_DURATION = timedelta(days=1)     # 1 day expiration
-blacklisted_tokens = {}
+
+# bcrypt releases the GIL, so hashing runs on a thread pool, off the event loop
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', os.cpu_count() or 1))
+HASH_QUEUE_LIMIT = int(os.getenv('HASH_QUEUE_LIMIT', 64))  # Waiting hashes before rejecting (429)
+HASH_RETRY_AFTER = 1    # Seconds clients are told to wait when rejected
+
+# Resolved tokens are trusted for this long without re-checking the user
+PRINCIPAL_TTL = float(os.getenv('PRINCIPAL_TTL', 30))
+PRINCIPAL_CACHE_SIZE = int(os.getenv('PRINCIPAL_CACHE_SIZE', 10_000))
+
+# Share revoked tokens between workers through MongoDB, rather than per process
+REVOCATION_SHARED = os.getenv('REVOCATION_SHARED') == 'True'
 
 def clear_blacklist():
-    blacklisted_tokens.clear()
+    revoked_tokens.clear()
+    _manager.clear_cache()
 
 def blacklist_user_token(uid: str):
     user = data_store.get_user_by_id(uid)
     token = user.get_token()
-    expiration_time = datetime.now(timezone.utc) + TOKEN_DURATION
-    blacklisted_tokens[token] = expiration_time
+    if token is not None:
+        revoked_tokens.revoke(token, uid, time.time() + TOKEN_DURATION.total_seconds())
+    invalidate_principal(uid)
+
+def invalidate_principal(uid: str):
+    '''
+        Drops every cached principal of a user, so their next request
+        reloads them. Call whenever a user's token, password or role
+        changes, or they are deleted
+    '''
+    _manager.principals.invalidate(uid)
+
+
+class TokenCache:
+    '''
+        Short-lived cache of values resolved from session tokens
+
+        Each entry lasts until ttl seconds pass or the token expires,
+        whichever is first. Entries are grouped by user, so that all of a
+        user's entries can be dropped at once. Once size entries are held,
+        the oldest is evicted. A ttl or size of 0 disables caching
+
+        Stores:
+            - entries:  token -> (expiry, uid, value)
+            - by_user:  uid -> tokens with an entry
+    '''
+
+    def __init__(self, ttl: float, size: int) -> None:
+        self._ttl = ttl
+        self._size = size
+        self._entries: Dict[str, Tuple[float, str, Any]] = {}
+        self._by_user: Dict[str, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[Any]:
+        '''
+            Returns the value cached for a token, None if absent or stale
+        '''
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            self.__drop(token)
+            return None
+        return entry[2]
+
+    def put(self, token: str, uid: str, value: Any, expires: Optional[float] = None) -> None:
+        '''
+            Caches a value for a token, until the token's expiry (a unix
+            timestamp) if that comes before the ttl
+        '''
+        if self._ttl <= 0 or self._size <= 0:
+            return
+        expiry = time.time() + self._ttl
+        if expires is not None:
+            expiry = min(expiry, expires)
+
+        self.__drop(token)
+        if len(self._entries) >= self._size:
+            self.__drop(next(iter(self._entries)))
+        self._entries[token] = (expiry, uid, value)
+        self._by_user.setdefault(uid, set()).add(token)
+
+    def invalidate(self, uid: str) -> None:
+        '''
+            Drops every entry of a user
+        '''
+        for token in self._by_user.pop(uid, ()):
+            del self._entries[token]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+
+    def __drop(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._by_user[entry[1]]
+        tokens.discard(token)
+        if not tokens:
+            del self._by_user[entry[1]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CachedLoginManager(LoginManager):
+    '''
+        LoginManager which caches, per token, the decoded JWT and the
+        principal loaded for it (see TokenCache), so repeat requests skip
+        verifying the signature and loading the user
+
+        Decoded tokens never go stale before they expire, while principals
+        are dropped with invalidate_principal whenever the user changes
+    '''
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.payloads = TokenCache(PRINCIPAL_TTL, PRINCIPAL_CACHE_SIZE)
+        self.principals = TokenCache(PRINCIPAL_TTL, PRINCIPAL_CACHE_SIZE)
+
+    def _get_payload(self, token: str) -> Dict[str, Any]:
+        payload = self.payloads.get(token)
+        if payload is None:
+            payload = super()._get_payload(token)
+            self.payloads.put(token, str(payload.get('sub')), payload, payload.get('exp'))
+        return payload
+
+    async def __call__(self, request: Request, security_scopes: SecurityScopes = None) -> Any:
+        token = await self._get_token(request)
+        # Checked per request, as revocations shared by other workers only
+        # ever name the token itself
+        if revoked_tokens.is_revoked(token):
+            raise HTTPException(status_code=401, detail="Current token is invalid")
+        payload = self._get_payload(token)
+        if not self._has_scopes(payload, security_scopes):
+            raise self._out_of_scope_exception
+
+        principal = self.principals.get(token)
+        if principal is None:
+            principal = await self._get_current_user(payload)
+            self.principals.put(token, str(payload['sub']), principal, payload.get('exp'))
+        return principal
+
+    def clear_cache(self) -> None:
+        '''
+            Drops every cached token and principal
+        '''
+        self.payloads.clear()
+        self.principals.clear()
+
 
 class Manager:
     '''
         Class which handles session-management and password security
+
+        Passwords are hashed and verified on a bounded worker pool, as each
+        bcrypt call takes 100s of ms of CPU. Once hash_queue_limit calls are
+        waiting for a worker, further calls are rejected with a 429
     '''
 
-    def __init__(self, manager: LoginManager, pwd_context = CryptContext) -> None:
+    def __init__(self,
+                 manager: LoginManager,
+                 pwd_context = CryptContext,
+                 hash_workers: int = HASH_WORKERS,
+                 hash_queue_limit: int = HASH_QUEUE_LIMIT) -> None:
         
         self._manager = manager
         self._pwd_context = pwd_context
+        self._hash_workers = hash_workers
+        self._hash_queue_limit = hash_queue_limit
+        self._hash_pool = ThreadPoolExecutor(hash_workers, thread_name_prefix='bcrypt')
+        self._hash_in_flight = 0    # Running or waiting - only changed on the event loop
+        self._hash_rejected = 0
     
     ################################
     #   Get Methods
@@ -41,17 +202,55 @@ class Manager:
     #   Session / Password Methods
     ################################
 
-    def hash_password(self, password: str) -> str:
+    async def hash_password(self, password: str) -> str:
         '''
             Hashes given password with pwd_context
+
+            Raises:     HTTP Error 429 if the hashing pool is saturated
         '''
-        return self._pwd_context.hash(password)
+        return await self.__run_hash(self._pwd_context.hash, password)
 
-    def verify_password(self, password_given: str, password_compare) -> bool:
+    async def verify_password(self, password_given: str, password_compare) -> bool:
         '''
             Verifies given password with comparison password
+
+            Raises:     HTTP Error 429 if the hashing pool is saturated
+        '''
+        return await self.__run_hash(self._pwd_context.verify, password_given, password_compare)
+
+    async def __run_hash(self, fn, *args):
+        '''
+            Runs fn on the hashing pool, unless too many calls are waiting
         '''
-        return self._pwd_context.verify(password_given, password_compare)
+        if self._hash_in_flight >= self._hash_workers + self._hash_queue_limit:
+            self._hash_rejected += 1
+            raise HTTPException(status_code=429,
+                                detail="Too many login attempts, please try again shortly",
+                                headers={'Retry-After': str(HASH_RETRY_AFTER)})
+
+        self._hash_in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._hash_pool, fn, *args)
+        finally:
+            self._hash_in_flight -= 1
+
+    def get_hash_queue_depth(self) -> int:
+        '''
+            Returns number of password hashes waiting for a worker
+        '''
+        return max(self._hash_in_flight - self._hash_workers, 0)
+
+    def get_hash_stats(self) -> dict[str, int]:
+        '''
+            Returns the hashing pool's size, load and rejected call count
+        '''
+        return {
+            'workers': self._hash_workers,
+            'in_flight': self._hash_in_flight,
+            'queue_depth': self.get_hash_queue_depth(),
+            'queue_limit': self._hash_queue_limit,
+            'rejected': self._hash_rejected
+        }
 
     def create_access_token(self, data : dict[T, K]) -> str:
         '''
@@ -62,12 +261,16 @@ class Manager:
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET = 'supersecretkey'
-_manager = LoginManager(SECRET, token_url='/auth/login')
+_manager = CachedLoginManager(SECRET, token_url='/auth/login')
 
 @_manager.user_loader()
-def load_user(username: str):
+async def load_user(username: str):
     '''
         Grabs user for manager
+
+        Returns the principal handlers receive - the user's id and roles,
+        and the User itself under 'user' so handlers need not look it up.
+        Async, so it runs on the event loop rather than a worker thread
     '''
     user = data_store.get_user_by_id(username)
     
@@ -75,18 +278,20 @@ def load_user(username: str):
         raise HTTPException(status_code=401, detail="User not found")
 
     token = user.get_token()
-    if token in blacklisted_tokens:
+    if token is not None and revoked_tokens.is_revoked(token):
         raise HTTPException(status_code=401, detail="Current token is invalid")
 
     user_body = {
         'id' : user.get_id(),
-        'username' : user.get_name(),
-        'email' : user.get_email(),
-        'password' : user.get_password(),
         'is_admin' : user.get_is_admin(),
         'is_super' : user.get_is_super(),
+        'user' : user,
     }
     return user_body
 
 global manager
 manager = Manager(_manager, pwd_context)
+
+global revoked_tokens
+revoked_tokens = RevocationStore(db.revoked_tokens if REVOCATION_SHARED else None,
+                                 on_revoke=invalidate_principal)
@@ -14,9 +14,14 @@ class Review(Comment):
             - body:             Actual review content
 
         Also stores internally:
-            - upvotes:          List of user IDs upvoting the review
-            - downvotes:        List of user IDs downvoting the review
+            - upvotes:          User IDs upvoting the review
+            - downvotes:        User IDs downvoting the review
+                                (both dicts keyed by uid in voting order, so
+                                votes are checked and removed in O(1))
             - reply:            ReviewReply obj associated with this review
+            - ranking:          VoteRanking of the service's reviews, kept
+                                up to date as votes change (set by the
+                                datastore)
     '''
 
     def __init__(self,
@@ -32,9 +37,10 @@ class Review(Comment):
 
         # Given attributes
         self._rating = rating
-        self._upvote = []
-        self._downvote = []
+        self._upvote = {}
+        self._downvote = {}
         self._reply = None
+        self._ranking = None
 
     #############################
     #   Update methods
@@ -56,10 +62,11 @@ class Review(Comment):
 
         # Add user's vote
         if _type == 'positive':
-            self._upvote.append(uid)
+            self._upvote[uid] = None
         else:
-            self._downvote.append(uid)
+            self._downvote[uid] = None
 
+        self.__rerank()
         return True
 
     def remove_vote(self, uid: str) -> bool:
@@ -68,16 +75,31 @@ class Review(Comment):
         '''
 
         if uid in self._upvote:
-            self._upvote.remove(uid)
+            del self._upvote[uid]
+            self.__rerank()
             return True
             
         elif uid in self._downvote:
-            self._downvote.remove(uid)
+            del self._downvote[uid]
+            self.__rerank()
             return True
         
         # If we reach here, user has not voted on this review
         return False
 
+    def set_ranking(self, ranking) -> None:
+        '''
+            Sets the ranking updated when the review's votes change
+        '''
+        self._ranking = ranking
+
+    def __rerank(self) -> None:
+        '''
+            Moves the review within its service's ranking
+        '''
+        if self._ranking is not None:
+            self._ranking.update(self._id, self.get_net_vote())
+
     def add_reply(self, rid: str) -> None:
         '''
             Adds reply to review
@@ -127,13 +149,13 @@ class Review(Comment):
         '''
             Gets review's upvotes ids
         '''
-        return self._upvote
+        return list(self._upvote)
     
     def get_downvote_ids(self):
         '''
             Gets review's downvotes ids
         '''
-        return self._downvote
+        return list(self._downvote)
 
     #############################
     #   JSON methods
@@ -178,4 +200,31 @@ class Review(Comment):
                 'e_timestamp': self.get_e_timestamp(),
                 'reply' : reply,
                 'voted' : voted
-            }
\ No newline at end of file
+            }
+
+    #############################
+    #   Storage methods
+    #############################
+    def to_storage_json(self) -> dict:
+        '''
+            Converts review into the document stored in MongoDB
+        '''
+        data = self._to_storage_json()
+        data['type'] = self._rating
+        data['upvote_ids'] = list(self._upvote)
+        data['downvote_ids'] = list(self._downvote)
+        data['reply'] = self._reply
+        return data
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Review':
+        '''
+            Rebuilds a review from its stored document
+        '''
+        review = cls._from_storage_json(data)
+        review._rating = data['type']
+        review._upvote = dict.fromkeys(data['upvote_ids'])
+        review._downvote = dict.fromkeys(data['downvote_ids'])
+        review._reply = data['reply']
+        review._ranking = None
+        return review
@@ -58,4 +58,24 @@ class ReviewReply(Comment):
                 'timestamp': self.get_timestamp(),
                 'edited': self.is_edited(),
                 'e_timestamp': self.get_e_timestamp(),
-            }
\ No newline at end of file
+            }
+
+    #############################
+    #   Storage methods
+    #############################
+    def to_storage_json(self) -> dict:
+        '''
+            Converts reply into the document stored in MongoDB
+        '''
+        data = self._to_storage_json()
+        data['parent'] = self._parent
+        return data
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'ReviewReply':
+        '''
+            Rebuilds a reply from its stored document
+        '''
+        reply = cls._from_storage_json(data)
+        reply._parent = data['parent']
+        return reply
@@ -0,0 +1,208 @@
+from typing import *
+from datetime import datetime, timezone
+from hashlib import blake2b
+from pymongo import UpdateOne
+import asyncio
+import heapq
+import time
+
+SYNC_INTERVAL = 1.0     # Max seconds before a revocation reaches other workers
+SYNC_OVERLAP = 5.0      # Seconds of changes re-read each sync, covering slow writes and clock skew
+COMPACT_SLACK = 1_024   # Skipped heap entries tolerated before the heap is rebuilt
+
+
+def fingerprint(token: str) -> bytes:
+    '''
+        Returns a 16 byte digest identifying a token
+    '''
+    return blake2b(token.encode(), digest_size=16).digest()
+
+
+class RevocationStore:
+
+    '''
+        Revoked session tokens, each kept until it would have expired
+
+        Tokens are held by fingerprint rather than in full. A min-heap
+        orders revocations by expiry, so purging pops only the expired
+        ones rather than scanning every revocation
+
+        Given a collection, revocations are shared between workers through
+        MongoDB - every interval seconds (see run), changes are written to
+        it and changes made by other workers are read back. on_revoke is
+        called with the user of each revocation read back, so cached state
+        for them can be dropped
+
+        Stores:
+            - expiries: fingerprint -> (expiry, uid) of each revoked token
+            - heap:     (expiry, fingerprint) of each revocation. Entries of
+                        tokens since restored or revoked again are left in
+                        place, and skipped when popped
+            - unsaved:  fingerprint -> change not yet written to the
+                        collection
+    '''
+
+    def __init__(self,
+                 collection = None,
+                 on_revoke: Optional[Callable[[str], None]] = None,
+                 interval: float = SYNC_INTERVAL) -> None:
+        self._collection = collection
+        self._on_revoke = on_revoke
+        self._interval = interval
+        self._expiries: Dict[bytes, Tuple[float, str]] = {}
+        self._heap: List[Tuple[float, bytes]] = []
+        self._unsaved: Dict[bytes, dict] = {}
+        self._synced = 0.0
+        self._indexed = False
+        self._cleared = False
+        self._lock = asyncio.Lock()
+
+    ################################
+    #   Revocation Methods
+    ################################
+    def revoke(self, token: str, uid: str, expires: float) -> None:
+        '''
+            Revokes a token until expires (a unix timestamp)
+        '''
+        fp = fingerprint(token)
+        self.__revoke(fp, uid, expires)
+        self.__change(fp, uid, expires, True)
+        self.purge()
+
+    def restore(self, token: str, expires: float) -> None:
+        '''
+            Lifts a token's revocation, if any. expires bounds how long the
+            change is kept in the collection
+        '''
+        fp = fingerprint(token)
+        self._expiries.pop(fp, None)
+        self.__change(fp, None, expires, False)
+
+    def is_revoked(self, token: str) -> bool:
+        '''
+            Returns whether a token is revoked
+        '''
+        entry = self._expiries.get(fingerprint(token))
+        return entry is not None and entry[0] > time.time()
+
+    def purge(self, now: Optional[float] = None) -> int:
+        '''
+            Drops revocations which have expired, returning how many
+        '''
+        now = time.time() if now is None else now
+        heap = self._heap
+        purged = 0
+        while heap and heap[0][0] <= now:
+            expiry, fp = heapq.heappop(heap)
+            entry = self._expiries.get(fp)
+            if entry is not None and entry[0] == expiry:
+                del self._expiries[fp]
+                purged += 1
+
+        # Rebuild once skipped entries outnumber live ones
+        if len(heap) > 2 * len(self._expiries) + COMPACT_SLACK:
+            self._heap = [(expiry, fp) for fp, (expiry, _) in self._expiries.items()]
+            heapq.heapify(self._heap)
+        return purged
+
+    def clear(self) -> None:
+        '''
+            Drops every revocation, from the collection too on next sync
+        '''
+        self._expiries.clear()
+        self._heap.clear()
+        self._unsaved.clear()
+        self._cleared = self._collection is not None
+
+    def __revoke(self, fp: bytes, uid: str, expires: float) -> None:
+        self._expiries[fp] = (expires, uid)
+        heapq.heappush(self._heap, (expires, fp))
+
+    def __change(self, fp: bytes, uid: Optional[str], expires: float, revoked: bool) -> None:
+        if self._collection is not None:
+            self._unsaved[fp] = {'uid': uid, 'expires': expires, 'revoked': revoked}
+
+    ################################
+    #   Sharing Methods
+    ################################
+    async def sync(self) -> None:
+        '''
+            Purges expired revocations. With a collection, also writes this
+            worker's changes and applies those of other workers
+        '''
+        self.purge()
+        if self._collection is None:
+            return
+
+        async with self._lock:
+            if not self._indexed:
+                # MongoDB deletes each document once its token has expired
+                # ('expiry' holds the exact timestamp, as dates keep only ms)
+                await self._collection.create_index('expires', expireAfterSeconds=0)
+                self._indexed = True
+            if self._cleared:
+                self._cleared = False
+                await self._collection.delete_many({})
+
+            await self.__save()
+            await self.__load()
+
+    async def __save(self) -> None:
+        '''
+            Writes unsaved changes, stamped with when they were written. If
+            the write fails they are kept, to be written next sync
+        '''
+        changes, self._unsaved = self._unsaved, {}
+        if not changes:
+            return
+        stamp = time.time()
+        try:
+            await self._collection.bulk_write([
+                UpdateOne({'_id': fp}, {'$set': {'uid': change['uid'],
+                                                 'expiry': change['expires'],
+                                                 'expires': datetime.fromtimestamp(change['expires'], timezone.utc),
+                                                 'revoked': change['revoked'],
+                                                 'stamp': stamp}}, upsert=True)
+                for fp, change in changes.items()
+            ], ordered=False)
+        except BaseException:
+            # Retried next sync, unless changed again since
+            for fp, change in changes.items():
+                self._unsaved.setdefault(fp, change)
+            raise
+
+    async def __load(self) -> None:
+        '''
+            Applies changes written since the last sync (and SYNC_OVERLAP
+            before it)
+        '''
+        started = time.time()
+        async for document in self._collection.find({'stamp': {'$gt': self._synced - SYNC_OVERLAP}}):
+            fp = document['_id']
+            if fp in self._unsaved:
+                # Changed here since, which wins
+                continue
+
+            expires = document['expiry']
+            if not document['revoked']:
+                self._expiries.pop(fp, None)
+            elif expires > started and self._expiries.get(fp, (None,))[0] != expires:
+                self.__revoke(fp, document['uid'], expires)
+                if self._on_revoke is not None:
+                    self._on_revoke(document['uid'])
+        self._synced = started
+
+    async def run(self) -> None:
+        '''
+            Background sync - purges and shares revocations every interval
+            seconds, until cancelled
+        '''
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Failed to sync token revocations: {e}")
+            await asyncio.sleep(self._interval)
+
+    def __len__(self) -> int:
+        return len(self._expiries)
@@ -0,0 +1,231 @@
+from typing import *
+from collections import Counter
+from math import log
+import re
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+GRAM_SIZE = 3
+PREFIX_MARK = '^'   # Marks n-grams starting a term (never part of a token)
+
+# Field weights - a term in the name counts as 3 occurrences etc.
+FIELD_WEIGHTS = {
+    'name': 3,
+    'tags': 2,
+    'description': 1,
+    'endpoints': 1
+}
+
+# Weight of a query token matching a term exactly, as a prefix, or infix
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.7
+INFIX_MATCH = 0.4
+
+# Most postings a query token's prefix and infix matches may each add up to.
+# Matching terms are taken rarest first until the budget is spent, and the
+# rest are silently dropped - so at scale a short token (eg. 'a') only
+# matches services through its rarer completions, rather than scoring most
+# of the catalogue. Exact matches are never dropped
+MAX_PREFIX_POSTINGS = 5_000
+MAX_INFIX_POSTINGS = 2_000
+
+# Shortest query token matched as an infix - a single character is inside
+# most of the vocabulary, so only its prefix matches are looked for
+MIN_INFIX_LENGTH = 2
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    '''
+        Splits text into lowercase alphanumeric tokens
+    '''
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+def grams(term: str) -> Set[str]:
+    '''
+        Returns every substring of term of length 1 to GRAM_SIZE, and its
+        prefixes of those lengths marked with PREFIX_MARK
+    '''
+    substrings = {term[i:i + n] for n in range(1, GRAM_SIZE + 1)
+                  for i in range(len(term) - n + 1)}
+    return substrings | {PREFIX_MARK + term[:n] for n in range(1, min(len(term), GRAM_SIZE) + 1)}
+
+
+class SearchIndex:
+
+    '''
+        Incremental inverted index used to search services
+
+        Each service is indexed as a weighted bag of terms from its name,
+        description, tags and endpoint titles. Query tokens match indexed
+        terms exactly, as a prefix or as an infix (found through an n-gram
+        index over the vocabulary, so no document is scanned), and results
+        are ranked with BM25. Prefix and infix matches are bounded by
+        MAX_PREFIX_POSTINGS and MAX_INFIX_POSTINGS (dropping matches past
+        them), so their cost doesn't grow with the catalogue - a query
+        costs at most its exact terms' postings plus those budgets
+
+        Stores:
+            - docs:         sid -> Counter of term frequencies
+            - postings:     term -> {sid: term frequency}
+            - grams:        n-gram -> set of vocabulary terms containing it
+                            (or starting with it, for n-grams marked with
+                            PREFIX_MARK)
+            - total_len:    Sum of all document lengths (for avg length)
+
+    '''
+
+    def __init__(self) -> None:
+        self._docs: Dict[str, Counter] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._total_len = 0
+
+    ################################
+    #   Index Methods
+    ################################
+    def add(self, sid: str, fields: Dict[str, List[str]]) -> None:
+        '''
+            (Re)indexes a document given its field texts, eg.
+            {'name': ['Google'], 'tags': ['API', 'AI'], ...}
+        '''
+        self.remove(sid)
+
+        terms = Counter()
+        for field, texts in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1)
+            for text in texts:
+                for token in tokenize(text):
+                    terms[token] += weight
+
+        if not terms:
+            return
+
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                for gram in grams(term):
+                    self._grams.setdefault(gram, set()).add(term)
+            postings[sid] = tf
+
+        length = sum(terms.values())
+        self._docs[sid] = terms
+        self._doc_len[sid] = length
+        self._total_len += length
+
+    def remove(self, sid: str) -> None:
+        '''
+            Removes a document from the index, if present
+        '''
+        terms = self._docs.pop(sid, None)
+        if terms is None:
+            return
+
+        self._total_len -= self._doc_len.pop(sid)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[sid]
+            if postings:
+                continue
+
+            # Term no longer used by any document
+            del self._postings[term]
+            for gram in grams(term):
+                matching = self._grams[gram]
+                matching.discard(term)
+                if not matching:
+                    del self._grams[gram]
+
+    ################################
+    #   Search Methods
+    ################################
+    def expand(self, token: str) -> Dict[str, float]:
+        '''
+            Returns vocabulary terms containing token, with their match
+            weight. Prefix and infix matches past their posting budgets are
+            left out (see MAX_PREFIX_POSTINGS)
+        '''
+        match_infixes = len(token) >= MIN_INFIX_LENGTH
+        if len(token) <= GRAM_SIZE:
+            key = token if match_infixes else PREFIX_MARK + token
+            candidates = self._grams.get(key, set())
+        else:
+            # Intersect the postings of each of the token's n-grams, smallest first
+            token_grams = sorted((self._grams.get(token[i:i + GRAM_SIZE], set())
+                                  for i in range(len(token) - GRAM_SIZE + 1)), key=len)
+            candidates = set(token_grams[0]).intersection(*token_grams[1:])
+
+        expanded = {}
+        prefixes, infixes = [], []
+        for term in candidates:
+            if term == token:
+                expanded[term] = EXACT_MATCH
+            elif term.startswith(token):
+                prefixes.append(term)
+            elif match_infixes and token in term:
+                infixes.append(term)
+
+        for terms, weight, budget in [(prefixes, PREFIX_MATCH, MAX_PREFIX_POSTINGS),
+                                      (infixes, INFIX_MATCH, MAX_INFIX_POSTINGS)]:
+            for term in sorted(terms, key=lambda term: len(self._postings[term])):
+                budget -= len(self._postings[term])
+                if budget < 0:
+                    break
+                expanded[term] = weight
+        return expanded
+
+    def search(self, query: str) -> Dict[str, float]:
+        '''
+            Returns {sid: score} of documents matching every token of the
+            query (higher is better). An empty query matches nothing
+        '''
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self._docs:
+            return {}
+
+        # Evaluate the most selective token first, so later tokens only need
+        # to score documents that are still candidates
+        expansions = [self.expand(token) for token in tokens]
+        expansions.sort(key=lambda terms: sum(len(self._postings[term]) for term in terms))
+
+        # BM25 length normalisation is norm_base + norm_scale * doc_len
+        num_docs = len(self._docs)
+        norm_base = K1 * (1 - B)
+        norm_scale = K1 * B * num_docs / self._total_len
+        doc_len = self._doc_len
+
+        scores: Optional[Dict[str, float]] = None
+        for terms in expansions:
+            token_scores: Dict[str, float] = {}
+            for term, weight in terms.items():
+                postings = self._postings[term]
+                idf = log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                factor = weight * idf * (K1 + 1)
+                if scores is not None and len(scores) < len(postings):
+                    matches = ((sid, postings[sid]) for sid in scores if sid in postings)
+                else:
+                    matches = postings.items()
+
+                for sid, tf in matches:
+                    score = factor * tf / (tf + norm_base + norm_scale * doc_len[sid])
+                    if score > token_scores.get(sid, 0):
+                        token_scores[sid] = score
+
+            # Documents must match every token
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {sid: score + token_scores[sid] for sid, score in scores.items()
+                          if sid in token_scores}
+            if not scores:
+                return {}
+
+        return scores
+
+    def __len__(self) -> int:
+        return len(self._docs)
@@ -0,0 +1,93 @@
+from typing import *
+from bisect import bisect_right
+
+# Removing more ids than this at once filters the sequence numbers in one
+# pass, rather than shifting the list once per id
+BULK_REMOVE = 32
+
+
+class SequenceIndex:
+
+    '''
+        Keeps ids in insertion order, numbering each as it is added, so
+        listings can resume after any item in O(log n) rather than walking
+        every item before it
+
+        Stores:
+            - seqs:     Sequence numbers of the ids present, ascending
+            - ids:      sequence number -> id
+            - numbers:  id -> sequence number
+    '''
+
+    def __init__(self) -> None:
+        self._seqs: List[int] = []
+        self._ids: Dict[int, str] = {}
+        self._numbers: Dict[str, int] = {}
+        self._next = 0
+
+    def append(self, eid: str) -> int:
+        '''
+            Numbers an id after every id added so far, returning its
+            sequence number (ids already present keep theirs)
+        '''
+        seq = self._numbers.get(eid)
+        if seq is None:
+            seq = self._numbers[eid] = self._next
+            self._ids[seq] = eid
+            self._seqs.append(seq)
+            self._next += 1
+        return seq
+
+    def load(self, eids: Iterable[str]) -> None:
+        '''
+            Replaces the index's contents with ids, in order
+        '''
+        self.__init__()
+        for eid in eids:
+            self.append(eid)
+
+    def remove(self, eid: str) -> None:
+        '''
+            Removes an id, if present
+        '''
+        seq = self._numbers.pop(eid, None)
+        if seq is None:
+            return
+        del self._ids[seq]
+        del self._seqs[bisect_right(self._seqs, seq) - 1]
+
+    def remove_many(self, eids: Iterable[str]) -> None:
+        '''
+            Removes several ids (those present)
+        '''
+        seqs = {self._numbers.pop(eid) for eid in eids if eid in self._numbers}
+        if len(seqs) <= BULK_REMOVE:
+            for seq in seqs:
+                del self._ids[seq]
+                del self._seqs[bisect_right(self._seqs, seq) - 1]
+            return
+        for seq in seqs:
+            del self._ids[seq]
+        self._seqs = [seq for seq in self._seqs if seq not in seqs]
+
+    def seq(self, eid: str) -> int:
+        '''
+            Returns an id's sequence number
+        '''
+        return self._numbers[eid]
+
+    def after(self, seq: Optional[int] = None) -> Iterator[str]:
+        '''
+            Yields ids in sequence order, starting after seq (from the
+            start if None)
+        '''
+        i = 0 if seq is None else bisect_right(self._seqs, seq)
+        seqs = self._seqs
+        while i < len(seqs):
+            eid = self._ids.get(seqs[i])
+            i += 1
+            if eid is not None:
+                yield eid
+
+    def __len__(self) -> int:
+        return len(self._seqs)
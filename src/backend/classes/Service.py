@@ -1,9 +1,11 @@
 from typing import *
 from enum import Enum
+from itertools import count
+import orjson
 from src.backend.classes.Endpoint import Endpoint
 from src.backend.classes.Document import Document
 from src.backend.classes.User import User
-from src.backend.classes.datastore import data_store
+from src.backend.classes.ChangeTracker import ChangeTracker
 
 
 from fastapi import HTTPException
@@ -28,6 +30,10 @@ T = TypeVar("T")
 K = TypeVar("K")
 DEFAULT_ICON = '0'
 
+# Version stamps for serialization caches - globally unique, so a stamp is
+# never reused by a different object or state
+_stamps = count(1)
+
 
 class ServiceVersionInfo:
     '''
@@ -37,6 +43,8 @@ class ServiceVersionInfo:
         endpoints: list of endpoints
         version_description: additional version specific details
         documents: List of documents
+        service: service the version belongs to, so the status indexes of
+                 the datastore holding it follow the version's status
     '''
 
     def __init__(self,
@@ -52,12 +60,32 @@ class ServiceVersionInfo:
         self._status : ServiceStatus = ServiceStatus.PENDING
         self._status_reason : str = ""
         self._newly_created: bool = True
+        self._service: Optional['Service'] = None
+
+        # Serialization cache, keyed by version stamp
+        self._stamp = next(_stamps)
+        self._json_cache = None
+
+    def _touch(self) -> None:
+        '''
+            Invalidates cached serializations - call after any mutation
+        '''
+        self._stamp = next(_stamps)
 
     def update_newly_created(self):
         self._newly_created = False
+        self._touch()
 
     def to_json(self):
-        return {
+        '''
+            Converts the version into json, reusing the cached dict while
+            the version hasn't changed. Returns a shallow copy, so callers
+            may add or replace keys
+        '''
+        if self._json_cache is not None and self._json_cache[0] == self._stamp:
+            return dict(self._json_cache[1])
+
+        self._json_cache = (self._stamp, {
             "version_name": self._version_name,
             "endpoints": self._endpoints,
             "version_description": self._version_description,
@@ -66,7 +94,8 @@ class ServiceVersionInfo:
             "status_reason": self._status_reason,
             "newly_created": self._newly_created
 
-        }
+        })
+        return dict(self._json_cache[1])
     
     def to_updated_json(self, id: str, name: str):
         if self._status == ServiceStatus.PENDING:
@@ -88,10 +117,30 @@ class ServiceVersionInfo:
 
             }
         return None
+
+    @classmethod
+    def from_json(cls, data: dict[T, K]) -> 'ServiceVersionInfo':
+        '''
+            Rebuilds a version from its stored json. Pending updates are not
+            stored, so a version awaiting approval is restored with its
+            current fields as the pending update
+        '''
+        version = cls(data['version_name'], data['endpoints'], data['version_description'])
+        version._docs = data['docs']
+        version._status = ServiceStatus[data['status']]
+        version._status_reason = data['status_reason']
+        version._newly_created = data['newly_created']
+        if version._status == ServiceStatus.UPDATE_PENDING:
+            version._pending_update = ServicePendingVersionUpdate(
+                version._version_name, version._endpoints, version._version_description)
+        return version
     
     def update_status(self, status: ServiceStatus, reason: str):
         self._status = status
         self._status_reason = reason
+        self._touch()
+        if self._service is not None:
+            self._service._index_status()
     
     def get_status(self):
         return self._status
@@ -124,6 +173,7 @@ class ServiceVersionInfo:
             self._version_description = self._pending_update._version_description
 
             self._pending_update = None
+            self._touch()
     
     def has_pending_update(self) -> bool:
         return self._pending_update != None
@@ -198,6 +248,11 @@ class Service:
         pay_model:      Whether the API is premium, freemium or free (default is free)
         
         ----
+        stamp           Version stamp, bumped on every mutation to invalidate
+                        the cached to_json/to_summary_json serializations
+        changes         Fields changed since the service was last persisted
+        store           Datastore holding the service, reindexed when its
+                        indexed fields change (None until added to one)
         version_info    List of all versions of service, with most recently created first
         icon            Doc_ID of service icon. Has a default icon
         owner_count:    Number of owners for this service
@@ -230,7 +285,14 @@ class Service:
                  version_description: str,
                  icon: str = DEFAULT_ICON,
                  pay_model: str = 'Free') -> None:
-        
+
+        # Serialization caches & change tracking
+        self._stamp = next(_stamps)
+        self._json_cache = None
+        self._summary_cache = None
+        self._changes = ChangeTracker()
+        self._store = None
+
         # Initialised vars
         self._id = sid
         self._name = name
@@ -257,6 +319,11 @@ class Service:
         self._status = ServiceStatus.PENDING
         self._status_reason = ""
         self._icon = icon
+
+        # New services are stored in full by db_add_service
+        self._changes.clear()
+        self._persisted_owner = self.to_json()['owner']
+        self._persisted_versions = [(version, version._stamp) for version in self._version_info]
     
     ################################
     #   Add Methods
@@ -269,12 +336,15 @@ class Service:
         version: ServiceVersionInfo = self.get_version_info(version)
         for doc in docs:
             version._docs.append(doc)
+        version._touch()
     def add_user(self, uid: str) -> None:
         '''
             Adds user to subscription/usage list
         '''
         self._users.append(uid)
         self._user_count += 1
+        self._changes.push('users', uid)
+        self._touch()
 
     def add_review(self, review: str, rating: str) -> None:
         '''
@@ -287,18 +357,24 @@ class Service:
             self._upvotes += 1
         else:
             self._downvotes += 1
+        self._changes.push('reviews', review)
+        self._touch('upvotes', 'downvotes')
 
     def add_upvote(self) -> None:
         '''
             Adds upvote to service
         '''
         self._upvotes += 1
+        self._touch('upvotes')
 
     def add_tag(self, tag) -> None:
         '''
             Adds tag to service
         '''
         self._tags.append(tag)
+        self._changes.push('tags', tag)
+        self._touch()
+        self._reindex()
 
     def add_endpoint(self, tab, parameters, method, version: Optional[str] = None) -> None:
         '''
@@ -306,7 +382,9 @@ class Service:
         '''
         
         new_endpoint = Endpoint(tab, parameters, method)
-        self.get_version_info(version)._endpoints.append(new_endpoint)
+        version = self.get_version_info(version)
+        version._endpoints.append(new_endpoint)
+        version._touch()
     
     ################################
     #   Update Methods
@@ -322,34 +400,45 @@ class Service:
         else:
             self._downvotes -= 1
             self._upvotes += 1
+        self._touch('upvotes', 'downvotes')
         
     def update_name(self, name: str) -> None:
         '''
             Update service name
         '''
         self._name = name
+        self._touch('name')
+        self._reindex()
     
     def update_icon(self, url: str) -> None:
         '''
             Update service icon
         '''
         self._icon_url = url
+        self._touch('icon_url')
 
     def update_description(self, desc: str) -> None:
         '''
             Update service description
         '''
         self._description = desc
+        self._touch('description')
+        self._reindex()
 
     def update_icon_id(self, icon_id: str) -> None:
         '''
             Update service icon
         '''
         self._icon = icon_id
+        self._touch('icon')
     
     def update_status(self, status: ServiceStatus, reason: str):
         self._status = status
         self._status_reason = reason
+        self._touch('status', 'status_reason')
+        if self._store is not None:
+            self._store.refresh_tag_ranking(self)
+        self._index_status()
     
     def create_pending_update(self,
                 name: str,
@@ -375,29 +464,35 @@ class Service:
             self._description = self._pending_update.get_description()
 
             # update analytics for tags (assumes new tags are already in datastore)
-            curr_tags = self._tags
-            new_tags = self._pending_update.get_tags()
-            for _tag in new_tags:
-                if _tag not in curr_tags:
-                    # update tag
-                    tag = data_store.get_tag_by_name(_tag)
-                    tag.add_server(self._id)
-                else:
-                    curr_tags.remove(_tag)
-
-            for _tag in curr_tags:
-                tag = data_store.get_tag_by_name(_tag)
-                tag.remove_server(self._id)
+            if self._store is not None:
+                curr_tags = self._tags
+                new_tags = self._pending_update.get_tags()
+                for _tag in new_tags:
+                    if _tag not in curr_tags:
+                        # update tag
+                        tag = self._store.get_tag_by_name(_tag)
+                        tag.add_server(self._id)
+                    else:
+                        curr_tags.remove(_tag)
+
+                for _tag in curr_tags:
+                    tag = self._store.get_tag_by_name(_tag)
+                    tag.remove_server(self._id)
 
             self._tags = self._pending_update.get_tags()
             self._pay_model = self._pending_update.get_pay_model()
             self._pending_update = None
+            self._touch('name', 'description', 'tags', 'pay_model')
+            self._reindex()
     
     def update_newly_created(self):
         self._newly_created = False
+        self._touch('newly_created')
 
     def update_pay_model(self, pay_model: str):
         self._pay_model = pay_model
+        self._touch('pay_model')
+        self._reindex()
 
     ################################
     #   Delete Methods
@@ -407,7 +502,9 @@ class Service:
             Remove path to documentation
         '''
 
-        self.get_version_info(version)._docs.remove(doc)
+        version = self.get_version_info(version)
+        version._docs.remove(doc)
+        version._touch()
 
     def remove_user(self, uid: str) -> None:
         '''
@@ -415,6 +512,8 @@ class Service:
         '''
         self._users.remove(uid)
         self._user_count -= 1
+        self._changes.pull('users', uid)
+        self._touch()
 
     def remove_review(self, review: str, rating: str) -> None:
         '''
@@ -427,7 +526,56 @@ class Service:
             self._upvotes -= 1
         else:
             self._downvotes -= 1
-   
+        self._changes.pull('reviews', review)
+        self._touch('upvotes', 'downvotes')
+
+    def remove_reviews(self, ratings: Dict[str, str]) -> None:
+        '''
+            Removes several reviews (rid -> rating) from service in one pass
+        '''
+        removed = [review for review in self._reviews if review in ratings]
+        if not removed:
+            return
+        self._reviews = [review for review in self._reviews if review not in ratings]
+        self._review_count -= len(removed)
+
+        for review in removed:
+            if ratings[review] == 'positive':
+                self._upvotes -= 1
+            else:
+                self._downvotes -= 1
+            self._changes.pull('reviews', review)
+        self._touch('upvotes', 'downvotes')
+
+    def keep_reviews(self, ratings: Dict[str, str]) -> None:
+        '''
+            Removes every review not in ratings (rid -> rating), recounting
+            the ratings of those kept - for reviews which were lost, and so
+            whose ratings are unknown
+        '''
+        removed = [review for review in self._reviews if review not in ratings]
+        if not removed:
+            return
+        self._reviews = [review for review in self._reviews if review in ratings]
+        self._review_count = len(self._reviews)
+        self._upvotes = sum(ratings[review] == 'positive' for review in self._reviews)
+        self._downvotes = self._review_count - self._upvotes
+        for review in removed:
+            self._changes.pull('reviews', review)
+        self._touch('upvotes', 'downvotes')
+
+    def keep_docs(self, doc_ids: Container[str]) -> None:
+        '''
+            Removes every version doc not in doc_ids, and the icon if not in
+            doc_ids (restoring the default)
+        '''
+        if self._icon not in doc_ids:
+            self.remove_icon()
+        for version in self._version_info:
+            if any(doc not in doc_ids for doc in version._docs):
+                version._docs = [doc for doc in version._docs if doc in doc_ids]
+                version._touch()
+
     def remove_tag(self, tag) -> None:
         '''
             Removes tag from service
@@ -435,18 +583,24 @@ class Service:
         if tag not in self._tags:
             return
         self._tags.remove(tag)
+        self._changes.pull('tags', tag)
+        self._touch()
+        self._reindex()
 
     def remove_icon(self) -> None:
         '''
             Removes icon from service and restores to default
         '''
         self._icon = DEFAULT_ICON
+        self._touch('icon')
 
     def remove_endpoint(self, endpoint: Endpoint, version: Optional[str] = None) -> None:
         '''
             Removes specified endpoint 
         '''
-        self.get_version_info(version)._endpoints.remove(endpoint)
+        version = self.get_version_info(version)
+        version._endpoints.remove(endpoint)
+        version._touch()
 
     ################################
     #   Get Methods
@@ -552,9 +706,11 @@ class Service:
             raise HTTPException(status_code=404, detail='Original Service must be approved before creating new version')
         
         # maintain version_info has most recently added version at front of list
-        self._version_info.insert(0,
-            ServiceVersionInfo(version_name, endpoints, version_description)
-        )
+        version = ServiceVersionInfo(version_name, endpoints, version_description)
+        version._service = self
+        self._version_info.insert(0, version)
+        self._touch()
+        self._index_status()
     
     def contains_version(self, version_name) -> bool:
         return any(version._version_name == version_name for version in self._version_info)
@@ -608,16 +764,127 @@ class Service:
         
         assert len(versions) + 1 == len(self._version_info)
         self._version_info = versions
+        self._touch()
+        self._index_status()
 
 
     ################################
     #  Storage Methods
     ################################
+    def set_store(self, store) -> None:
+        '''
+            Sets the datastore reindexing the service when its indexed
+            fields change
+        '''
+        self._store = store
+
+    def _reindex(self) -> None:
+        if self._store is not None:
+            self._store.index_api(self)
+
+    def _index_status(self) -> None:
+        if self._store is not None:
+            self._store.index_status(self._id)
+
+    def _touch(self, *fields: str) -> None:
+        '''
+            Invalidates cached serializations and marks the given stored
+            fields as changed - call after any mutation
+        '''
+        self._stamp = next(_stamps)
+        self._changes.set(*fields)
+
+    def pop_changes(self) -> dict[T, K]:
+        '''
+            Returns the MongoDB update document for changes since the last
+            call and resets tracking. Versions edited in place are $set by
+            index, while added/removed versions rewrite the whole list
+        '''
+        document = self.to_json()
+        sets = {}
+        if document['owner'] != self._persisted_owner:
+            sets['owner'] = document['owner']
+            self._persisted_owner = document['owner']
+
+        versions = [(version, version._stamp) for version in self._version_info]
+        if [version for version, _ in versions] != [version for version, _ in self._persisted_versions]:
+            sets['versions'] = document['versions']
+        else:
+            for i, (version, stamp) in enumerate(versions):
+                if stamp != self._persisted_versions[i][1]:
+                    sets[f"versions.{i}"] = document['versions'][i]
+        self._persisted_versions = versions
+
+        return self._changes.pop_update(document, sets)
+
+    def mark_all_changed(self) -> None:
+        '''
+            Marks every stored field as changed, eg. after a failed write
+        '''
+        self._changes.set(*self.to_json().keys())
+
+    @classmethod
+    def from_json(cls, data: dict[T, K], owner: User) -> 'Service':
+        '''
+            Rebuilds a service (of the calling subclass) from its stored
+            json, owned by the given user. Bypasses the constructor, which
+            would create and serialize a fresh version. As for versions, a
+            pending global update is restored from the current fields
+        '''
+        service = cls.__new__(cls)
+        service._stamp = next(_stamps)
+        service._json_cache = None
+        service._summary_cache = None
+        service._changes = ChangeTracker()
+        service._store = None
+
+        service._id = data['id']
+        service._name = data['name']
+        service._owner = owner
+        service._owner_count = 1
+        service._icon_url = data['icon_url']
+        service._description = data['description']
+        service._tags = data['tags']
+        service._type = data['type']
+        service._newly_created = data['newly_created']
+        service._version_info = [ServiceVersionInfo.from_json(version) for version in data['versions']]
+        for version in service._version_info:
+            version._service = service
+        service._pay_model = data['pay_model']
+
+        service._users = data['users']
+        service._user_count = len(service._users)
+        service._reviews = data['reviews']
+        service._review_count = len(service._reviews)
+        service._upvotes = data['upvotes']
+        service._downvotes = data['downvotes']
+        service._pending_update = None
+
+        service._status = ServiceStatus[data['status']]
+        service._status_reason = data['status_reason']
+        service._icon = data['icon']
+        if service._status == ServiceStatus.UPDATE_PENDING:
+            service._pending_update = ServicePendingGlobalUpdate(
+                service._name, service._description, service._tags, service._pay_model)
+
+        # The stored owner may be stale, so compare against what was loaded
+        service._persisted_owner = data['owner']
+        service._persisted_versions = [(version, version._stamp) for version in service._version_info]
+        return service
+
     def to_json(self) -> dict[T, K]:
         '''
-            Converts object into json,
+            Converts object into json, reusing the cached dict while neither
+            the service, its owner nor any version has changed. Returns a
+            shallow copy, as callers (eg. pymongo inserts) may add keys
         '''
-        return {
+        key = (self._stamp,
+               self._owner.get_name(), self._owner.get_displayname(), self._owner.get_email(),
+               tuple(version._stamp for version in self._version_info))
+        if self._json_cache is not None and self._json_cache[0] == key:
+            return dict(self._json_cache[1])
+
+        self._json_cache = (key, {
             'id': self._id,
             'name' : self._name,
             'owner' : {
@@ -642,7 +909,8 @@ class Service:
             # fields denoting most current service version
 
             "versions": [version.to_json() for version in self._version_info]
-        }
+        })
+        return dict(self._json_cache[1])
     
 
     def to_updated_json(self) -> dict[T, K]:
@@ -668,13 +936,38 @@ class Service:
         return None
     
     def to_summary_json(self) -> dict[T, K]:
-        return {
-            'id': self._id,
-            'name': self._name,
-            'owner': self._owner.get_displayname(),
-            'description': self._description,
-            'icon_url': self._icon_url,
-            'tags': self._tags,
-            'pay_model': self._pay_model,
-            'ratings': self.get_ratings()
-        }
\ No newline at end of file
+        '''
+            Converts object into the summary shown in listings, reusing the
+            cached dict until the service or its owner's display name
+            changes. Returns a shallow copy, so callers may add or replace
+            keys
+        '''
+        return dict(self.__summary()[1])
+
+    def to_summary_bytes(self) -> bytes:
+        '''
+            Returns the summary pre-serialized as JSON, cached alongside it
+        '''
+        cache = self.__summary()
+        if cache[2] is None:
+            cache[2] = orjson.dumps(cache[1])
+        return cache[2]
+
+    def __summary(self) -> list:
+        '''
+            Returns the [key, summary, bytes | None] cache entry, rebuilding
+            it if stale
+        '''
+        key = (self._stamp, self._owner.get_displayname())
+        if self._summary_cache is None or self._summary_cache[0] != key:
+            self._summary_cache = [key, {
+                'id': self._id,
+                'name': self._name,
+                'owner': self._owner.get_displayname(),
+                'description': self._description,
+                'icon_url': self._icon_url,
+                'tags': self._tags,
+                'pay_model': self._pay_model,
+                'ratings': self.get_ratings()
+            }, None]
+        return self._summary_cache
@@ -15,6 +15,7 @@ class Tag:
             
         Also stores:
             - servers:  Ids of servers tag belongs to
+            - live:     Ids of servers tag belongs to which are currently live
 
     '''
 
@@ -24,7 +25,8 @@ class Tag:
         self._type = type
 
         # Custom vars
-        self._servers  = []
+        self._servers  = set()
+        self._live = set()
 
     ################################
     #   Add Methods
@@ -33,9 +35,13 @@ class Tag:
         '''
             Adds a server to its collection - ignores duplicate additions
         '''
-        if sid in self._servers:
-            return
-        self._servers.append(sid)
+        self._servers.add(sid)
+
+    def add_live_server(self, sid: str) -> None:
+        '''
+            Marks a server using this tag as live
+        '''
+        self._live.add(sid)
     
     ################################
     #   Get Methods
@@ -58,12 +64,18 @@ class Tag:
         '''
         return self._type
     
-    def get_servers(self) -> list[str]:
+    def get_servers(self) -> set[str]:
         '''
-            Returns list of servers using this tag
+            Returns set of servers using this tag
         '''
         return self._servers
 
+    def get_num_live(self) -> int:
+        '''
+            Returns number of live servers using this tag
+        '''
+        return len(self._live)
+
     ################################
     #   Remove Methods
     ################################
@@ -71,9 +83,13 @@ class Tag:
         '''
             Removes a server from tag collection
         '''
-        if sid not in self._servers:
-            return
-        self._servers.remove(sid)
+        self._servers.discard(sid)
+
+    def remove_live_server(self, sid: str) -> None:
+        '''
+            Unmarks a server using this tag as live
+        '''
+        self._live.discard(sid)
 
     def to_json(self) -> None:
         '''
@@ -83,5 +99,25 @@ class Tag:
             'tid': self._id,
             'tag': self._tag,
             'type': self._type,
-            'num': len(self._servers)
+            'num': len(self._live)
         }
+
+    def pop_changes(self) -> dict:
+        '''
+            Returns the MongoDB update document writing the tag in full,
+            without its server counts (see from_json)
+        '''
+        return {'$set': {'tid': self._id, 'tag': self._tag, 'type': self._type}}
+
+    def mark_all_changed(self) -> None:
+        '''
+            Tags are always written in full (see pop_changes)
+        '''
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Tag':
+        '''
+            Rebuilds a tag from its stored json. Server counts are not
+            stored - they are rebuilt as services are indexed
+        '''
+        return cls(data['tid'], data['tag'], data['type'])
@@ -0,0 +1,136 @@
+from typing import *
+from math import log
+from src.backend.classes.SearchIndex import tokenize
+
+# Words too common in descriptions to say anything about a tag
+STOP_WORDS = {
+    'a', 'an', 'and', 'api', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
+    'in', 'into', 'is', 'it', 'its', 'of', 'on', 'or', 'that', 'the', 'this',
+    'to', 'with', 'your', 'you'
+}
+
+# Least fraction of a description's weight a tag's score must reach
+MIN_COVERAGE = 0.1
+
+
+def terms(texts: List[str]) -> Set[str]:
+    '''
+        Returns the distinct non stop word tokens of texts
+    '''
+    return {token for text in texts for token in tokenize(text)
+            if token not in STOP_WORDS}
+
+
+class TagSuggester:
+
+    '''
+        Suggests tags for a description from the services already using them
+
+        Each tag is profiled by how many of its services' names and
+        descriptions contain each term (a tag's own name counts as contained
+        in all of them). A description's suggestions are the tags ranked by
+        the sum, over the description's terms, of
+
+            idf(term) * fraction of the tag's services containing term
+
+        with idf as in BM25, so rare terms shared by most of a tag's services
+        weigh the most, and terms in every service next to nothing. Tags
+        scoring under MIN_COVERAGE of the description's weight (the sum of
+        idf over its terms, counting terms no service contains) are dropped,
+        so a word or two in common with an unrelated description isn't
+        enough. Only tags co-occurring with a description's terms are
+        scored, found through an inverted index, so no service is scanned.
+        Services are added and removed incrementally, eg. as they go live or
+        are deleted
+
+        Stores:
+            - docs:     sid -> (terms, tags) the service was trained with
+            - df:       term -> number of services containing it
+            - postings: term -> {tag: number of the tag's services containing it}
+            - tag_docs: tag -> number of services carrying it
+    '''
+
+    def __init__(self) -> None:
+        self._docs: Dict[str, Tuple[FrozenSet[str], FrozenSet[str]]] = {}
+        self._df: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._tag_docs: Dict[str, int] = {}
+
+    ################################
+    #   Training Methods
+    ################################
+    def add(self, sid: str, texts: List[str], tags: Iterable[str]) -> None:
+        '''
+            (Re)trains on a service given its texts and tags - a service
+            without tags is removed
+        '''
+        doc = (frozenset(terms(texts)), frozenset(tags))
+        if self._docs.get(sid) == doc:
+            return
+
+        self.remove(sid)
+        if not doc[1]:
+            return
+
+        self._docs[sid] = doc
+        for term in doc[0]:
+            self._df[term] = self._df.get(term, 0) + 1
+        for tag in doc[1]:
+            self._tag_docs[tag] = self._tag_docs.get(tag, 0) + 1
+            for term in doc[0] | terms([tag]):
+                postings = self._postings.setdefault(term, {})
+                postings[tag] = postings.get(tag, 0) + 1
+
+    def remove(self, sid: str) -> None:
+        '''
+            Forgets a service, if trained on
+        '''
+        doc = self._docs.pop(sid, None)
+        if doc is None:
+            return
+
+        for term in doc[0]:
+            self.__decrement(self._df, term)
+        for tag in doc[1]:
+            self.__decrement(self._tag_docs, tag)
+            for term in doc[0] | terms([tag]):
+                self.__decrement(self._postings[term], tag)
+                if not self._postings[term]:
+                    del self._postings[term]
+
+    def __decrement(self, counts: Dict[str, int], key: str) -> None:
+        '''
+            Decrements counts[key], dropping the key at 0
+        '''
+        counts[key] -= 1
+        if not counts[key]:
+            del counts[key]
+
+    ################################
+    #   Suggestion Methods
+    ################################
+    def suggest(self, description: str, num: int, min_coverage: float = MIN_COVERAGE) -> List[Tuple[str, float]]:
+        '''
+            Returns up to num (tag, score) pairs for a description, best first
+        '''
+        num_docs = len(self._docs)
+        scores: Dict[str, float] = {}
+        weight = 0.0
+        for term in terms([description]):
+            df = self._df.get(term, 0)
+            idf = log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            weight += idf
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+
+            for tag, count in postings.items():
+                scores[tag] = scores.get(tag, 0) + idf * count / self._tag_docs[tag]
+
+        ranked = sorted(((tag, score) for tag, score in scores.items()
+                         if score > 0 and score >= min_coverage * weight),
+                        key=lambda item: (-item[1], item[0]))
+        return ranked[:num]
+
+    def __len__(self) -> int:
+        return len(self._docs)
@@ -1,4 +1,5 @@
 from typing import *
+from src.backend.classes.ChangeTracker import ChangeTracker
 
 
 T = TypeVar("T")
@@ -36,7 +37,9 @@ class User:
             token:      Current token of the user
             service:    Service id created by the user
             upvotes:    Review ids user upvoted
-            downvotes:  Review ids user downvoted
+            downvotes:  Review ids user downvoted (both dicts keyed by rid
+                        in voting order, for O(1) checks and removals)
+            changes:    Fields changed since the user was last persisted
 
     '''
 
@@ -72,8 +75,9 @@ class User:
         self._token = None
         self._services = []
         self._num_services = 0
-        self._upvotes = []
-        self._downvotes = []
+        self._upvotes = {}
+        self._downvotes = {}
+        self._changes = ChangeTracker()
 
     ################################
     #   Add Methods
@@ -84,6 +88,7 @@ class User:
         '''
         self._reviews.append(rid)
         self._num_reviews += 1
+        self._changes.push('reviews', rid)
 
 
     def add_reply(self, rid: str) -> None:
@@ -92,6 +97,7 @@ class User:
         '''
         self._replies.append(rid)
         self._num_replies += 1
+        self._changes.push('replies', rid)
 
     def add_service(self, sid: str) -> None:
         '''
@@ -105,9 +111,11 @@ class User:
             Adds a vote to user's list
         '''
         if vote == 'positive':
-            self._upvotes.append(rid)
+            self._upvotes[rid] = None
+            self._changes.push('upvotes', rid)
         else:
-            self._downvotes.append(rid)
+            self._downvotes[rid] = None
+            self._changes.push('downvotes', rid)
 
     ################################
     #  Modify Methods
@@ -117,25 +125,31 @@ class User:
             Modifies user's displayname
         '''
         self._displayname = new
+        self._changes.set('displayname')
 
 
     def modify_username(self, new: str) -> None:
         '''
-            Modifies user's username
+            Modifies user's username. Use Datastore.modify_username for users in
+            a datastore, which also keeps its username index unique
         '''
         self._name = new
+        self._changes.set('username')
 
     def modify_email(self, new: str) -> None:
         '''
-            Modifies user's email
+            Modifies user's email. Use Datastore.modify_email for users in
+            a datastore, which also keeps its email index unique
         '''
         self._email = new
+        self._changes.set('email')
 
     def promote_to_admin(self) -> None:
         '''
             Promotes user to admin
         '''
         self._is_admin = True
+        self._changes.set('is_admin')
 
 
     def demote_to_user(self) -> None:
@@ -143,6 +157,7 @@ class User:
             Demotes user from admin
         '''
         self._is_admin = False
+        self._changes.set('is_admin')
 
 
     def modify_icon(self, doc_id: str) -> None:
@@ -150,6 +165,7 @@ class User:
             Modifies user's icon
         '''
         self._icon = doc_id
+        self._changes.set('icon')
 
 
     def verify_user(self) -> None:
@@ -157,6 +173,7 @@ class User:
             Verify the user
         '''
         self._is_verified = True
+        self._changes.set('is_verified')
 
 
     def change_password(self, new:str) -> None:
@@ -164,6 +181,7 @@ class User:
             Changes the user password
         '''
         self._password = new
+        self._changes.set('password')
 
     def update_token(self, new:str) -> None:
         '''
@@ -180,6 +198,7 @@ class User:
             Removes user's current icon
         '''
         self._icon = DEFAULT_ICON
+        self._changes.set('icon')
 
 
     def remove_review(self, rid: str) -> None:
@@ -188,6 +207,7 @@ class User:
         '''
         self._reviews.remove(rid)
         self._num_reviews -= 1
+        self._changes.pull('reviews', rid)
 
 
     def remove_reply(self, rid: str) -> None:
@@ -196,16 +216,50 @@ class User:
         '''
         self._replies.remove(rid)
         self._num_replies -= 1
+        self._changes.pull('replies', rid)
+
+    def remove_reviews(self, rids: Set[str]) -> None:
+        '''
+            Removes several reviews from the user's list in one pass
+        '''
+        removed = [rid for rid in self._reviews if rid in rids]
+        if not removed:
+            return
+        self._reviews = [rid for rid in self._reviews if rid not in rids]
+        self._num_reviews -= len(removed)
+        for rid in removed:
+            self._changes.pull('reviews', rid)
+
+    def remove_replies(self, rids: Set[str]) -> None:
+        '''
+            Removes several replies from the user's list in one pass
+        '''
+        removed = [rid for rid in self._replies if rid in rids]
+        if not removed:
+            return
+        self._replies = [rid for rid in self._replies if rid not in rids]
+        self._num_replies -= len(removed)
+        for rid in removed:
+            self._changes.pull('replies', rid)
+
+    def remove_services(self, sids: Set[str]) -> None:
+        '''
+            Removes several services from the user's list in one pass
+        '''
+        self._services = [sid for sid in self._services if sid not in sids]
+        self._num_services = len(self._services)
 
     def remove_vote(self, rid: str) -> None:
         '''
             Removes rid vote from user's list
         '''
         if rid in self._upvotes:
-            self._upvotes.remove(rid)
+            del self._upvotes[rid]
+            self._changes.pull('upvotes', rid)
 
         elif rid in self._downvotes:
-            self._downvotes.remove(rid)
+            del self._downvotes[rid]
+            self._changes.pull('downvotes', rid)
 
     ################################
     #  Get Methods
@@ -288,13 +342,13 @@ class User:
         '''
             Return list of upvotes
         '''
-        return self._upvotes
+        return list(self._upvotes)
     
     def get_downvotes(self) -> List[str]:
         '''
             Return list of downvotes
         '''
-        return self._downvotes
+        return list(self._downvotes)
 
     def get_profile(self) -> dict[str, str]:
         '''
@@ -343,8 +397,8 @@ class User:
             'reviews': self._reviews,
             'replies': self._replies,
             'icon' : self._icon,
-            'upvotes': self._upvotes,
-            'downvotes': self._downvotes
+            'upvotes': list(self._upvotes),
+            'downvotes': list(self._downvotes)
         }
 
         if include_password:
@@ -352,6 +406,37 @@ class User:
     
         return data
     
+    def pop_changes(self) -> dict[T, K]:
+        '''
+            Returns the MongoDB update document for changes since the last
+            call and resets tracking
+        '''
+        return self._changes.pop_update(self.to_json())
+
+    def mark_all_changed(self) -> None:
+        '''
+            Marks every stored field as changed, eg. after a failed write
+        '''
+        self._changes.set(*self.to_json().keys())
+
+    @classmethod
+    def from_json(cls, data: dict[T, K]) -> 'User':
+        '''
+            Rebuilds a user from its stored json. Owned services are not
+            stored, and are re-added as services are loaded
+        '''
+        user = cls(data['id'], data['displayname'], data['username'], data['password'],
+                   data['email'], data['is_admin'], data['is_super'], data['icon_url'])
+        user._icon = data['icon']
+        user._is_verified = data['is_verified']
+        user._reviews = data['reviews']
+        user._num_reviews = len(user._reviews)
+        user._replies = data['replies']
+        user._num_replies = len(user._replies)
+        user._upvotes = dict.fromkeys(data['upvotes'])
+        user._downvotes = dict.fromkeys(data['downvotes'])
+        return user
+
     def to_summary_json(self) -> dict[T, K]:
         '''
             Converts object to a summary json for frontend
@@ -0,0 +1,243 @@
+from typing import *
+from bisect import bisect_left, bisect_right, insort
+
+K = TypeVar("K")
+
+CHUNK = 512
+
+
+class SortedKeys:
+
+    '''
+        Sorted list of unique keys, split into chunks of up to 2 * CHUNK
+        keys so that adding or removing a key only shifts its own chunk
+        rather than every key after it
+
+        Stores:
+            - chunks:   Sorted runs of keys, each after the one before
+            - maxes:    Last key of each chunk, to find a key's chunk
+            - tree:     Fenwick tree over chunk sizes, so a key's position
+                        in the whole list is found in O(log n)
+    '''
+
+    def __init__(self) -> None:
+        self._chunks: List[List[K]] = []
+        self._maxes: List[K] = []
+        self._tree: List[int] = [0]
+        self._len = 0
+
+    def add(self, key: K) -> None:
+        '''
+            Inserts a key, splitting its chunk once it grows too large
+        '''
+        self._len += 1
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self.__rebuild()
+            return
+
+        ci = min(bisect_left(self._maxes, key), len(self._chunks) - 1)
+        chunk = self._chunks[ci]
+        insort(chunk, key)
+        self._maxes[ci] = chunk[-1]
+        if len(chunk) > 2 * CHUNK:
+            self._chunks[ci:ci + 1] = [chunk[:CHUNK], chunk[CHUNK:]]
+            self._maxes[ci:ci + 1] = [chunk[CHUNK - 1], chunk[-1]]
+            self.__rebuild()
+        else:
+            self.__resize(ci, 1)
+
+    def remove(self, key: K) -> None:
+        '''
+            Removes a key, which must be present
+        '''
+        self._len -= 1
+        ci = bisect_left(self._maxes, key)
+        chunk = self._chunks[ci]
+        del chunk[bisect_left(chunk, key)]
+        if chunk:
+            self._maxes[ci] = chunk[-1]
+            self.__resize(ci, -1)
+        else:
+            del self._chunks[ci]
+            del self._maxes[ci]
+            self.__rebuild()
+
+    def locate(self, key: K, right: bool = False) -> Tuple[int, int]:
+        '''
+            Returns the (chunk, index) where key would be inserted, before
+            equal keys (or after them if right)
+        '''
+        find = bisect_right if right else bisect_left
+        ci = find(self._maxes, key)
+        if ci == len(self._chunks):
+            return ci, 0
+        return ci, find(self._chunks[ci], key)
+
+    def position(self, key: K) -> int:
+        '''
+            Returns the number of keys less than key
+        '''
+        ci, i = self.locate(key)
+        total = 0
+        while ci > 0:
+            total += self._tree[ci]
+            ci -= ci & -ci
+        return total + i
+
+    def iter_from(self, ci: int, i: int) -> Iterator[K]:
+        '''
+            Yields keys in order, starting at a located (chunk, index)
+        '''
+        while ci < len(self._chunks):
+            yield from self._chunks[ci][i:]
+            ci, i = ci + 1, 0
+
+    def before(self, ci: int, i: int) -> Optional[K]:
+        '''
+            Returns the key before a located (chunk, index), if any
+        '''
+        if i > 0:
+            return self._chunks[ci][i - 1]
+        if ci > 0:
+            return self._chunks[ci - 1][-1]
+        return None
+
+    def last(self) -> Optional[K]:
+        '''
+            Returns the largest key, if any
+        '''
+        return self._maxes[-1] if self._maxes else None
+
+    def __resize(self, ci: int, change: int) -> None:
+        k = ci + 1
+        while k < len(self._tree):
+            self._tree[k] += change
+            k += k & -k
+
+    def __rebuild(self) -> None:
+        tree = [0] * (len(self._chunks) + 1)
+        for k, chunk in enumerate(self._chunks, 1):
+            tree[k] += len(chunk)
+            parent = k + (k & -k)
+            if parent < len(tree):
+                tree[parent] += tree[k]
+        self._tree = tree
+
+    def __len__(self) -> int:
+        return self._len
+
+
+class VoteRanking:
+
+    '''
+        Keeps a service's reviews ordered by net vote, so the best/worst
+        reviews (and any page of them) are read without sorting every
+        review, and a review's rank is found in O(log n)
+
+        Reviews with equal net votes are ordered by their sequence number
+        (creation order) in both directions
+
+        Stores:
+            - keys:     (net vote, seq) of each review, ascending (see
+                        SortedKeys, so a vote costs the same however many
+                        reviews the service has)
+            - rids:     seq -> review id
+            - ranked:   review id -> its current key
+    '''
+
+    def __init__(self) -> None:
+        self._keys = SortedKeys()
+        self._rids: Dict[int, str] = {}
+        self._ranked: Dict[str, Tuple[int, int]] = {}
+
+    #############################
+    #   Update methods
+    #############################
+    def add(self, rid: str, seq: int, net: int) -> None:
+        '''
+            Ranks a review (re-ranking it if already present)
+        '''
+        self.remove(rid)
+        key = (net, seq)
+        self._keys.add(key)
+        self._rids[seq] = rid
+        self._ranked[rid] = key
+
+    def update(self, rid: str, net: int) -> None:
+        '''
+            Moves a review to its new net vote, if ranked
+        '''
+        key = self._ranked.get(rid)
+        if key is not None and key[0] != net:
+            self.add(rid, key[1], net)
+
+    def remove(self, rid: str) -> None:
+        '''
+            Removes a review, if ranked
+        '''
+        key = self._ranked.pop(rid, None)
+        if key is None:
+            return
+        self._keys.remove(key)
+        del self._rids[key[1]]
+
+    #############################
+    #   Get methods
+    #############################
+    def worst(self, after: Optional[Tuple[int, int]] = None) -> Iterator[str]:
+        '''
+            Yields review ids from the lowest net vote up, starting after
+            the key (net, seq) if given
+        '''
+        start = (0, 0) if after is None else self._keys.locate(after, right=True)
+        for key in self._keys.iter_from(*start):
+            yield self._rids[key[1]]
+
+    def best(self, after: Optional[Tuple[int, int]] = None) -> Iterator[str]:
+        '''
+            Yields review ids from the highest net vote down, starting after
+            the key (-net, seq) if given
+
+            Walks the ascending keys one net vote at a time, each located by
+            bisection, so equal votes stay in creation order
+        '''
+        keys = self._keys
+        if after is None:
+            if not keys:
+                return
+            net, seq = keys.last()[0], -1
+        else:
+            net, seq = -after[0], after[1]
+
+        while True:
+            for key in keys.iter_from(*keys.locate((net, seq), right=True)):
+                if key[0] != net:
+                    break
+                yield self._rids[key[1]]
+
+            # Move on to the next lower net vote present
+            lower = keys.before(*keys.locate((net,)))
+            if lower is None:
+                return
+            net, seq = lower[0], -1
+
+    def rank(self, rid: str, best: bool = True) -> Optional[int]:
+        '''
+            Returns a review's 0-based position in best (or worst) order,
+            None if it is not ranked
+        '''
+        key = self._ranked.get(rid)
+        if key is None:
+            return None
+        position = self._keys.position(key)
+        if not best:
+            return position
+
+        # Reviews with more votes, then earlier reviews with as many
+        higher = len(self._keys) - self._keys.position((key[0] + 1,))
+        return higher + position - self._keys.position((key[0],))
+
+    def __len__(self) -> int:
+        return len(self._keys)
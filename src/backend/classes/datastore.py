@@ -1,10 +1,20 @@
 from typing import *
+from enum import Enum
+from bisect import bisect_left, insort
 from copy import deepcopy
+from itertools import chain
+from threading import RLock
+import time
 from src.backend.classes.Document import Document
 from src.backend.classes.User import User
 from src.backend.classes.Tag import Tag, SYSTEM, CUSTOM
+from src.backend.classes.SearchIndex import SearchIndex, tokenize
+from src.backend.classes.TagSuggester import TagSuggester
+from src.backend.classes.SequenceIndex import SequenceIndex
+from src.backend.classes.VoteRanking import VoteRanking
 
 LIVE = 1
+APPROVED = {1, 2, 3}    # LIVE, UPDATE_PENDING and UPDATE_REJECTED services have been approved
 
 T = TypeVar("T")
 defaults = [
@@ -22,24 +32,81 @@ DEFAULT_TAGS = [Tag(i, j, SYSTEM) for i, j in enumerate(defaults)]
 
 DEFAULT_ICON_PATH = "static/imgs/default_icon.png"
 DEFAULT_ICON = Document('0', DEFAULT_ICON_PATH, 'image/png')
+DOC_GRACE = 3600    # Seconds an upload is kept unreferenced, so it can be attached
+
+def doc_references(item: T) -> Iterator[str]:
+    '''
+        Yields the ids of the documents a user or service refers to - its
+        icon, and a service's version docs
+    '''
+    yield item.get_icon()
+    if hasattr(item, 'get_all_versions'):
+        for version in item.get_all_versions():
+            yield from version.get_docs()
+
+class DuplicateError(ValueError):
+    '''
+        Raised when a username or email is already taken by another user
+    '''
+
+def normalise_key(value: str) -> str:
+    '''
+        Normalises a username/email for case-insensitive unique lookups
+    '''
+    return value.strip().casefold()
+
+def next_id(ids: Iterable[str], minimum: int = 0) -> int:
+    '''
+        Returns the smallest integer id above every (numeric) id given
+    '''
+    return max((int(eid) + 1 for eid in ids if eid.isdigit()), default=minimum)
+
+def tag_rank_key(tag: Tag) -> tuple:
+    '''
+        Sort key of a tag in the ranking - most live services first, then by name
+    '''
+    return (-tag.get_num_live(), tag.get_tag().lower(), tag.get_id(), tag)
 
 schema = {
-    'users' : [],
+    'users' : {},
+    'user_names' : {},      # normalised username -> uid
+    'user_emails' : {},     # normalised email -> uid
+    'user_order' : SequenceIndex(),     # Users in creation order
     'user_count' : 0,
     'max_user_count' : 0,
-    'apis' : [],
+    'apis' : {},
+    'api_order' : SequenceIndex(),      # Apis in catalogue (insertion) order
+    'api_keys' : {},        # sid -> (tags, owner, pay_model) currently indexed
+    'tag_index' : {},       # tag -> set of sids carrying it
+    'provider_index' : {},  # owner uid -> set of sids
+    'provider_order' : {},  # owner uid -> sorted [(catalogue seq, sid)] of their apis
+    'pay_model_index' : {}, # pay_model -> set of sids
+    'status_index' : {},    # status value -> set of sids with that status
+    'version_status_index' : {},    # status value -> set of sids with a version in that status
+    'api_statuses' : {},    # sid -> (status, version statuses) currently indexed
+    'search_index' : SearchIndex(),
+    'tag_suggester' : TagSuggester(),   # Trained on live services' tags
     'api_count' : 0,
     'max_api_count': 0,
     'tags' : DEFAULT_TAGS.copy(),
+    'tag_names' : {tag.get_tag(): tag for tag in DEFAULT_TAGS},
+    'tag_live' : {},        # sid -> names of tags the (live) service is counted under
+    'tag_ranking' : sorted(tag_rank_key(tag) for tag in DEFAULT_TAGS),
+    'custom_tag_ranking' : [],
     'tag_count' : len(DEFAULT_TAGS),
     'max_tag_count': len(DEFAULT_TAGS),
     'img_count' : 0,
     'docs_count': 1,
-    'docs': [DEFAULT_ICON],
-    'reviews' : [],
+    'docs': {DEFAULT_ICON.get_id(): DEFAULT_ICON},
+    'doc_hashes' : {},      # SHA-256 digest -> id of the document stored with it
+    'doc_refs' : {},        # doc id -> icons and version docs referring to it
+    'doc_uploads' : {},     # doc id -> when it was last uploaded
+    'reviews' : {},
+    'review_order' : SequenceIndex(),   # Reviews in creation order
+    'review_ranking' : {},  # sid -> VoteRanking of its reviews
     'review_count': 0,
     'review_total': 0,
-    'replys' : [],          # Yes I know it's 'replies' but it's for delete_items
+    'replys' : {},          # Yes I know it's 'replies' but it's for delete_items
     'reply_count': 0,
     'reply_total': 0
 }
@@ -52,6 +119,30 @@ class Datastore:
 
     Globally stores everything
 
+    Users, apis, docs, reviews and replies are stored in dicts keyed by
+    their id (insertion ordered), so lookups and deletions by id are O(1)
+
+    Usernames and emails are additionally indexed case-insensitively and are
+    kept unique under a lock, so concurrent registrations cannot both succeed
+
+    Users, reviews and apis are also numbered in insertion order by
+    sequence indexes, so paged listings can resume after any item without
+    walking the items before it. Each service's reviews are also ranked by
+    net vote (see VoteRanking), which reviews update as they are voted on
+
+    Apis are indexed by tag, provider and pay model (see index_api), so that
+    filtering is answered by set operations over the matching sids only.
+    They are also partitioned by their status and their versions' statuses
+    (see index_status), so the approval queue and live listings only visit
+    services in the wanted statuses.
+    index_api also keeps the full-text search index up to date, and (for
+    live services) the tag suggester. Apis reindex themselves through the
+    datastore holding them (see Service.set_store)
+
+    Docs are indexed by content digest, so identical uploads share one
+    document, and counted by the icons and version docs referring to them,
+    so unreferenced documents can be collected (see release_doc)
+
     '''
 
     def __init__(self) -> None:
@@ -59,13 +150,158 @@ class Datastore:
             Constrcutor with default schema as initial store
         '''
         self.__store = deepcopy(schema)
+        self.__lock = RLock()
 
     ######################################
     #   Loading and Saving Methods Methods
     ######################################
 
     def clear_datastore(self) -> None:
-        self.__store = deepcopy(schema)
+        with self.__lock:
+            self.__store = deepcopy(schema)
+
+    def load(self,
+             users: List[T],
+             apis: List[T],
+             reviews: List[T],
+             replies: List[T],
+             tags: List[T],
+             docs: List[T]) -> None:
+        '''
+            Replaces the datastore's contents with previously stored objects,
+            eg. when warm starting from MongoDB. Indexes, tag counts and
+            owned services are rebuilt, and id counters continue after the
+            largest loaded id
+
+            Ranks are computed once all apis are loaded, instead of per api
+        '''
+        with self.__lock:
+            self.__store = deepcopy(schema)
+            store = self.__store
+
+            for user in users:
+                store['users'][user.get_id()] = user
+                store['user_names'][normalise_key(user.get_name())] = user.get_id()
+                store['user_emails'][normalise_key(user.get_email())] = user.get_id()
+            store['user_order'].load(store['users'])
+            store['user_count'] = len(store['users'])
+            store['max_user_count'] = next_id(store['users'])
+
+            for tag in tags:
+                if tag.get_tag() not in store['tag_names']:
+                    store['tags'].append(tag)
+                    store['tag_names'][tag.get_tag()] = tag
+
+            store['docs'].update((doc.get_id(), doc) for doc in docs)
+            for doc in docs:
+                if doc.get_hash() is not None:
+                    store['doc_hashes'][doc.get_hash()] = doc.get_id()
+            store['reviews'] = {review.get_id(): review for review in reviews}
+            store['review_order'].load(store['reviews'])
+            for review in reviews:
+                self.__rank_review(review)
+            store['review_count'] = len(store['reviews'])
+            store['replys'] = {reply.get_id(): reply for reply in replies}
+            store['reply_count'] = len(store['replys'])
+
+            # Users and services may refer to reviews, replies and docs which
+            # weren't loaded. Counters continue after every id referenced, so
+            # none is reused while a stale reference to it could remain
+            referenced = self.__drop_lost_references(users, apis)
+            store['docs_count'] = next_id(chain(store['docs'], referenced['docs']))
+            store['review_total'] = next_id(chain(store['reviews'], referenced['reviews']))
+            store['reply_total'] = next_id(chain(store['replys'], referenced['replys']))
+            for item in chain(users, apis):
+                self.retain_docs(item)
+
+            # Tags used by an api but not loaded are created as custom tags
+            next_tag = next_id(str(tag.get_id()) for tag in store['tags'])
+            for api in apis:
+                sid = api.get_id()
+                store['apis'][sid] = api
+                store['api_order'].append(sid)
+                api.get_owner().add_service(sid)
+                api.set_store(self)
+
+                status = api.get_status().value
+                counted = set()
+                for name in api.get_tags():
+                    tag = store['tag_names'].get(name)
+                    if tag is None:
+                        tag = store['tag_names'][name] = Tag(next_tag, name, CUSTOM)
+                        store['tags'].append(tag)
+                        next_tag += 1
+                    if status in APPROVED:
+                        tag.add_server(sid)
+                    if status == LIVE:
+                        tag.add_live_server(sid)
+                        counted.add(name)
+                if counted:
+                    store['tag_live'][sid] = counted
+                    self.__train_suggester(api, counted)
+                self.__index_fields(api)
+                self.index_status(sid)
+            store['api_count'] = len(apis)
+            store['max_api_count'] = max(next_id(store['apis']), len(apis))
+            store['tag_count'] = len(store['tags'])
+            store['max_tag_count'] = next_tag
+
+            # Rank every tag once, rather than re-ranking per loaded api
+            store['tag_ranking'] = sorted(tag_rank_key(tag) for tag in store['tags'])
+            store['custom_tag_ranking'] = [key for key in store['tag_ranking']
+                                           if key[3].get_type() == CUSTOM]
+
+    def __drop_lost_references(self, users: List[T], apis: List[T]) -> Dict[str, Set[str]]:
+        '''
+            Removes references from loaded users, services and reviews to
+            reviews, replies and docs which weren't loaded. Returns every id
+            referenced, lost or not, by kind
+
+            The removals are not recorded as changes, so are never written
+            back - MongoDB keeps the references, should they be restored
+        '''
+        store = self.__store
+        referenced = {'reviews': set(), 'replys': set(), 'docs': set()}
+        for user in users:
+            reviews = set(user.get_reviews())
+            votes = set(user.get_upvotes()) | set(user.get_downvotes())
+            replies = set(user.get_replies())
+            referenced['reviews'] |= reviews | votes
+            referenced['replys'] |= replies
+            referenced['docs'].update(doc_references(user))
+
+            lost_reviews = reviews - store['reviews'].keys()
+            lost_votes = votes - store['reviews'].keys()
+            lost_replies = replies - store['replys'].keys()
+            lost_icon = user.get_icon() not in store['docs']
+            if not (lost_reviews or lost_votes or lost_replies or lost_icon):
+                continue
+            user.remove_reviews(lost_reviews)
+            user.remove_replies(lost_replies)
+            for rid in lost_votes:
+                user.remove_vote(rid)
+            if lost_icon:
+                user.remove_icon()
+            user.pop_changes()
+
+        for api in apis:
+            reviews = api.get_reviews()
+            docs = list(doc_references(api))
+            referenced['reviews'].update(reviews)
+            referenced['docs'].update(docs)
+            if all(rid in store['reviews'] for rid in reviews) and all(doc in store['docs'] for doc in docs):
+                continue
+            api.keep_reviews({rid: store['reviews'][rid].get_rating()
+                              for rid in reviews if rid in store['reviews']})
+            api.keep_docs(store['docs'])
+            api.pop_changes()
+
+        for review in store['reviews'].values():
+            if review.get_reply() is not None:
+                referenced['replys'].add(review.get_reply())
+                if review.get_reply() not in store['replys']:
+                    review.remove_reply()
+        return referenced
 
     ##################################
     #   Datastore Insertion Methods
@@ -73,18 +309,224 @@ class Datastore:
     def add_user(self, user: T) -> None:
         '''
             Adds a user into the datastore
-        '''
-        self.__store['users'].append(user)
-        self.__store['user_count'] += 1
-        self.__store['max_user_count'] += 1
+
+            Raises:     DuplicateError if username or email is already taken
+        '''
+        name = normalise_key(user.get_name())
+        email = normalise_key(user.get_email())
+        with self.__lock:
+            if name in self.__store['user_names']:
+                raise DuplicateError("Username already taken")
+            if email in self.__store['user_emails']:
+                raise DuplicateError("Email already registered")
+
+            self.__store['users'][user.get_id()] = user
+            self.__store['user_order'].append(user.get_id())
+            self.__store['user_names'][name] = user.get_id()
+            self.__store['user_emails'][email] = user.get_id()
+            self.__store['user_count'] += 1
+            self.__store['max_user_count'] += 1
+            self.retain_docs(user)
     
     def add_api(self, api: T) -> None:
         '''
             Adds an API into the datastore
         '''
-        self.__store['apis'].append(api)
+        self.__store['apis'][api.get_id()] = api
+        self.__store['api_order'].append(api.get_id())
         self.__store['api_count'] += 1
         self.__store['max_api_count'] += 1
+        api.set_store(self)
+        self.index_api(api)
+        self.index_status(api.get_id())
+        self.retain_docs(api)
+
+    ##################################
+    #   Datastore Index Methods
+    ##################################
+    def index_api(self, api: T) -> None:
+        '''
+            (Re)indexes an api under its current tags, owner and pay model,
+            and its searchable text. Should be called whenever any of those
+            change - apis not in the datastore are ignored
+        '''
+        if api.get_id() not in self.__store['apis']:
+            return
+
+        self.__index_fields(api)
+        self.refresh_tag_ranking(api)
+
+    def __index_fields(self, api: T) -> None:
+        '''
+            Indexes an api's searchable text, tags, owner and pay model
+        '''
+        sid = api.get_id()
+        endpoints = [endpoint.get('title_description', '') if isinstance(endpoint, dict)
+                     else endpoint.title_description
+                     for endpoint in api.get_endpoints()]
+        self.__store['search_index'].add(sid, {
+            'name': [api.get_name()],
+            'description': [api.get_description()],
+            'tags': api.get_tags(),
+            'endpoints': endpoints
+        })
+
+        keys = (tuple(api.get_tags()), api.get_owner().get_id(), api.get_pay_model())
+        if self.__store['api_keys'].get(sid) == keys:
+            return
+
+        self.unindex_api(sid)
+        for tag in keys[0]:
+            self.__store['tag_index'].setdefault(tag, set()).add(sid)
+        self.__store['provider_index'].setdefault(keys[1], set()).add(sid)
+        insort(self.__store['provider_order'].setdefault(keys[1], []),
+               (self.__store['api_order'].seq(sid), sid))
+        self.__store['pay_model_index'].setdefault(keys[2], set()).add(sid)
+        self.__store['api_keys'][sid] = keys
+
+    def unindex_api(self, sid: str) -> None:
+        '''
+            Removes an api from the tag, provider and pay model indexes
+        '''
+        keys = self.__store['api_keys'].pop(sid, None)
+        if keys is None:
+            return
+
+        tags, owner, pay_model = keys
+        for tag in tags:
+            self.__discard_index('tag_index', tag, sid)
+        self.__discard_index('provider_index', owner, sid)
+        self.__discard_index('pay_model_index', pay_model, sid)
+
+        # Must run before the api leaves the catalogue order
+        order = self.__store['provider_order'][owner]
+        del order[bisect_left(order, (self.__store['api_order'].seq(sid), sid))]
+        if not order:
+            del self.__store['provider_order'][owner]
+
+    def __discard_index(self, index: str, key: str, sid: str) -> None:
+        '''
+            Removes sid from index[key], dropping the key once empty
+        '''
+        sids = self.__store[index].get(key)
+        if sids is None:
+            return
+        sids.discard(sid)
+        if not sids:
+            del self.__store[index][key]
+
+    def __lookup_index(self, index: str, keys: List[str]) -> Set[str]:
+        '''
+            Returns the union of sids stored under any of the given keys
+        '''
+        sids = set()
+        for key in keys:
+            sids |= self.__store[index].get(key, set())
+        return sids
+
+    def index_status(self, sid: str) -> None:
+        '''
+            (Re)indexes a service under its status and its versions'
+            statuses. Should be called whenever any of those change - sids
+            not in the datastore are ignored
+        '''
+        api = self.__store['apis'].get(sid)
+        if api is None:
+            return
+
+        self.__unindex_status(sid)
+        status = api.get_status().value
+        versions = {version.get_status().value for version in api.get_all_versions()}
+        self.__store['status_index'].setdefault(status, set()).add(sid)
+        for value in versions:
+            self.__store['version_status_index'].setdefault(value, set()).add(sid)
+        self.__store['api_statuses'][sid] = (status, versions)
+
+    def __unindex_status(self, sid: str) -> None:
+        '''
+            Removes a service from the status indexes
+        '''
+        keys = self.__store['api_statuses'].pop(sid, None)
+        if keys is None:
+            return
+
+        status, versions = keys
+        self.__discard_index('status_index', status, sid)
+        for value in versions:
+            self.__discard_index('version_status_index', value, sid)
+
+    def refresh_tag_ranking(self, api: T) -> None:
+        '''
+            Recounts which tags a service contributes to in the tag ranking.
+            A live service counts towards each of its tags it has been
+            approved under - apis not in the datastore are ignored
+        '''
+        sid = api.get_id()
+        if self.__store['apis'].get(sid) is not api:
+            return
+
+        counted = set()
+        if api.get_status().value == LIVE:
+            for name in api.get_tags():
+                tag = self.__store['tag_names'].get(name)
+                if tag is not None and sid in tag.get_servers():
+                    counted.add(name)
+        self.__set_live_tags(sid, counted)
+        self.__train_suggester(api, counted)
+
+    def __train_suggester(self, api: T, tags: Set[str]) -> None:
+        '''
+            Trains the tag suggester on a service under the tags it is
+            counted under (forgetting it if there are none)
+        '''
+        self.__store['tag_suggester'].add(api.get_id(),
+                                          [api.get_name(), api.get_description()],
+                                          tags)
+
+    def __set_live_tags(self, sid: str, counted: Set[str]) -> None:
+        '''
+            Updates the live counts of tags so that sid is counted under
+            exactly the given tag names, re-ranking only the changed tags
+        '''
+        previous = self.__store['tag_live'].pop(sid, set())
+        if counted:
+            self.__store['tag_live'][sid] = counted
+
+        for name in previous ^ counted:
+            tag = self.__store['tag_names'].get(name)
+            if tag is None:
+                continue
+            self.__unrank_tag(tag)
+            if name in counted:
+                tag.add_live_server(sid)
+            else:
+                tag.remove_live_server(sid)
+            self.__rank_tag(tag)
+
+    def __tag_rankings(self, tag: Tag) -> List[list]:
+        '''
+            Returns the ranking lists a tag belongs to
+        '''
+        if tag.get_type() == CUSTOM:
+            return [self.__store['tag_ranking'], self.__store['custom_tag_ranking']]
+        return [self.__store['tag_ranking']]
+
+    def __rank_tag(self, tag: Tag) -> None:
+        '''
+            Inserts a tag into its ranking lists at its current position
+        '''
+        key = tag_rank_key(tag)
+        for ranking in self.__tag_rankings(tag):
+            insort(ranking, key)
+
+    def __unrank_tag(self, tag: Tag) -> None:
+        '''
+            Removes a tag from its ranking lists - must be called before
+            its live count changes
+        '''
+        key = tag_rank_key(tag)
+        for ranking in self.__tag_rankings(tag):
+            del ranking[bisect_left(ranking, key)]
 
     def add_tag(self, tag: T) -> Union[None, T]:
         '''
@@ -92,12 +534,14 @@ class Datastore:
         '''    
 
         # Shield against duplicates
-        if tag in [tag.get_tag() for tag in self.__store['tags']]:
+        if tag in self.__store['tag_names']:
             return None
 
         # Create new tag
         new_tag = Tag(self.__store['max_tag_count'], tag, CUSTOM)
         self.__store['tags'].append(new_tag)
+        self.__store['tag_names'][tag] = new_tag
+        self.__rank_tag(new_tag)
         self.__store['tag_count'] += 1
         self.__store['max_tag_count'] += 1
         return new_tag
@@ -112,39 +556,123 @@ class Datastore:
         '''
             Adds a document to the datastore
         '''
-        self.__store['docs'].append(doc)
+        self.__store['docs'][doc.get_id()] = doc
         self.__store['docs_count'] += 1
+        if doc.get_hash() is not None:
+            self.__store['doc_hashes'][doc.get_hash()] = doc.get_id()
+        self.__store['doc_uploads'][doc.get_id()] = time.time()
+
+    def reupload_doc(self, doc: T) -> None:
+        '''
+            Records a document being uploaded again, restarting its grace
+            period (see release_doc)
+        '''
+        self.__store['doc_uploads'][doc.get_id()] = time.time()
+
+    ##################################
+    #   Document Reference Methods
+    ##################################
+    def retain_doc(self, doc_id: str) -> None:
+        '''
+            Counts a reference to a document, eg. as an icon
+        '''
+        refs = self.__store['doc_refs']
+        refs[doc_id] = refs.get(doc_id, 0) + 1
+
+    def release_doc(self, doc_id: str) -> Optional[T]:
+        '''
+            Drops a reference to a document. Once nothing refers to it, a
+            document stored by content which was not uploaded in the last
+            DOC_GRACE seconds is removed, and returned so that its file
+            can be deleted
+        '''
+        store = self.__store
+        count = store['doc_refs'].get(doc_id, 0) - 1
+        if count > 0:
+            store['doc_refs'][doc_id] = count
+            return None
+        store['doc_refs'].pop(doc_id, None)
+
+        doc = store['docs'].get(doc_id)
+        if doc is None or doc.get_hash() is None:
+            return None
+        if time.time() - store['doc_uploads'].get(doc_id, 0) < DOC_GRACE:
+            return None
+
+        del store['docs'][doc_id]
+        store['doc_uploads'].pop(doc_id, None)
+        if store['doc_hashes'].get(doc.get_hash()) == doc_id:
+            del store['doc_hashes'][doc.get_hash()]
+        return doc
+
+    def retain_docs(self, item: T) -> None:
+        '''
+            Counts the documents a user or service refers to
+        '''
+        for doc_id in doc_references(item):
+            self.retain_doc(doc_id)
+
+    def get_doc_refs(self, doc_id: str) -> int:
+        '''
+            Returns the number of references to a document
+        '''
+        return self.__store['doc_refs'].get(doc_id, 0)
 
     def add_review(self, review: T) -> None:
         '''
             Adds a review to the datastore
         '''
-        self.__store['reviews'].append(review)
+        self.__store['reviews'][review.get_id()] = review
+        self.__store['review_order'].append(review.get_id())
+        self.__rank_review(review)
         self.__store['review_count'] += 1
         self.__store['review_total'] += 1
 
+    def __rank_review(self, review: T) -> None:
+        '''
+            Ranks a review among its service's reviews by net vote
+        '''
+        ranking = self.__store['review_ranking'].setdefault(review.get_service(), VoteRanking())
+        ranking.add(review.get_id(), self.__store['review_order'].seq(review.get_id()),
+                    review.get_net_vote())
+        review.set_ranking(ranking)
+
     def add_reply(self, reply: T) -> None:
         '''
             Adds a reply to the datastore
         '''
-        self.__store['replys'].append(reply)
+        self.__store['replys'][reply.get_id()] = reply
         self.__store['reply_count'] += 1
         self.__store['reply_total'] += 1
 
     ################################
     #   Datastore Search Methods
     ################################
+    def get_user_seq(self, uid: str) -> int:
+        '''
+            Returns a user's position in creation order
+        '''
+        return self.__store['user_order'].seq(uid)
+
     def get_users(self) -> List[User]:
         '''
             Returns a list of all users
         '''
-        return self.__store['users']
+        return list(self.__store['users'].values())
+
+    def iter_users(self, after: Optional[int] = None) -> Iterator[User]:
+        '''
+            Yields users in creation order, starting after the user with
+            sequence number 'after' (see get_user_seq)
+        '''
+        users = self.__store['users']
+        return (users[uid] for uid in self.__store['user_order'].after(after))
     
     def get_apis(self) -> List[T]:
         '''
             Returns a list of all apis
         '''
-        return self.__store['apis']
+        return list(self.__store['apis'].values())
     
     def get_tags(self) -> List[T]:
         '''
@@ -162,132 +690,240 @@ class Datastore:
         '''
             Returns a tag given a tag-name, else None
         '''
-        for item in self.__store['tags']:
-            if item.get_tag() == tag:
-                return item
-            
-        return None
+        return self.__store['tag_names'].get(tag)
 
     def get_tag_ranking(self, num: int, custom: bool) -> list[dict[str, str | int]]:
         '''
             Returns a list of 'num' tags {tag: str, amt: int} in desc order
+            of live services using them (all tags in use if num is -1)
         '''
-        # Sort list of tags 
-        tags = []
-        if custom:
-            tags = [tag for tag in self.__store['tags'] if tag.get_type() == CUSTOM]
-            tags.sort(key=lambda x : (-len(x.get_servers()), x.get_tag().lower()))
-        else:
-            tags = sorted(self.__store['tags'], key=lambda x : (-len(x.get_servers()), x.get_tag().lower()))
+        ranking = self.__store['custom_tag_ranking' if custom else 'tag_ranking']
 
-        # Screen for unapproved services
+        # Ranking is kept sorted, so stop at the first unused tag
         output = []
-        for tag in tags:
-            for _service in tag.get_servers():
-                service = self.get_api_by_id(_service)
-                if service.get_status().value == LIVE and tag not in output:
-                    output.append(tag)
-        
-        if len(output) < num or num == -1:
-            return {
-                'tags': [tag.to_json() for tag in output]
-            }
+        for neg_live, _, _, tag in ranking:
+            if neg_live == 0 or len(output) == num:
+                break
+            output.append(tag.to_json())
 
         return {
-            'tags': [tag.to_json() for tag in output[:num]]
+            'tags': output
         }
 
+    def filter_apis(self,
+                    tags: Optional[List[str]],
+                    providers: Optional[List[str]],
+                    pay_models: Optional[List[str]],
+                    statuses: Optional[Iterable[Enum]] = None) -> List[T]:
+        '''
+            Returns apis (in catalogue order) carrying any of the given tags,
+            owned by any of the given providers, using any of the given pay
+            models and in any of the given statuses. An empty/None criterion
+            does not filter
+        '''
+        sids = self.filter_api_ids(tags, providers, pay_models, statuses)
+        if sids is None:
+            return self.get_apis()
+        return self.get_apis_in_order(sids)
+
+    def filter_api_ids(self,
+                       tags: Optional[List[str]],
+                       providers: Optional[List[str]],
+                       pay_models: Optional[List[str]],
+                       statuses: Optional[Iterable[Enum]] = None) -> Optional[Set[str]]:
+        '''
+            Returns the ids of apis matching the criteria of filter_apis
+            (unordered), or None if there are no criteria
+        '''
+        sids = None
+        for index, keys in [('tag_index', tags),
+                            ('provider_index', providers),
+                            ('pay_model_index', pay_models),
+                            ('status_index', statuses and [status.value for status in statuses])]:
+            if not keys:
+                continue
+            matched = self.__lookup_index(index, keys)
+            sids = matched if sids is None else sids & matched
+        return sids
+
+    def get_api_ids_by_status(self, statuses: Iterable[Enum], versions: bool = False) -> Set[str]:
+        '''
+            Returns the ids of apis in any of the given statuses, or with a
+            version in any of them if versions
+        '''
+        index = 'version_status_index' if versions else 'status_index'
+        return self.__lookup_index(index, [status.value for status in statuses])
+
+    def get_apis_in_order(self, sids: Iterable[str]) -> List[T]:
+        '''
+            Returns the apis with the given ids, in catalogue order
+        '''
+        seq = self.__store['api_order'].seq
+        return [self.__store['apis'][sid] for sid in sorted(sids, key=seq)]
+
+    def iter_apis(self, after: Optional[int] = None) -> Iterator[T]:
+        '''
+            Yields apis in catalogue order, starting after the api at
+            catalogue position 'after' (see get_api_seq)
+        '''
+        apis = self.__store['apis']
+        return (apis[sid] for sid in self.__store['api_order'].after(after))
+
+    def get_api_seq(self, sid: str) -> int:
+        '''
+            Returns an api's position in the catalogue order
+        '''
+        return self.__store['api_order'].seq(sid)
+
+    def search_apis(self, query: str, statuses: Optional[Iterable[Enum]] = None) -> List[T]:
+        '''
+            Returns apis whose name, description, tags or endpoint titles
+            match the query, best match first (ties in catalogue order).
+            A query without any searchable tokens matches every api. If
+            statuses are given, only apis in those statuses are returned
+        '''
+        if not tokenize(query):
+            return self.filter_apis(None, None, None, statuses)
+
+        scores = self.search_scores(query)
+        matched = scores
+        if statuses:
+            listed = self.get_api_ids_by_status(statuses)
+            matched = [sid for sid in scores if sid in listed]
+        seq = self.__store['api_order'].seq
+        ranked = sorted(matched, key=lambda sid: (-scores[sid], seq(sid)))
+        return [self.__store['apis'][sid] for sid in ranked]
+
+    def search_scores(self, query: str) -> Dict[str, float]:
+        '''
+            Returns {sid: score} of apis matching the query (higher is better)
+        '''
+        return self.__store['search_index'].search(query)
+
+    def suggest_tags(self, description: str, num: int) -> List[str]:
+        '''
+            Returns up to num existing tags suited to a description, best
+            first, judged by the live services using each tag
+        '''
+        suggestions = self.__store['tag_suggester'].suggest(description, num)
+        return [tag for tag, _ in suggestions if tag in self.__store['tag_names']]
+
     def get_docs(self) -> List[T]:
         '''
-            Returns a list of all users
+            Returns a list of all docs
         '''
-        return self.__store['docs']
+        return list(self.__store['docs'].values())
 
     def get_api_by_id(self, eid: str) -> T | None:
         '''
             Returns with the given ID, or None if cannot find user
         '''
-        for item in self.__store['apis']:
-            if item.get_id() == eid:
-                return item
-        
-        return None
+        return self.__store['apis'].get(eid)
 
     def get_user_by_id(self, eid: str) -> T | None:
         '''
             Returns with user obj base on given ID, or None if cannot find user
         '''
-        for item in self.__store['users']:
-            if item.get_id() == eid:
-                return item
-
-        return None
+        return self.__store['users'].get(eid)
 
     def get_user_by_name(self, name: str) -> T | None:
         '''
-            Returns with user obj based on username, or None if cannot find user
+            Returns with user obj based on username (case-insensitive), or
+            None if cannot find user
         '''
-        for item in self.__store['users']:
-            if item.get_name() == name:
-                return item
-            
-        return None
+        uid = self.__store['user_names'].get(normalise_key(name))
+        return self.__store['users'].get(uid)
     
     def get_user_by_email(self, email: str) -> T | None:
         '''
-            Returns with user obj based on email, or None if cannot find user
+            Returns with user obj based on email (case-insensitive), or None
+            if cannot find user
+        '''
+        uid = self.__store['user_emails'].get(normalise_key(email))
+        return self.__store['users'].get(uid)
+
+    def get_users_by_ids(self, uids: Iterable[str]) -> Dict[str, T]:
+        '''
+            Returns {uid: user} of the given ids, skipping unknown ids
         '''
-        for item in self.__store['users']:
-            if item.get_email() == email:
-                return item
-            
-        return None
+        users = self.__store['users']
+        return {uid: users[uid] for uid in uids if uid in users}
 
     def get_doc_by_id(self, eid: str) -> T | None:
         '''
             Returns with user obj base on given ID, or None if cannot find user
         '''
-        for item in self.__store['docs']:
-            if item.get_id() == eid:
-                return item
+        return self.__store['docs'].get(eid)
 
-        return None
+    def get_doc_by_hash(self, sha256: str) -> T | None:
+        '''
+            Returns the document stored with the given content digest, or
+            None if there is none
+        '''
+        return self.__store['docs'].get(self.__store['doc_hashes'].get(sha256))
 
     def get_review_by_id(self, rid: str) -> T | None:
         '''
             Retrieves a review by id if it exists, else None
         '''
-        for item in self.__store['reviews']:
-            if item.get_id() == rid:
-                return item
+        return self.__store['reviews'].get(rid)
 
-        return None
+    def get_reviews_by_ids(self, rids: Iterable[str]) -> List[T]:
+        '''
+            Returns the reviews with the given ids, in order, skipping
+            unknown ids
+        '''
+        reviews = self.__store['reviews']
+        return [review for review in map(reviews.get, rids) if review is not None]
 
     def get_reviews(self) -> List[T]:
         '''
             Gets all reviews
         '''
-        return self.__store['reviews']
+        return list(self.__store['reviews'].values())
+
+    def get_review_seq(self, rid: str) -> int:
+        '''
+            Returns a review's position in creation order
+        '''
+        return self.__store['review_order'].seq(rid)
+
+    def iter_reviews(self, after: Optional[int] = None) -> Iterator[T]:
+        '''
+            Yields reviews in creation order, starting after the review with
+            sequence number 'after' (see get_review_seq)
+        '''
+        reviews = self.__store['reviews']
+        return (reviews[rid] for rid in self.__store['review_order'].after(after))
+
+    def get_review_ranking(self, sid: str) -> VoteRanking:
+        '''
+            Returns a service's reviews ranked by net vote (empty if it has
+            none)
+        '''
+        return self.__store['review_ranking'].get(sid, VoteRanking())
 
     def get_user_apis(self, eid: str) -> List[T]:
         '''
             Returns a list of APIs owned by the user with the given user ID.
         '''
-        user_apis = []
-        for item in self.__store['apis']:
-            owner = item.get_owner()
-            if str(eid) in owner.get_id():
-                api_info = {
-                    'id': item.get_id(),
-                    'name': item.get_name(),
-                    'owner': owner.get_displayname(),
-                    'description': item.get_description(),
-                    'icon_url': item.get_icon_url(),
-                    'tags': item.get_tags(),
-                    'pay_model': item.get_pay_model()
-                }
-                user_apis.append(api_info)
-        return user_apis
+        return [api.to_summary_json() for api in self.get_user_api_objects(eid)]
+
+    def get_user_api_objects(self, eid: str) -> List[T]:
+        '''
+            Returns the APIs owned by a user, in catalogue order
+        '''
+        return list(self.iter_user_apis(eid))
+
+    def iter_user_apis(self, eid: str, after: Optional[int] = None) -> Iterator[T]:
+        '''
+            Yields the APIs owned by a user in catalogue order, starting
+            after the api at catalogue position 'after' (see get_api_seq)
+        '''
+        order = self.__store['provider_order'].get(str(eid), [])
+        i = 0 if after is None else bisect_left(order, (after + 1,))
+        apis = self.__store['apis']
+        return (apis[order[j][1]] for j in range(i, len(order)))
 
     def num_users(self) -> int:
         '''
@@ -347,17 +983,21 @@ class Datastore:
         '''
             Retrieves a reply by id if it exists, else None
         '''
-        for item in self.__store['replys']:
-            if item.get_id() == rid:
-                return item
+        return self.__store['replys'].get(rid)
 
-        return None
+    def get_replies_by_ids(self, rids: Iterable[str]) -> List[T]:
+        '''
+            Returns the replies with the given ids, in order, skipping
+            unknown ids
+        '''
+        replies = self.__store['replys']
+        return [reply for reply in map(replies.get, rids) if reply is not None]
 
     def get_replies(self) -> List[T]:
         '''
             Returns all replies made
         '''
-        return self.__store['replys']
+        return list(self.__store['replys'].values())
     
     def total_replies(self) -> int:
         '''
@@ -365,6 +1005,43 @@ class Datastore:
         '''
         return self.__store['reply_total']
 
+    ################################
+    #   Datastore Modify Methods
+    ################################
+    def modify_username(self, uid: str, new: str) -> None:
+        '''
+            Changes a user's username, keeping the username index unique
+
+            Raises:     DuplicateError if username is already taken
+        '''
+        new_key = normalise_key(new)
+        with self.__lock:
+            user = self.__store['users'][uid]
+            owner = self.__store['user_names'].get(new_key)
+            if owner is not None and owner != uid:
+                raise DuplicateError("Username already taken")
+
+            del self.__store['user_names'][normalise_key(user.get_name())]
+            self.__store['user_names'][new_key] = uid
+            user.modify_username(new)
+
+    def modify_email(self, uid: str, new: str) -> None:
+        '''
+            Changes a user's email, keeping the email index unique
+
+            Raises:     DuplicateError if email is already registered
+        '''
+        new_key = normalise_key(new)
+        with self.__lock:
+            user = self.__store['users'][uid]
+            owner = self.__store['user_emails'].get(new_key)
+            if owner is not None and owner != uid:
+                raise DuplicateError("Email already registered")
+
+            del self.__store['user_emails'][normalise_key(user.get_email())]
+            self.__store['user_emails'][new_key] = uid
+            user.modify_email(new)
+
     ################################
     #   Datastore Deletion Methods
     ################################
@@ -372,31 +1049,65 @@ class Datastore:
         '''
             Deletes an item from the database (not tags)
         '''
+        self.delete_items([eid], i_type)
+
+    def delete_items(self, eids: Iterable[str], i_type: Literal['user', 'api', 'review', 'reply']) -> None:
+        '''
+            Deletes several items of one type from the database (not tags),
+            updating each index once for the whole batch
+        '''
         search_term = i_type + "s"
         term_count = i_type + "_count"
-        for item in self.__store[search_term]:
-            if item.get_id() == eid:
-                self.__store[search_term].remove(item)
-                self.__store[term_count] -= 1
+        with self.__lock:
+            items = self.__store[search_term]
+            deleted = {eid: items.pop(eid) for eid in eids if eid in items}
+            if not deleted:
                 return
 
+            self.__store[term_count] -= len(deleted)
+            if i_type == 'api':
+                for eid, item in deleted.items():
+                    item.set_store(None)
+                    self.unindex_api(eid)
+                    self.__unindex_status(eid)
+                    self.__store['search_index'].remove(eid)
+                    self.__store['tag_suggester'].remove(eid)
+                    self.__set_live_tags(eid, set())
+                self.__store['api_order'].remove_many(deleted)
+            elif i_type == 'review':
+                self.__store['review_order'].remove_many(deleted)
+                rankings = self.__store['review_ranking']
+                for eid, item in deleted.items():
+                    ranking = rankings.get(item.get_service())
+                    if ranking is not None:
+                        ranking.remove(eid)
+                        if not ranking:
+                            del rankings[item.get_service()]
+                    item.set_ranking(None)
+            elif i_type == 'user':
+                self.__store['user_order'].remove_many(deleted)
+                for item in deleted.values():
+                    del self.__store['user_names'][normalise_key(item.get_name())]
+                    del self.__store['user_emails'][normalise_key(item.get_email())]
+
     def delete_tag(self, tag: str) -> Union[None, bool]:
         ''''
             Deletes a tag from the database & corresponding servers
         '''
-        for _tag in self.__store['tags']:
-            if _tag.get_tag() == tag:
+        _tag = self.__store['tag_names'].get(tag)
+        if _tag is None:
+            return None
 
-                # Disassociate tag from each server
-                for server in _tag.get_servers():
-                    server.remove_tag(tag)
+        # Disassociate tag from each server
+        for sid in list(self.__store['tag_index'].get(tag, [])):
+            self.__store['apis'][sid].remove_tag(tag)
 
-                # Remove tag from store
-                self.__store['tags'].remove(_tag)
-                self.__store['tag_count'] -= 1
-                return True
-            
-        return None
+        # Remove tag from store
+        self.__unrank_tag(_tag)
+        del self.__store['tag_names'][tag]
+        self.__store['tags'].remove(_tag)
+        self.__store['tag_count'] -= 1
+        return True
 
 global data_store
 data_store = Datastore()
@@ -1,36 +1,16 @@
 from pydantic import BaseModel, ConfigDict
 from typing import Optional
-from passlib.context import CryptContext
 from pymongo import MongoClient
 from typing import *
-from bson import ObjectId
 from src.backend.database import db
 from src.backend.classes.Endpoint import Endpoint
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 class User(BaseModel):
     username: str
     password: str
     is_admin: bool
     is_super: bool
 
-    @classmethod
-    def create(cls, username: str, password: str, is_admin: bool, is_super: bool, db) -> None:
-        hashed_password = pwd_context.hash(password)
-        user_data = {
-            "_id": ObjectId(),
-            "username": username,
-            "password": hashed_password, 
-            "is_admin": is_admin,
-            "is_super": is_super}
-        db.users.insert_one(user_data)
-
-    @classmethod
-    def get(cls, username: str, db) -> Optional[dict]:
-        return db.users.find_one({"username": username})
-
 class UserCreate(BaseModel):
     displayname: str
     username: str
@@ -1,88 +1,408 @@
-from pymongo import MongoClient
-from typing import TypeVar, Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, DeleteOne
+from typing import TypeVar, Optional, Callable, Iterable, List, Union
 from dotenv import load_dotenv
+import asyncio
+import gc
 import os
+import time
+from src.backend.classes.API import API
+from src.backend.classes.Document import Document
+from src.backend.classes.Review import Review
+from src.backend.classes.ReviewReply import ReviewReply
+from src.backend.classes.Tag import Tag
+from src.backend.classes.User import User
 
 T = TypeVar("T")
 K = TypeVar("K")
 
 mongo_env = os.getenv('MONGO_ENV', 'local')
 
+# Connection pool - requests share these connections, waiting at most
+# WAIT_QUEUE_TIMEOUT_MS for one to free up
+MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 10))
+MAX_IDLE_TIME_MS = 60_000
+WAIT_QUEUE_TIMEOUT_MS = 5_000
+SERVER_SELECTION_TIMEOUT_MS = 5_000
+
 if mongo_env == 'docker':
-    client = MongoClient("mongodb://mongodb:27017/", connect=False)
+    mongo_uri = "mongodb://mongodb:27017/"
 else:
-    client = MongoClient("mongodb://localhost:27017/", connect=False)
+    mongo_uri = "mongodb://localhost:27017/"
+
+client = AsyncIOMotorClient(mongo_uri,
+                            maxPoolSize=MAX_POOL_SIZE,
+                            minPoolSize=MIN_POOL_SIZE,
+                            maxIdleTimeMS=MAX_IDLE_TIME_MS,
+                            waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                            serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS)
 
 global db
 db = client.local
 
+FLUSH_SIZE = 256        # Pending writes which trigger a flush
+FLUSH_INTERVAL = 0.25   # Max seconds a write waits before being flushed
+LOAD_BATCH_SIZE = 10_000    # Documents fetched per cursor batch when warm starting
+
+
+class WriteBehindQueue:
+
+    '''
+        Buffers updates to stored objects and writes them to MongoDB in batches
+
+        Queued objects (Users and Services) track which of their fields
+        changed, and are only turned into $set/$push/$pull update documents
+        when flushed - so repeated updates to one object coalesce into a
+        single write of everything changed since its last flush. Reviews,
+        replies, docs and tags are small, and are upserted in full.
+        Deletions are queued too, replacing any pending update of the
+        document. Pending writes are flushed with one bulk_write per
+        collection once flush_size are queued, or every flush_interval
+        seconds by the background flusher (see run). Without a running
+        flusher, reaching flush_size flushes before put returns.
+
+        Stores:
+            - pending:  (collection, id) -> (id field, object or None to
+                        delete, whether to upsert)
+    '''
+
+    def __init__(self,
+                 database,
+                 flush_size: int = FLUSH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL) -> None:
+        self._db = database
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._pending: dict[tuple[str, str], tuple[str, Optional[T], bool]] = {}
+        self._flush_lock = asyncio.Lock()   # Serialises flushes so writes land in order
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def queue(self, collection: str, key: str, eid: str, item: Optional[T], upsert: bool = False) -> bool:
+        '''
+            Queues writing item's changes to the document with
+            document[key] == eid (deleting it if item is None), from
+            synchronous code. Reaching flush_size wakes the background
+            flusher - returns whether it was reached
+        '''
+        self._pending[(collection, eid)] = (key, item, upsert)
+        if len(self._pending) < self._flush_size:
+            return False
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def put(self, collection: str, key: str, eid: str, item: T, upsert: bool = False) -> None:
+        '''
+            Queues writing item's changes to the document with document[key] == eid
+        '''
+        if self.queue(collection, key, eid, item, upsert) and self._wakeup is None:
+            await self.flush()
+
+    async def flush(self) -> None:
+        '''
+            Writes all pending updates. Failed batches - including ones
+            interrupted by cancellation - are re-queued in full and the
+            error is re-raised
+        '''
+        async with self._flush_lock:
+            batch, self._pending = self._pending, {}
+            if not batch:
+                return
+
+            ops: dict[str, list[Union[UpdateOne, DeleteOne]]] = {}
+            for (collection, eid), (key, item, upsert) in batch.items():
+                if item is None:
+                    ops.setdefault(collection, []).append(DeleteOne({key: eid}))
+                    continue
+                update = item.pop_changes()
+                if update:
+                    ops.setdefault(collection, []).append(UpdateOne({key: eid}, update, upsert=upsert))
+
+            try:
+                for collection, requests in ops.items():
+                    await self._db[collection].bulk_write(requests, ordered=False)
+            except BaseException:
+                # Which writes applied is unknown, so retry every field - $set is idempotent
+                for entry, write in batch.items():
+                    if write[1] is not None:
+                        write[1].mark_all_changed()
+                    self._pending.setdefault(entry, write)
+                raise
+
+    async def discard(self, collection: str) -> None:
+        '''
+            Drops pending writes to a collection
+        '''
+        async with self._flush_lock:
+            self._pending = {item: write for item, write in self._pending.items()
+                             if item[0] != collection}
+
+    async def discard_items(self, collection: str, eids: Iterable[str]) -> None:
+        '''
+            Drops pending writes to the given documents of a collection
+        '''
+        async with self._flush_lock:
+            for eid in eids:
+                self._pending.pop((collection, eid), None)
+
+    def num_pending(self) -> int:
+        '''
+            Returns number of documents waiting to be written
+        '''
+        return len(self._pending)
+
+    async def run(self) -> None:
+        '''
+            Background flusher - flushes every flush_interval seconds, or as
+            soon as flush_size writes are pending, until cancelled
+        '''
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print(f"Failed to flush writes to MongoDB: {e}")
+        finally:
+            self._wakeup = None
+
+global write_queue
+write_queue = WriteBehindQueue(db)
+
 ###################################
 #       Adding Methods
 ###################################
-def db_add_user(item: dict[T, K]) -> None:
+async def db_add_user(item: dict[T, K]) -> None:
     '''
         Adds a user into MongoDB
     '''
-    db.users.insert_one(item)
+    await db.users.insert_one(item)
 
-def db_add_service(item: dict[T, K]) -> None:
+async def db_add_service(item: dict[T, K]) -> None:
     '''
         Adds a service into MongoDB
     '''
-    db.services.insert_one(item)
+    await db.services.insert_one(item)
 
 
 ###################################
 #       Get Methods
 ###################################
-def db_get_user(uid: str) -> dict[T, K] | None:
+async def db_get_user(uid: str) -> dict[T, K] | None:
     '''
         Grabs user from MongoDB
     '''
-    return db.users.find_one({"id": uid})
+    await write_queue.flush()
+    return await db.users.find_one({"id": uid})
 
-def db_get_service(sid: str) -> dict[T, K] | None:
+async def db_get_service(sid: str) -> dict[T, K] | None:
     '''
         Grabs service from MongoDB
     '''
-    return db.services.find_one({'id': sid})
+    await write_queue.flush()
+    return await db.services.find_one({'id': sid})
 
 ###################################
 #       Update (put) Methods
 ###################################
 
-def db_update_user(uid: str, new_user: dict[T, K]) -> None:
+async def db_update_user(uid: str, user: T) -> None:
+    '''
+        Queues writing a user's changed fields to MongoDB
+    '''
+    await write_queue.put('users', 'id', uid, user)
+
+async def db_update_service(sid: str, service: T) -> None:
+    '''
+        Queues writing a service's changed fields to MongoDB
+    '''
+    await write_queue.put('services', 'id', sid, service)
+
+###################################
+#       Queued (synchronous) Methods
+###################################
+
+# Field each collection's documents are identified by
+KEYS = {
+    'users': 'id',
+    'services': 'id',
+    'reviews': 'rid',
+    'replies': 'rid',
+    'docs': 'id',
+    'tags': 'tid'
+}
+
+def db_queue_user(uid: str, user: T) -> None:
+    '''
+        Queues writing a user's changed fields to MongoDB, from synchronous code
+    '''
+    write_queue.queue('users', 'id', uid, user)
+
+def db_queue_service(sid: str, service: T) -> None:
+    '''
+        Queues writing a service's changed fields to MongoDB, from synchronous code
+    '''
+    write_queue.queue('services', 'id', sid, service)
+
+def db_queue_review(rid: str, review: T) -> None:
+    '''
+        Queues writing (or creating) a review in MongoDB
+    '''
+    write_queue.queue('reviews', 'rid', rid, review, upsert=True)
+
+def db_queue_reply(rid: str, reply: T) -> None:
+    '''
+        Queues writing (or creating) a review reply in MongoDB
+    '''
+    write_queue.queue('replies', 'rid', rid, reply, upsert=True)
+
+def db_queue_doc(doc_id: str, doc: T) -> None:
+    '''
+        Queues writing (or creating) a document in MongoDB
+    '''
+    write_queue.queue('docs', 'id', doc_id, doc, upsert=True)
+
+def db_queue_tag(tid: int, tag: T) -> None:
+    '''
+        Queues writing (or creating) a tag in MongoDB
+    '''
+    write_queue.queue('tags', 'tid', tid, tag, upsert=True)
+
+def db_queue_delete(collection: str, eid: str) -> None:
+    '''
+        Queues deleting a document from MongoDB, dropping any write of it
+        still queued
+    '''
+    write_queue.queue(collection, KEYS[collection], eid, None)
+
+###################################
+#       Loading Methods
+###################################
+
+async def db_load_all(collection: str, build: Callable[[dict[T, K]], T], database=None) -> List[T]:
     '''
-        Update a mongodb user into MongoDB
+        Streams every document of a collection, building an object from each.
+        Documents which build returns None for are skipped
     '''
-    db.users.replace_one({"id": uid}, new_user)
+    database = db if database is None else database
+    cursor = database[collection].find({}, {'_id': 0}, batch_size=LOAD_BATCH_SIZE)
+    items = []
+    while batch := await cursor.to_list(LOAD_BATCH_SIZE):
+        items.extend(item for item in map(build, batch) if item is not None)
+    return items
 
-def db_update_service(sid: str, updated_service_object: dict[T, K]) -> None:
+async def db_load_datastore(store, database=None) -> dict[str, float]:
     '''
-        Update a service into MongoDB
+        Warm start - replaces the datastore's contents with the users,
+        services, reviews, replies, tags and documents stored in MongoDB.
+        Returns the seconds spent loading each collection, rebuilding the
+        datastore's indexes ('index') and in total
     '''
-    db.services.replace_one({'id': sid}, updated_service_object)
+    database = db if database is None else database
+    await write_queue.flush()
+
+    # Loading allocates millions of long-lived objects, which would
+    # otherwise trigger repeated (useless) cyclic garbage collections
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return await _load_datastore(store, database)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+async def _load_datastore(store, database) -> dict[str, float]:
+    '''
+        Loads every collection into objects, then the datastore
+    '''
+    timings = {}
+    start = time.perf_counter()
+    loaded = {}
+    for collection, build in [('users', User.from_json),
+                              ('reviews', Review.from_json),
+                              ('replies', ReviewReply.from_json),
+                              ('tags', Tag.from_json),
+                              ('docs', Document.from_json)]:
+        began = time.perf_counter()
+        loaded[collection] = await db_load_all(collection, build, database)
+        timings[collection] = time.perf_counter() - began
+
+    # Services embed their owner, so are built against the loaded users
+    began = time.perf_counter()
+    users = {user.get_id(): user for user in loaded['users']}
+
+    def build_service(data: dict[T, K]) -> Optional[API]:
+        owner = users.get(data['owner']['id'])
+        return None if owner is None else API.from_json(data, owner)
+
+    loaded['services'] = await db_load_all('services', build_service, database)
+    timings['services'] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    store.load(loaded['users'], loaded['services'], loaded['reviews'],
+               loaded['replies'], loaded['tags'], loaded['docs'])
+    timings['index'] = time.perf_counter() - began
+    timings['total'] = time.perf_counter() - start
+    return timings
 
 ###################################
 #       Delete Methods
 ###################################
 
-def clear_all_users() -> None:
-    db.users.delete_many({})
+async def clear_all_users() -> None:
+    await write_queue.discard('users')
+    await db.users.delete_many({})
+
+async def clear_all_services() -> None:
+    await write_queue.discard('services')
+    await db.services.delete_many({})
 
-def clear_all_services() -> None:
-    db.services.delete_many({})
+async def clear_all_content() -> None:
+    '''
+        Clears every stored review, reply, document and tag
+    '''
+    for collection in ('reviews', 'replies', 'docs', 'tags'):
+        await write_queue.discard(collection)
+        await db[collection].delete_many({})
 
-def db_delete_service(name: str) -> None:
+async def db_delete_service(name: str) -> None:
     """
     Deletes a service from MongoDB by its name.
     """
-    db.services.delete_one({'name': name})
+    await db.services.delete_one({'name': name})
     return True
 
-def db_delete_user(username: str) -> None:
+async def db_delete_user(username: str) -> None:
     """
     Deletes a user from MongoDB by its username.
     """
-    db.users.delete_one({'username': username})
+    await db.users.delete_one({'username': username})
+    return True
+
+async def db_delete_cascade(uids: Iterable[str],
+                            sids: Iterable[str],
+                            rids: Iterable[str],
+                            reply_ids: Iterable[str]) -> bool:
+    '''
+        Deletes users, services, reviews and replies from MongoDB by id,
+        with one delete_many per collection, dropping any of their writes
+        still queued
+    '''
+    for collection, ids in [('users', uids),
+                            ('services', sids),
+                            ('reviews', rids),
+                            ('replies', reply_ids)]:
+        ids = list(ids)
+        if not ids:
+            continue
+        await write_queue.discard_items(collection, ids)
+        await db[collection].delete_many({KEYS[collection]: {'$in': ids}})
     return True
@@ -4,12 +4,13 @@ from pydantic import BaseModel
 from passlib.context import CryptContext
 from src.backend.classes.datastore import data_store
 from src.backend.classes.User import User
-from typing import Literal, TypeVar, List
+from typing import Literal, TypeVar, List, Optional
 from src.backend.database import *
-from src.backend.classes.Manager import manager
+from src.backend.classes.Manager import manager, invalidate_principal
 from src.backend.classes.Service import PENDING_OPTIONS
-from src.backend.server.email import send_email
+from src.backend.server.email import queue_email
 from src.backend.server.user import user_delete_association
+from src.backend.server.pagination import Page, page_in_order
 
 T = TypeVar("T")
 ADMIN = 'admin'
@@ -24,20 +25,21 @@ def is_valid_user(uid: str):
         raise HTTPException(status_code=404, detail='No user found with given uid')
 
 
-def promote_user(uid: str, is_super: bool):
+async def promote_user(uid: str, is_super: bool):
     is_valid_user(uid)
     user = data_store.get_user_by_id(uid)
     if user.get_is_admin():
         raise HTTPException(status_code=400, detail=f"User {user.get_name()} is already an admin.")
     if is_super:
         user.promote_to_admin()
+        invalidate_principal(uid)
     else:
         raise HTTPException(status_code=403, detail="Only Superadmin can promote users.")
-    db_update_user(uid, user.to_json())
+    await db_update_user(uid, user)
     username = user.get_name()
     return {"name": username, "status": user.get_is_admin()}
 
-def demote_user(uid: str, is_super: bool):
+async def demote_user(uid: str, is_super: bool):
     is_valid_user(uid)
     user = data_store.get_user_by_id(uid)
     if not user.get_is_admin():
@@ -45,40 +47,42 @@ def demote_user(uid: str, is_super: bool):
     target_is_super = user.get_is_super()
     if is_super and not target_is_super:
         user.demote_to_user()
+        invalidate_principal(uid)
     else:
         raise HTTPException(status_code=403, detail="Admins cannot demote other Admins.")
     username = user.get_name()
-    db_update_user(uid, user.to_json())
+    await db_update_user(uid, user)
     return {"name": username, "status": not user.get_is_admin()}
 
-def delete_user(uid: str, is_super: bool):
+async def delete_user(uid: str, is_super: bool):
     is_valid_user(uid)
     user = data_store.get_user_by_id(uid)
     username = user.get_name()
     target_is_super = user.get_is_super()
     target_is_admin = user.get_is_admin()
     if (is_super and not target_is_super):
-        user_delete_association(uid)
-        data_store.delete_item(uid, 'user')
-        db_status = db_delete_user(username)
+        db_status = await user_delete_association(uid)
     else:
         if target_is_super:
             raise HTTPException(status_code=403, detail="Admins cannot delete the Super Admin.")
         elif target_is_admin:
             raise HTTPException(status_code=403, detail="Admins cannot delete other Admins.")
         else:
-            user_delete_association(uid)
-            data_store.delete_item(uid, 'user')
-            db_status = db_delete_user(username)
+            db_status = await user_delete_association(uid)
     action = "admin"
     uname = username
     uemail = user.get_email()
     content = {'action': action, 'uname': uname}
-    send_email(uemail, '', 'account_deleted', content)
+    queue_email(uemail, '', 'account_deleted', content)
     return {"name": username, "deleted": db_status}
 
-def get_all_users():
-    users = data_store.get_users()
+def get_all_users(page: Optional[Page] = None):
+    if page is not None:
+        after = page.after('created')
+        users = page_in_order(data_store.iter_users(None if after is None else after[0]),
+                              page, 'created', lambda user: (data_store.get_user_seq(user.get_id()),))
+    else:
+        users = data_store.get_users()
     users_json = [user.to_json(include_password=False) for user in users]
     return {"users": users_json, "user_count": data_store.num_users()}
 
@@ -99,12 +103,19 @@ def admin_filter_users(standard: bool, admin: bool, super: bool):
                 return_list.append(user.to_json())
     return return_list
         
-def admin_get_reviews_wrapper() -> List[dict[str, str]]:
+def admin_get_reviews_wrapper(page: Optional[Page] = None) -> List[dict[str, str]]:
     '''
         Wrapper which returns all reviews which are pending 
     '''
+    if page is not None:
+        after = page.after('created')
+        listed = page_in_order(data_store.iter_reviews(None if after is None else after[0]),
+                               page, 'created', lambda review: (data_store.get_review_seq(review.get_id()),))
+    else:
+        listed = data_store.get_reviews()
+
     reviews = []
-    for review in data_store.get_reviews():
+    for review in listed:
         reviews.append(review.to_json(brief=True))
     
     return reviews
@@ -117,7 +128,10 @@ def admin_get_pending_services() -> List[dict[str, str]]:
     global_updates = []
     version_updates = []
 
-    for service in data_store.get_apis():    
+    # Only services awaiting approval themselves or in a version
+    pending = data_store.get_api_ids_by_status(PENDING_OPTIONS) | \
+              data_store.get_api_ids_by_status(PENDING_OPTIONS, versions=True)
+    for service in data_store.get_apis_in_order(pending):
 
         if service.get_status() in PENDING_OPTIONS:
             if service.get_newly_created():
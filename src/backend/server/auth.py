@@ -2,12 +2,13 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi_login import LoginManager
 from pydantic import BaseModel
 from passlib.context import CryptContext
-from src.backend.classes.datastore import data_store
+from src.backend.classes.datastore import data_store, DuplicateError
 from src.backend.classes.User import User
 from typing import Literal, TypeVar
 from src.backend.database import *
-from src.backend.classes.Manager import manager, SECRET, blacklisted_tokens
+from src.backend.classes.Manager import manager, SECRET, TOKEN_DURATION, revoked_tokens, invalidate_principal
 import jwt
+import time
 from datetime import datetime, timedelta, timezone
 import os
 from oauth2client import client, tools, file
@@ -18,7 +19,7 @@ import base64
 from dotenv import load_dotenv
 from pathlib import Path
 import os
-from src.backend.server.email import send_email
+from src.backend.server.email import queue_email
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -46,14 +47,14 @@ def verify_token(token: str):
         raise HTTPException(status_code=400, detail="Invalid verification token")
     
 # Login route
-def login_wrapper(username: str, password: str, verify: bool = _email) -> T:
+async def login_wrapper(username: str, password: str, verify: bool = _email) -> T:
     '''
         Wrapper used to handle logging in
     '''
     if data_store.num_users() == 0:
-        create_super_admin()
+        await create_super_admin()
     user = data_store.get_user_by_name(username)
-    if not user or not manager.verify_password(password, user.get_password()):
+    if not user or not await manager.verify_password(password, user.get_password()):
         raise HTTPException(status_code=400, detail="Invalid username or password")
 
     if verify:
@@ -62,61 +63,76 @@ def login_wrapper(username: str, password: str, verify: bool = _email) -> T:
 
     access_token = manager.create_access_token(data={"sub": user.get_id()})
     user.update_token(access_token)
+    invalidate_principal(user.get_id())
 
-    if access_token in blacklisted_tokens:
-        del blacklisted_tokens[access_token]
+    # Tokens issued within the same second are identical, so may be revoked
+    revoked_tokens.restore(access_token, time.time() + TOKEN_DURATION.total_seconds())
     return access_token
 
-def register_wrapper(displayname: str, name: str, password: str, email: str, verify: bool = _email) -> str:
+async def register_wrapper(displayname: str, name: str, password: str, email: str, verify: bool = _email) -> str:
     '''
         Handles registering a new user    
     '''
     print("registering user....")
     if data_store.num_users() == 0:
-        create_super_admin()
+        await create_super_admin()
+    # Cheap pre-check so taken names fail before hashing; add_user re-checks
+    # atomically in case a concurrent registration claimed them meanwhile
     if data_store.get_user_by_name(name):
         raise HTTPException(status_code=400, detail="Username already taken")
     if data_store.get_user_by_email(email):
         raise HTTPException(status_code=400, detail="Email already registered")
+
+    # Hash before picking an id, so concurrent registrations get distinct ids
+    hashed = await manager.hash_password(password)
     new_user = User(str(data_store.max_num_users()),
                     displayname, 
                     name,
-                    manager.hash_password(password),
+                    hashed,
                     email,
                     False,
                     False)
-    db_add_user(new_user.to_json())
-    data_store.add_user(new_user)
+    try:
+        data_store.add_user(new_user)
+    except DuplicateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db_add_user(new_user.to_json())
 
     if verify:
         verification_token = generate_verification_token(new_user.get_id())
-        send_email(email, verification_token)
+        queue_email(email, verification_token)
         print("email has been sent!")
 
     return new_user.get_id()
 
-def create_super_admin() -> None:
+async def create_super_admin() -> None:
     '''
         Creates a super admin at web-app creation   
     '''
+    hashed = await manager.hash_password("superadminpassword")
+    if data_store.num_users() != 0:
+        # Created by a concurrent request while hashing
+        return
+
     super_admin = User(str(data_store.max_num_users()),
                     "superadmin",
                     "superadmin",
-                    manager.hash_password("superadminpassword"),
+                    hashed,
                     "superadmin@gmail.com",
                     True,
                     True)
     super_admin.verify_user()
-    db_add_user(super_admin.to_json())
     data_store.add_user(super_admin)
+    await db_add_user(super_admin.to_json())
 
-def change_password(uid: str, newpass: str) -> None:
+async def change_password(uid: str, newpass: str) -> None:
     '''
         Allows the user to change their own password  
     '''
     user = data_store.get_user_by_id(uid)
-    user.change_password(manager.hash_password(newpass))
-    db_update_user(uid, user.to_json())
+    user.change_password(await manager.hash_password(newpass))
+    invalidate_principal(uid)
+    await db_update_user(uid, user)
 
 def password_reset_request(uid: str, verify: bool = _email) -> None:
     '''
@@ -125,4 +141,4 @@ def password_reset_request(uid: str, verify: bool = _email) -> None:
     user = data_store.get_user_by_id(uid)
     if verify:
         verification_token = generate_verification_token(user.get_id())
-        send_email(user.get_email(), verification_token, 'password_reset')
\ No newline at end of file
+        queue_email(user.get_email(), verification_token, 'password_reset')
\ No newline at end of file
@@ -0,0 +1,211 @@
+from typing import Dict, Iterable, Set
+from itertools import chain
+from src.backend.classes.datastore import data_store, doc_references
+from src.backend.classes.Manager import blacklist_user_token
+from src.backend.database import db_delete_cascade, db_update_user, db_update_service, db_queue_review
+from src.backend.server.documents import release_docs
+
+
+class Cascade:
+
+    '''
+        Deletes users and services along with everything depending on them,
+        in one pass
+
+        The closure of what is deleted is gathered first:
+            - users:        Users deleted
+            - services:     Services deleted, and every service owned by a
+                            deleted user
+            - reviews:      Reviews written by a deleted user, or on a
+                            deleted service
+            - replies:      Replies to deleted reviews, or by a deleted user
+
+        then applied - votes, review and reply lists and tag links are
+        stripped from the surviving users, services and reviews, each
+        updated once for the whole batch, and icons and docs released,
+        before everything is removed from the datastore. persist deletes the closure from MongoDB with
+        one delete_many per collection, and queues the changed survivors
+        (users, services and reviews) on the write-behind queue (which
+        writes them in bulk)
+    '''
+
+    def __init__(self) -> None:
+        self.users: Dict[str, object] = {}
+        self.services: Dict[str, object] = {}
+        self.reviews: Dict[str, object] = {}
+        self.replies: Dict[str, object] = {}
+        self._touched_users: Set[str] = set()
+        self._touched_services: Set[str] = set()
+        self._touched_reviews: Set[str] = set()
+
+    ##################################
+    #   Closure
+    ##################################
+    def add_user(self, uid: str) -> None:
+        '''
+            Adds a user, their services, reviews and replies
+        '''
+        user = data_store.get_user_by_id(uid)
+        if user is None or uid in self.users:
+            return
+        self.users[uid] = user
+
+        for service in data_store.get_user_api_objects(uid):
+            self.add_service(service.get_id())
+        for rid in user.get_reviews():
+            self.add_review(rid)
+        for rid in user.get_replies():
+            self.__add_reply(rid)
+
+    def add_service(self, sid: str) -> None:
+        '''
+            Adds a service and its reviews
+        '''
+        service = data_store.get_api_by_id(sid)
+        if service is None or sid in self.services:
+            return
+        self.services[sid] = service
+
+        for rid in service.get_reviews():
+            self.add_review(rid)
+
+    def add_review(self, rid: str) -> None:
+        '''
+            Adds a review and its reply
+        '''
+        review = data_store.get_review_by_id(rid)
+        if review is None or rid in self.reviews:
+            return
+        self.reviews[rid] = review
+
+        if review.get_reply() is not None:
+            self.__add_reply(review.get_reply())
+
+    def __add_reply(self, rid: str) -> None:
+        reply = data_store.get_reply_by_id(rid)
+        if reply is not None:
+            self.replies[rid] = reply
+
+    ##################################
+    #   Applying
+    ##################################
+    def apply(self) -> None:
+        '''
+            Deletes the closure from the datastore, detaching it from every
+            surviving user, service and review first
+        '''
+        self.__remove_votes()
+
+        # Group the deleted reviews and replies by surviving owner
+        reviews_by_user: Dict[str, Set[str]] = {}
+        reviews_by_service: Dict[str, Dict[str, str]] = {}
+        for rid, review in self.reviews.items():
+            if review.get_owner() not in self.users:
+                reviews_by_user.setdefault(review.get_owner(), set()).add(rid)
+            if review.get_service() not in self.services:
+                reviews_by_service.setdefault(review.get_service(), {})[rid] = review.get_rating()
+
+        replies_by_user: Dict[str, Set[str]] = {}
+        for rid, reply in self.replies.items():
+            if reply.get_owner() not in self.users:
+                replies_by_user.setdefault(reply.get_owner(), set()).add(rid)
+            if reply.get_review() not in self.reviews:
+                review = self.__review(reply.get_review())
+                if review is not None:
+                    review.remove_reply()
+
+        for uid, rids in reviews_by_user.items():
+            self.__user(uid).remove_reviews(rids)
+        for uid, rids in replies_by_user.items():
+            self.__user(uid).remove_replies(rids)
+        for sid, ratings in reviews_by_service.items():
+            self.__service(sid).remove_reviews(ratings)
+
+        # Unlink deleted services from their tags and surviving owners
+        services_by_owner: Dict[str, Set[str]] = {}
+        for sid, service in self.services.items():
+            for name in service.get_tags():
+                tag = data_store.get_tag_by_name(name)
+                if tag is not None:
+                    tag.remove_server(sid)
+            owner = service.get_owner().get_id()
+            if owner not in self.users:
+                services_by_owner.setdefault(owner, set()).add(sid)
+        for uid, sids in services_by_owner.items():
+            data_store.get_user_by_id(uid).remove_services(sids)
+
+        for uid in self.users:
+            blacklist_user_token(uid)
+
+        # Icons and docs, deleting files nothing else refers to
+        for item in chain(self.users.values(), self.services.values()):
+            release_docs(doc_references(item))
+
+        data_store.delete_items(self.replies, 'reply')
+        data_store.delete_items(self.reviews, 'review')
+        data_store.delete_items(self.services, 'api')
+        data_store.delete_items(self.users, 'user')
+        self._touched_users -= self.users.keys()
+        self._touched_services -= self.services.keys()
+        self._touched_reviews -= self.reviews.keys()
+
+    def __remove_votes(self) -> None:
+        '''
+            Removes votes on deleted reviews from surviving voters, and
+            votes of deleted users from surviving reviews
+        '''
+        for rid, review in self.reviews.items():
+            for voter in review.get_upvote_ids() + review.get_downvote_ids():
+                if voter not in self.users:
+                    self.__user(voter).remove_vote(rid)
+
+        for uid, user in self.users.items():
+            for rid in user.get_upvotes() + user.get_downvotes():
+                if rid not in self.reviews:
+                    review = self.__review(rid)
+                    if review is not None:
+                        review.remove_vote(uid)
+
+    def __user(self, uid: str):
+        self._touched_users.add(uid)
+        return data_store.get_user_by_id(uid)
+
+    def __service(self, sid: str):
+        self._touched_services.add(sid)
+        return data_store.get_api_by_id(sid)
+
+    def __review(self, rid: str):
+        review = data_store.get_review_by_id(rid)
+        if review is not None:
+            self._touched_reviews.add(rid)
+        return review
+
+    ##################################
+    #   Persisting
+    ##################################
+    async def persist(self) -> bool:
+        '''
+            Deletes the closure from MongoDB and queues writing the changed
+            survivors. Call after apply
+        '''
+        for uid in self._touched_users:
+            await db_update_user(uid, data_store.get_user_by_id(uid))
+        for sid in self._touched_services:
+            await db_update_service(sid, data_store.get_api_by_id(sid))
+        for rid in self._touched_reviews:
+            db_queue_review(rid, data_store.get_review_by_id(rid))
+        return await db_delete_cascade(self.users, self.services, self.reviews, self.replies)
+
+
+async def cascade_delete(uids: Iterable[str] = (), sids: Iterable[str] = ()) -> bool:
+    '''
+        Deletes users and services, along with their reviews, replies and
+        votes, from the datastore and MongoDB
+    '''
+    cascade = Cascade()
+    for uid in uids:
+        cascade.add_user(uid)
+    for sid in sids:
+        cascade.add_service(sid)
+    cascade.apply()
+    return await cascade.persist()
@@ -0,0 +1,120 @@
+from typing import Iterable
+from fastapi.responses import FileResponse
+from src.backend.classes.datastore import data_store
+from src.backend.classes.Document import Document
+from src.backend.database import db_queue_doc, db_queue_delete
+from hashlib import blake2b
+import os
+
+
+# File extension of each stored type
+EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+}
+
+# Resized icons, by the edge (in pixels) of the square they fit and type
+VARIANT_PATH = "static/imgs/variants"
+ICON_SIZES = (256, 128, 64, 32)
+VARIANT_EXTENSIONS = {
+    'image/webp': '.webp',
+    'image/png': '.png',
+}
+
+
+def blob_path(directory: str, sha256: str, content_type: str) -> str:
+    '''
+        Returns the path a file with the given digest is stored at
+    '''
+    return os.path.join(directory, f"{sha256}{EXTENSIONS[content_type]}")
+
+
+def place_blob(temp_path: str, directory: str, sha256: str, content_type: str) -> str:
+    '''
+        Moves a fully written upload to its content-addressed path, returning
+        the path. If an identical file is already stored, the upload is
+        discarded instead
+    '''
+    path = blob_path(directory, sha256, content_type)
+    if os.path.exists(path):
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, path)
+    return path
+
+
+def store_document(upload: dict[str, str]) -> Document:
+    '''
+        Returns the document for a placed upload (see place_blob) - the one
+        already stored with the same contents if any, else a new one
+    '''
+    doc = data_store.get_doc_by_hash(upload['sha256'])
+    if doc is not None:
+        data_store.reupload_doc(doc)
+        return doc
+
+    doc = Document(str(data_store.num_docs()), upload['path'], upload['type'], upload['sha256'])
+    data_store.add_docs(doc)
+    db_queue_doc(doc.get_id(), doc)
+    return doc
+
+
+def release_docs(doc_ids: Iterable[str]) -> int:
+    '''
+        Drops a reference to each document, deleting the files of documents
+        no longer referred to. Returns the number of files deleted
+    '''
+    deleted = 0
+    for doc_id in doc_ids:
+        doc = data_store.release_doc(doc_id)
+        if doc is not None:
+            db_queue_delete('docs', doc.get_id())
+        if doc is not None and os.path.exists(doc.get_path()):
+            os.remove(doc.get_path())
+            remove_variants(doc)
+            deleted += 1
+    return deleted
+
+
+def variant_key(doc: Document) -> str:
+    '''
+        Returns the name a document's variants are stored under - its digest,
+        or for documents not stored by content, a digest of its path and
+        when the file was last modified
+    '''
+    if doc.get_hash() is not None:
+        return doc.get_hash()
+    stat = os.stat(doc.get_path())
+    source = f"{doc.get_path()}:{stat.st_mtime_ns}:{stat.st_size}"
+    return blake2b(source.encode(), digest_size=16).hexdigest()
+
+
+def variant_path(key: str, size: int, content_type: str) -> str:
+    '''
+        Returns the path of a variant of the given size and type
+    '''
+    return os.path.join(VARIANT_PATH, f"{key}_{size}{VARIANT_EXTENSIONS[content_type]}")
+
+
+def remove_variants(doc: Document) -> None:
+    '''
+        Deletes every variant of a document stored by content
+    '''
+    if doc.get_hash() is None:
+        return
+    for size in ICON_SIZES:
+        for content_type in VARIANT_EXTENSIONS:
+            path = variant_path(doc.get_hash(), size, content_type)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def doc_response(doc: Document) -> FileResponse:
+    '''
+        Returns a document's file. Documents stored by content are tagged
+        with their digest, so clients can cache them by it
+    '''
+    if doc.get_hash() is None:
+        return FileResponse(doc.get_path())
+    return FileResponse(doc.get_path(), headers={'ETag': f'"{doc.get_hash()}"'})
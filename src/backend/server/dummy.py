@@ -99,32 +99,33 @@ post_endpoint = Endpoint(
 )
 
 
-def create_users(n):
+async def create_users(n):
     users = {}
     for i in range(1, n + 1):
+        hashed = await manager.hash_password(f"user{i}password")
         user = User(
             str(data_store.max_num_users() + i - 1),
             f"user{i}",
             f"user{i}",
-            manager.hash_password(f"user{i}password"),
+            hashed,
             f"user{i}@example.com",
             False,
             False
         )
         user.verify_user()
-        db_add_user(user.to_json())
+        await db_add_user(user.to_json())
         data_store.add_user(user)
 
         users[f"user{i}"] = user
     return users
 
-def import_dummy_data():
+async def import_dummy_data():
 
     if data_store.num_users() == 0:
-        create_super_admin()
+        await create_super_admin()
     superadmin = data_store.get_user_by_id("0")
 
-    users = create_users(5)
+    users = await create_users(5)
     user1 = users["user1"]
     user2 = users["user2"]
     user2.promote_to_admin()
@@ -183,7 +184,9 @@ def import_dummy_data():
 
     for api_info in api_infos:
         for tag in api_info['tags']:
-            data_store.add_tag(tag)
+            new_tag = data_store.add_tag(tag)
+            if new_tag is not None:
+                db_queue_tag(new_tag.get_id(), new_tag)
             
     services = [
         ServiceAdd(
@@ -198,8 +201,8 @@ def import_dummy_data():
 
     service_requests = [service.model_dump() for service in services]
 
-    sid1 = add_service_wrapper(service_requests[0], user1)
-    approve_service(sid1, 'first api ever', True, api_info1)
+    sid1 = await add_service_wrapper(service_requests[0], user1)
+    await approve_service(sid1, 'first api ever', True, api_info1)
 
     add_service_review(user2.get_id(), sid1, 'positive', 'it is ok')
 
@@ -216,15 +219,15 @@ def import_dummy_data():
     request_info1 = api_info1_new_version.model_dump()
     add_new_service_version_wrapper(request_info1)
 
-    sid2 = add_service_wrapper(service_requests[0], user2)
+    sid2 = await add_service_wrapper(service_requests[0], user2)
 
-    approve_service(sid2, 'someone already uploaded this', False, api_info1)
+    await approve_service(sid2, 'someone already uploaded this', False, api_info1)
     
-    sid3 = add_service_wrapper(service_requests[1], user3)
-    sid4 = add_service_wrapper(service_requests[2], user4)
-    sid5 = add_service_wrapper(service_requests[3], user5)
+    sid3 = await add_service_wrapper(service_requests[1], user3)
+    sid4 = await add_service_wrapper(service_requests[2], user4)
+    sid5 = await add_service_wrapper(service_requests[3], user5)
 
-    approve_service(sid5, 'very unique service, approved', True, api_info4)
+    await approve_service(sid5, 'very unique service, approved', True, api_info4)
 
 
     add_service_review(user1.get_id(), sid5, 'positive', 'wow, very good')
@@ -261,7 +264,7 @@ def add_service_review(user_id, sid, rating, comment):
     )
     service_add_review_wrapper(user_id, review)
 
-def approve_service(sid, reason, approve, api_info):
+async def approve_service(sid, reason, approve, api_info):
     request = {
         'sid': sid,
         'reason': reason,
@@ -269,7 +272,7 @@ def approve_service(sid, reason, approve, api_info):
         'version_name': api_info["version_name"],
         'service_global': True
     }
-    approve_service_wrapper(sid=request["sid"],
+    await approve_service_wrapper(sid=request["sid"],
                            approved=request["approved"],
                            reason=request["reason"],
                            service_global=request["service_global"],
@@ -1,4 +1,8 @@
-from typing import Literal, TypeVar
+from typing import Callable, Literal, TypeVar, List, Optional
+from collections import deque
+from uuid import uuid4
+import asyncio
+import time
 import os
 from oauth2client import client, tools, file
 from email.mime.multipart import MIMEMultipart
@@ -8,6 +12,7 @@ import base64
 from dotenv import load_dotenv
 from pathlib import Path
 import os
+from src.backend.database import db
 
 app_host = os.getenv("APP_HOST", "localhost")
 app_port = os.getenv("APP_PORT", "5000")
@@ -25,6 +30,16 @@ email = load_email_setting()
 SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 APPLICATION_NAME = 'Gmail API Python Send Email'
 CLIENT_SECRET_FILE = os.path.join(current_dir, "secret.json")
+SENDER_EMAIL = "api.overflow6@gmail.com"
+
+# Outbound email queue
+EMAIL_QUEUE_SIZE = 10_000   # Queued emails beyond which new emails are dropped
+EMAIL_BATCH_SIZE = 50       # Emails per batch request (Gmail allows 100)
+EMAIL_INTERVAL = 1.0        # Max seconds an email waits before being sent
+EMAIL_MAX_ATTEMPTS = 5      # Sends attempted before an email is dropped
+EMAIL_RETRY_BASE = 2.0      # Seconds before the first retry, doubling per attempt
+EMAIL_RETRY_MAX = 300.0
+EMAIL_QUEUE_PERSIST = os.getenv("EMAIL_QUEUE_PERSIST") == "True"
 
 def get_credentials():
     credential_dir = os.path.join(current_dir, '.credentials')
@@ -41,9 +56,25 @@ def get_credentials():
     return credentials
 
 def send_email(to_email: str, token: str, email_type: str = 'verification', content: dict = {}):
-    """Send an email with HTML and plain text content."""
-    sender_email = "api.overflow6@gmail.com"
-    
+    """Send an email with HTML and plain text content, waiting for the Gmail API."""
+    message = compose_email(to_email, token, email_type, content)
+    try:
+        credentials = get_credentials()
+        service = build('gmail', 'v1', credentials=credentials)
+
+        result = send_message_internal(service, "me", message)
+        return result
+
+    except Exception as e:
+        print(f"Failed to send email: {e}")
+        return None
+
+def queue_email(to_email: str, token: str, email_type: str = 'verification', content: dict = {}) -> bool:
+    """Queue an email to be sent in the background - returns False if the queue is full."""
+    return email_dispatcher.enqueue(compose_email(to_email, token, email_type, content))
+
+def compose_email(to_email: str, token: str, email_type: str = 'verification', content: dict = {}) -> dict:
+    """Build the Gmail API message for an email of the given type."""
     root_link = f"http://{app_host}:{app_port}"
     if email_type == 'verification':
         verification_link = f"{root_link}/verify-email?token={token}"
@@ -148,18 +179,7 @@ def send_email(to_email: str, token: str, email_type: str = 'verification', cont
     else:
         raise ValueError("Invalid email type specified.")
 
-    try:
-        credentials = get_credentials()
-        service = build('gmail', 'v1', credentials=credentials)
-
-        message = create_message_html(sender_email, to_email, subject, msg_html, msg_plain)
-
-        result = send_message_internal(service, "me", message)
-        return result
-
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        return None
+    return create_message_html(SENDER_EMAIL, to_email, subject, msg_html, msg_plain)
 
 def create_message_html(sender, to, subject, msg_html, msg_plain):
     """Create a MIME message in HTML and plain text format."""
@@ -179,4 +199,216 @@ def send_message_internal(service, user_id, message):
         return message
     except Exception as error:
         print('An error occurred: %s' % error)
-        return "Error"
\ No newline at end of file
+        return "Error"
+
+
+class GmailTransport:
+    '''
+        Sends batches of messages through the Gmail API. Credentials and the
+        API service are built once and reused, until a batch fails outright
+    '''
+
+    def __init__(self) -> None:
+        self._service = None
+
+    def send(self, messages: List[dict]) -> List[bool]:
+        '''
+            Sends messages in one batch request, returning whether each was sent
+        '''
+        if self._service is None:
+            self._service = build('gmail', 'v1', credentials=get_credentials())
+
+        sent = [False] * len(messages)
+        def callback(request_id, response, exception):
+            sent[int(request_id)] = exception is None
+
+        batch = self._service.new_batch_http_request(callback=callback)
+        for i, message in enumerate(messages):
+            batch.add(self._service.users().messages().send(userId="me", body=message),
+                      request_id=str(i))
+        try:
+            batch.execute()
+        except Exception:
+            self._service = None
+            raise
+        return sent
+
+
+class EmailDispatcher:
+
+    '''
+        Sends queued emails in the background, so requests never wait on
+        the mail provider
+
+        Emails are sent in batches through a transport (anything with a
+        send(messages) -> [sent?] method), every interval seconds or as soon
+        as a batch fills (see run). Failed emails are retried with
+        exponential backoff, up to max_attempts sends. At most max_queue
+        emails are held - beyond that new emails are dropped.
+
+        Given a collection, queued emails are also stored in MongoDB until
+        sent, and reloaded when the dispatcher next runs. Retries are timed
+        by clock (monotonic seconds)
+
+        Stores:
+            - queue:    Entries {eid, message, attempts, due} waiting to send
+            - unsaved:  Entries not yet stored in the collection
+    '''
+
+    def __init__(self,
+                 transport,
+                 collection = None,
+                 max_queue: int = EMAIL_QUEUE_SIZE,
+                 batch_size: int = EMAIL_BATCH_SIZE,
+                 interval: float = EMAIL_INTERVAL,
+                 max_attempts: int = EMAIL_MAX_ATTEMPTS,
+                 retry_base: float = EMAIL_RETRY_BASE,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._transport = transport
+        self._collection = collection
+        self._max_queue = max_queue
+        self._batch_size = batch_size
+        self._interval = interval
+        self._max_attempts = max_attempts
+        self._retry_base = retry_base
+        self._clock = clock
+
+        # Deques, as emails may be queued from worker threads
+        self._queue: deque[dict] = deque()
+        self._unsaved: deque[dict] = deque()
+        self._sent = 0
+        self._failed = 0
+        self._dropped = 0
+        self._lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def enqueue(self, message: dict) -> bool:
+        '''
+            Queues a message to be sent, returning False if the queue is full
+        '''
+        if len(self._queue) >= self._max_queue:
+            self._dropped += 1
+            print("Email queue full, dropping email")
+            return False
+
+        entry = {'eid': uuid4().hex, 'message': message, 'attempts': 0, 'due': 0.0}
+        self._queue.append(entry)
+        if self._collection is not None:
+            self._unsaved.append(entry)
+
+        if len(self._queue) >= self._batch_size and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    async def flush(self) -> None:
+        '''
+            Sends every email which is due, in batches
+        '''
+        async with self._lock:
+            await self.__save()
+
+            now = self._clock()
+            due, waiting = [], []
+            for _ in range(len(self._queue)):
+                entry = self._queue.popleft()
+                (due if entry['due'] <= now else waiting).append(entry)
+            self._queue.extend(waiting)
+
+            for i in range(0, len(due), self._batch_size):
+                await self.__send(due[i:i + self._batch_size])
+
+    async def __send(self, batch: List[dict]) -> None:
+        '''
+            Sends one batch, requeueing failed emails with backoff
+        '''
+        try:
+            sent = await asyncio.to_thread(self._transport.send, [entry['message'] for entry in batch])
+        except Exception as e:
+            print(f"Failed to send emails: {e}")
+            sent = [False] * len(batch)
+
+        done = []
+        for entry, ok in zip(batch, sent):
+            if ok:
+                self._sent += 1
+                done.append(entry['eid'])
+                continue
+
+            entry['attempts'] += 1
+            if entry['attempts'] >= self._max_attempts:
+                self._failed += 1
+                done.append(entry['eid'])
+                print(f"Giving up on email after {entry['attempts']} attempts")
+                continue
+
+            backoff = min(self._retry_base * 2 ** (entry['attempts'] - 1), EMAIL_RETRY_MAX)
+            entry['due'] = self._clock() + backoff
+            self._queue.append(entry)
+
+        if self._collection is not None and done:
+            await self._collection.delete_many({'eid': {'$in': done}})
+
+    async def __save(self) -> None:
+        '''
+            Stores newly queued emails in the collection
+        '''
+        entries = [self._unsaved.popleft() for _ in range(len(self._unsaved))]
+        if entries:
+            await self._collection.insert_many([{'eid': entry['eid'], 'message': entry['message']}
+                                                for entry in entries])
+
+    async def __restore(self) -> None:
+        '''
+            Queues emails stored by a previous run which are not yet queued
+        '''
+        queued = {entry['eid'] for entry in self._queue}
+        async for document in self._collection.find({}, {'_id': 0}):
+            if document['eid'] not in queued:
+                self._queue.append({'eid': document['eid'], 'message': document['message'],
+                                    'attempts': 0, 'due': 0.0})
+
+    def num_pending(self) -> int:
+        '''
+            Returns number of emails waiting to be sent
+        '''
+        return len(self._queue)
+
+    def get_stats(self) -> dict[str, int]:
+        '''
+            Returns counts of pending, sent, failed and dropped emails
+        '''
+        return {
+            'pending': len(self._queue),
+            'sent': self._sent,
+            'failed': self._failed,
+            'dropped': self._dropped
+        }
+
+    async def run(self) -> None:
+        '''
+            Background sender - sends every interval seconds, or as soon as
+            a batch of emails is queued, until cancelled
+        '''
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        try:
+            if self._collection is not None:
+                await self.__restore()
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print(f"Failed to dispatch emails: {e}")
+        finally:
+            self._loop = None
+            self._wakeup = None
+
+global email_dispatcher
+email_dispatcher = EmailDispatcher(GmailTransport(), db.email_queue if EMAIL_QUEUE_PERSIST else None)
@@ -0,0 +1,101 @@
+from typing import Any, Callable, Iterable, List, Optional, TypeVar
+from fastapi import HTTPException, Query, Response
+from itertools import islice
+import base64
+import heapq
+import json
+
+T = TypeVar("T")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class Page:
+
+    '''
+        A requested page of a listing
+
+        Cursors are opaque to clients - they encode the listing's order and
+        the (numeric) sort key of the last item returned, so the next page
+        starts right after it even if items were added or removed in between.
+        The cursor of the following page is returned in the X-Next-Cursor
+        header, which is left out on the last page
+    '''
+
+    def __init__(self, limit: int, cursor: Optional[str]) -> None:
+        self.limit = limit
+        self.cursor = cursor
+        self.next_cursor: Optional[str] = None
+
+    def after(self, order: str, parts: int = 1) -> Optional[tuple]:
+        '''
+            Returns the sort key (of parts numbers) the page starts after,
+            None for the first page
+
+            Raises:     HTTP Error 400 if the cursor is invalid or was
+                        issued for a listing in another order
+        '''
+        if self.cursor is None:
+            return None
+        try:
+            padding = '=' * (-len(self.cursor) % 4)
+            cursor_order, key = json.loads(base64.urlsafe_b64decode(self.cursor + padding))
+            if cursor_order != order or not isinstance(key, list) or len(key) != parts or \
+               not all(isinstance(value, (int, float)) for value in key):
+                raise ValueError(cursor_order)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return tuple(key)
+
+    def finish(self, items: List[T], order: str, key: Callable[[T], tuple]) -> List[T]:
+        '''
+            Trims up to limit + 1 items (in order) to the page, setting the
+            next cursor if there are more
+        '''
+        if len(items) > self.limit:
+            del items[self.limit:]
+            data = json.dumps([order, list(key(items[-1]))]).encode()
+            self.next_cursor = base64.urlsafe_b64encode(data).decode().rstrip('=')
+        return items
+
+
+def get_page(limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+             cursor: Optional[str] = None) -> Optional[Page]:
+    '''
+        Dependency parsing the opt-in paging parameters - listings without
+        a limit or cursor are returned in full
+    '''
+    if limit is None and cursor is None:
+        return None
+    return Page(DEFAULT_PAGE_SIZE if limit is None else limit, cursor)
+
+
+def page_in_order(items: Iterable[T], page: Page, order: str, key: Callable[[T], tuple]) -> List[T]:
+    '''
+        Pages items which are already in ascending key order and start
+        after the page's cursor. Only the page (and one more item) is read
+    '''
+    return page.finish(list(islice(items, page.limit + 1)), order, key)
+
+
+def page_by_key(items: Iterable[T], page: Page, order: str, key: Callable[[T], tuple], parts: int = 1) -> List[T]:
+    '''
+        Pages unordered items by ascending key (of parts numbers), selecting
+        the page without sorting every item. Keys must be unique
+    '''
+    after = page.after(order, parts)
+    if after is not None:
+        items = (item for item in items if key(item) > after)
+    return page.finish(heapq.nsmallest(page.limit + 1, items, key=key), order, key)
+
+
+def with_next_cursor(result: Any, page: Optional[Page], response: Response) -> Any:
+    '''
+        Returns an endpoint's result with the page's next cursor header set
+    '''
+    if page is not None and page.next_cursor is not None:
+        target = result if isinstance(result, Response) else response
+        target.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    return result
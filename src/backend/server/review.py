@@ -10,7 +10,7 @@ from src.backend.database import *
 from src.backend.classes.models import ServiceReviewEditInfo
 from src.backend.classes.Review import *
 from src.backend.classes.ReviewReply import *
-from src.backend.server.email import send_email
+from src.backend.server.email import queue_email
 
 def review_get_wrapper(rid: str, uid: str = '') -> dict[str, str]:
     '''
@@ -45,12 +45,15 @@ def review_delete_wrapper(rid: str, uid: str, is_admin: bool) -> None:
         review_remove_vote_wrapper(rid, voted_id)
         voted_user = data_store.get_user_by_id(voted_id)
         voted_user.remove_vote(rid)
+        db_queue_user(voted_id, voted_user)
 
     # Delete review
     user = data_store.get_user_by_id(review.get_owner())
     service = data_store.get_api_by_id(review.get_service())
     user.remove_review(rid)
     service.remove_review(rid, review.get_rating())
+    db_queue_user(user.get_id(), user)
+    db_queue_service(service.get_id(), service)
 
     # Delete associated reply
     reply = data_store.get_reply_by_id(review.get_reply())
@@ -59,8 +62,11 @@ def review_delete_wrapper(rid: str, uid: str, is_admin: bool) -> None:
         user.remove_reply(reply.get_id())
         review.remove_reply()
         data_store.delete_item(reply.get_id(), 'reply')
+        db_queue_user(user.get_id(), user)
+        db_queue_delete('replies', reply.get_id())
 
     data_store.delete_item(rid, 'review')
+    db_queue_delete('reviews', rid)
 
 def review_edit_wrapper(info: ServiceReviewEditInfo, uid: str, is_admin: bool) -> None:
     '''
@@ -90,9 +96,11 @@ def review_edit_wrapper(info: ServiceReviewEditInfo, uid: str, is_admin: bool) -
     if rating != review.get_rating():
         service = data_store.get_api_by_id(review.get_service())
         service.update_rating(rating)
+        db_queue_service(service.get_id(), service)
 
     # Edit review
     review.update_review(rating, comment)
+    db_queue_review(rid, review)
 
 def review_vote_wrapper(rid: str, uid: str, vote: str) -> None:
     '''
@@ -100,7 +108,6 @@ def review_vote_wrapper(rid: str, uid: str, vote: str) -> None:
     '''
     review = data_store.get_review_by_id(rid)
     user = data_store.get_user_by_id(uid)
-    user.add_vote(rid, vote)
     if review is None:
         raise HTTPException(status_code=404, detail="Review not found")
     
@@ -109,6 +116,9 @@ def review_vote_wrapper(rid: str, uid: str, vote: str) -> None:
 
     if review.update_vote(uid, vote) is None:
         raise HTTPException(status_code=403, detail='User has already voted')
+    user.add_vote(rid, vote)
+    db_queue_review(rid, review)
+    db_queue_user(uid, user)
 
 
 def review_remove_vote_wrapper(rid: str, uid: str) -> None:
@@ -121,6 +131,7 @@ def review_remove_vote_wrapper(rid: str, uid: str) -> None:
     
     if not review.remove_vote(uid):
         raise HTTPException(status_code=400, detail="User has not voted on review")
+    db_queue_review(rid, review)
 
 def review_add_reply_wrapper(rid: str, uid: str, comment: str) -> None:
     '''
@@ -156,6 +167,9 @@ def review_add_reply_wrapper(rid: str, uid: str, comment: str) -> None:
     user.add_reply(reply.get_id())
     data_store.add_reply(reply)
     review.add_reply(reply.get_id())
+    db_queue_reply(reply.get_id(), reply)
+    db_queue_review(rid, review)
+    db_queue_user(uid, user)
 
     review_owner_id = review.get_owner()
     review_owner = data_store.get_user_by_id(review_owner_id)
@@ -168,7 +182,7 @@ def review_add_reply_wrapper(rid: str, uid: str, comment: str) -> None:
     sname = service.get_name()
     uemail = review_owner.get_email()
     content = {'action': action, 'msg': msg, 'subname': subname, 'rname': rname, 'sname': sname}
-    send_email(uemail, '', 'reivew_reply', content)
+    queue_email(uemail, '', 'reivew_reply', content)
 
 
 def review_delete_reply_wrapper(rid: str, uid: str) -> None:
@@ -190,6 +204,9 @@ def review_delete_reply_wrapper(rid: str, uid: str) -> None:
     user.remove_reply(rid)
     review.remove_reply()
     data_store.delete_item(rid, 'reply')
+    db_queue_user(user.get_id(), user)
+    db_queue_review(review.get_id(), review)
+    db_queue_delete('replies', rid)
 
 def review_edit_reply_wrapper(rid: str, uid: str, comment: str) -> None:
     '''
@@ -210,6 +227,7 @@ def review_edit_reply_wrapper(rid: str, uid: str, comment: str) -> None:
 
     # Edit reply
     reply.update_content(comment)
+    db_queue_reply(rid, reply)
 
 def review_get_reply_wrapper(rid: str) -> dict[str, str]:
     '''
@@ -1,8 +1,9 @@
-from typing import TypeVar, List, Union
+from typing import TypeVar, List, Optional, Union
 from fastapi import File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response as RawResponse
 from src.backend.classes.Service import ServiceStatus, LIVE_OPTIONS, PENDING_OPTIONS
 from src.backend.classes.datastore import data_store
+from src.backend.classes.SearchIndex import tokenize
 from src.backend.classes.API import API
 from src.backend.classes.Service import Service, ServiceVersionInfo
 from src.backend.classes.User import User
@@ -12,8 +13,12 @@ from src.backend.classes.Review import Review
 import re
 import json
 import requests
-from src.backend.server.email import send_email
-from src.backend.server.review import review_delete_wrapper
+from src.backend.server.email import queue_email
+from src.backend.server.cascade import cascade_delete
+from src.backend.server.documents import release_docs, doc_response
+from src.backend.server.thumbnails import icon_response
+from src.backend.server.pagination import Page, page_in_order, page_by_key
+from bisect import bisect_right
 
 vm_ip = "34.116.117.133"
 url = f"http://{vm_ip}:11434/api/generate"
@@ -28,6 +33,15 @@ T = TypeVar('T')
 K = TypeVar('K')
 
 
+def summaries_response(services: List[Service]) -> RawResponse:
+    '''
+        Returns a JSON list of service summaries, stitched together from
+        each service's cached pre-serialized summary
+    '''
+    return RawResponse(content=b'[' + b','.join(service.to_summary_bytes() for service in services) + b']',
+                    media_type='application/json')
+
+
 # Helper functions
 
 def validate_api_fields(packet: dict[T, K]) -> None:
@@ -41,6 +55,34 @@ def validate_api_fields(packet: dict[T, K]) -> None:
         raise HTTPException(status_code=400, detail='No service tags provided')
     
 
+def listed_statuses(hide_pending: bool) -> List[ServiceStatus]:
+    '''
+        Returns the statuses of services shown in listings - live services
+        always are, pending services only if not hidden
+    '''
+    return LIVE_OPTIONS if hide_pending else LIVE_OPTIONS + PENDING_OPTIONS
+
+def is_listed(api: Service, hide_pending: bool) -> bool:
+    '''
+        Returns whether a service is shown in listings
+    '''
+    return api.get_status() in listed_statuses(hide_pending)
+
+def catalogue_key(api: Service) -> tuple:
+    '''
+        Sort key of a service in catalogue order
+    '''
+    return (data_store.get_api_seq(api.get_id()),)
+
+def page_catalogue(page: Page, hide_pending: bool) -> List[Service]:
+    '''
+        Returns a page of every listed service, in catalogue order
+    '''
+    after = page.after('catalogue')
+    apis = data_store.iter_apis(None if after is None else after[0])
+    return page_in_order((api for api in apis if is_listed(api, hide_pending)),
+                         page, 'catalogue', catalogue_key)
+
 def get_validate_service_id(sid: str) -> API:
     if sid == '':
         raise HTTPException(status_code=400, detail='No service id provided')
@@ -53,7 +95,7 @@ def get_validate_service_id(sid: str) -> API:
 
 
 # Endpoint Wrappers
-def add_service_wrapper(packet: dict[T, K], user: User) -> dict[T, K]:
+async def add_service_wrapper(packet: dict[T, K], user: User) -> dict[T, K]:
     '''
         Adds a Service (default to API) to the platform
 
@@ -80,11 +122,11 @@ def add_service_wrapper(packet: dict[T, K], user: User) -> dict[T, K]:
                     )
 
     data_store.add_api(new_api)
-    db_add_service(new_api.to_json())
+    await db_add_service(new_api.to_json())
     user.add_service(new_api.get_id())
     return str(new_api.get_id())
 
-def update_service_wrapper(packet: dict[T, K]) -> None:
+async def update_service_wrapper(packet: dict[T, K]) -> None:
     '''
         Updates a service by sid
 
@@ -100,7 +142,7 @@ def update_service_wrapper(packet: dict[T, K]) -> None:
     service.create_pending_update(
         packet["name"], packet["description"], packet["tags"], packet['pay_model'])
     
-    db_update_service(sid, service.to_json())
+    await db_update_service(sid, service)
     return None
 
 def get_service_wrapper(sid: str) -> dict[T : K]:
@@ -135,72 +177,75 @@ def update_new_service_version_wrapper(request):
 
 def delete_service_version_wrapper(sid: str, version_name: str):
    service: Service = get_validate_service_id(sid)
+   docs = list(service.get_docs(version_name)) if service.contains_version(version_name) else []
    service.remove_version(version_name)
+   release_docs(docs)
+   db_queue_service(sid, service)
   
 # filter through database to find APIs that are fitted to the selected tags
 # returns a list of the filtered apis
-def api_tag_filter(tags, providers, pay_models, hide_pending: bool, sort_rating: bool) -> list:
+def api_tag_filter(tags, providers, pay_models, hide_pending: bool, sort_rating: bool,
+                   page: Optional[Page] = None) -> RawResponse:
+    if page is not None:
+        return summaries_response(api_tag_filter_page(tags, providers, pay_models,
+                                                      hide_pending, sort_rating, page))
 
-    api_list = data_store.get_apis()
-    filtered_apis = []
+    # Listed services matching any tag AND any provider AND any pay model,
+    # resolved through the datastore's inverted and status indexes
+    output = data_store.filter_apis(tags, providers, pay_models, listed_statuses(hide_pending))
 
-    if not tags:
-        # if they don't specify any tags, assume all APIs
-        for api in api_list:
-            filtered_apis.append(api)
-    else:
-        # otherwise get all the APIs with the tag/s
-        for api in api_list:
-            for tag in tags:
-                if tag in api.get_tags() and api not in filtered_apis:
-                        filtered_apis.append(api)
-
-    secondary_list: List[Service] = []
-    if providers:
-        # if providers list is not empty
-        for api in filtered_apis:
-            for provider in providers:
-                if provider in api.get_owner().get_id() and api not in secondary_list:
-                    secondary_list.append(api)
-                    break
+    if sort_rating:
+        output.sort(reverse=True, key=lambda x: x.get_ratings()['rating'])
 
-    else:
-        secondary_list = [api for api in filtered_apis]
-    
-    return_list: List[Service] = []
-    if pay_models:
-        for api in secondary_list:
-            for pay_model in pay_models:
-                if pay_model == api.get_pay_model() and api not in return_list:
-                    return_list.append(api)
-                    break
-    else:
-        return_list = [api for api in secondary_list]
-    
-    output =  [api.to_summary_json() for api in return_list if
-            api.get_status() in LIVE_OPTIONS or 
-            (not hide_pending and api.get_status() in PENDING_OPTIONS)
-            ]
-    
+    return summaries_response(output)
+
+def api_tag_filter_page(tags, providers, pay_models, hide_pending: bool, sort_rating: bool,
+                        page: Page) -> List[Service]:
+    '''
+        Returns a page of the filtered services, in the same order as
+        api_tag_filter
+    '''
+    if not (tags or providers or pay_models or sort_rating):
+        return page_catalogue(page, hide_pending)
+
+    sids = data_store.filter_api_ids(tags, providers, pay_models, listed_statuses(hide_pending))
+    apis = map(data_store.get_api_by_id, sids)
     if sort_rating:
-        output.sort(reverse=True, key=lambda x: x['ratings']['rating'])
+        return page_by_key(apis, page, 'rating',
+                           lambda api: (-api.get_ratings()['rating'],) + catalogue_key(api), 2)
+    return page_by_key(apis, page, 'catalogue', catalogue_key)
 
-    return output
+# returns a list of services matching the search query, best match first
+def api_name_search(name, hide_pending: bool, page: Optional[Page] = None) -> RawResponse: 
+    if page is not None:
+        return summaries_response(api_name_search_page(name or '', hide_pending, page))
 
-# returns a list of regex matching services 
-def api_name_search(name, hide_pending: bool) -> list: 
+    return summaries_response(data_store.search_apis(name or '', listed_statuses(hide_pending)))
 
-    api_list = data_store.get_apis()
-    return_list: List[dict[str, str]] = []
+def api_name_search_page(query: str, hide_pending: bool, page: Page) -> List[Service]:
+    '''
+        Returns a page of the search results, best match first
+    '''
+    if not tokenize(query):
+        return page_catalogue(page, hide_pending)
 
-    for api in api_list:
-        complete_string = api.get_name() + " " + api.get_description()
-        if re.search(name, complete_string, re.IGNORECASE) and (
-            api.get_status() in LIVE_OPTIONS or
-            api.get_status() in PENDING_OPTIONS and not hide_pending
-        ) and api.to_summary_json() not in return_list:
-            return_list.append(api.to_summary_json())
-    return return_list
+    scores = data_store.search_scores(query)
+    listed = data_store.get_api_ids_by_status(listed_statuses(hide_pending))
+    apis = map(data_store.get_api_by_id, (sid for sid in scores if sid in listed))
+    return page_by_key(apis, page, 'search',
+                       lambda api: (-scores[api.get_id()],) + catalogue_key(api), 2)
+
+def user_apis_wrapper(uid: str, page: Optional[Page] = None) -> List[dict[str, str]]:
+    '''
+        Wrapper which returns summaries of the services a user owns
+    '''
+    if page is None:
+        apis = data_store.get_user_api_objects(uid)
+    else:
+        after = page.after('catalogue')
+        apis = page_in_order(data_store.iter_user_apis(uid, None if after is None else after[0]),
+                             page, 'catalogue', catalogue_key)
+    return [api.to_summary_json() for api in apis]
 
 async def upload_docs_wrapper(sid: str, uid: str, doc_id: str, version: Optional[str]) -> None:
    '''
@@ -228,8 +273,9 @@ async def upload_docs_wrapper(sid: str, uid: str, doc_id: str, version: Optional
 
    # Add document to service
    service.add_docs([file.get_id()], version)
+   data_store.retain_doc(file.get_id())
 
-   db_update_service(sid, service.to_json())
+   await db_update_service(sid, service)
 
 def get_doc_wrapper(doc_id: str) -> FileResponse:
    '''
@@ -239,10 +285,10 @@ def get_doc_wrapper(doc_id: str) -> FileResponse:
    if doc is None:
        raise HTTPException(status_code=404, detail="No such document found")
   
-   return FileResponse(doc.get_path())
+   return doc_response(doc)
 
 
-def delete_service(sid: str, uid: str, is_admin: bool):
+async def delete_service(sid: str, uid: str, is_admin: bool):
     if sid == '':
         raise HTTPException(status_code=400, detail='No service id provided')
 
@@ -253,23 +299,9 @@ def delete_service(sid: str, uid: str, is_admin: bool):
     if service.get_owner().get_id() != uid and not is_admin:
         raise HTTPException(status_code=403, detail="No permission to delete review")
     service_name = service.get_name()
-    
-
-    # Disassociate server from tag
-    for _tag in service.get_tags():
-        tag = data_store.get_tag_by_name(_tag)
-
-        # Screen situations where tag not yet associated due to pending
-        if tag is None:
-            continue
-        
-        tag.remove_server(sid)
-
-    for _review in service.get_reviews():
-        review_delete_wrapper(_review, '0', True)
 
-    data_store.delete_item(sid, 'api')
-    db_status = db_delete_service(service_name)
+    # Delete the service with its reviews, their replies and votes
+    db_status = await cascade_delete(sids=[sid])
 
     return {"name": service_name, "deleted": db_status}
 
@@ -301,7 +333,11 @@ def service_add_icon_wrapper(uid: str, sid: str, doc_id: str) -> None:
        raise HTTPException(status_code=403, detail='User not service owner')
 
 
+   previous = service.get_icon()
    service.update_icon_id(doc_id)
+   data_store.retain_doc(doc_id)
+   release_docs([previous])
+   db_queue_service(sid, service)
 
 
 def service_delete_icon_wrapper(uid: str, sid: str) -> None:
@@ -325,12 +361,17 @@ def service_delete_icon_wrapper(uid: str, sid: str) -> None:
        raise HTTPException(status_code=403, detail='User not service owner')
 
 
+   previous = service.get_icon()
    service.remove_icon()
+   data_store.retain_doc(service.get_icon())
+   release_docs([previous])
+   db_queue_service(sid, service)
 
 
-def service_get_icon_wrapper(sid: str) -> FileResponse:
+async def service_get_icon_wrapper(sid: str, size: Optional[int] = None, accept: Optional[str] = None) -> FileResponse:
    '''
-       Wrapper which returns image file of service's icon
+       Wrapper which returns image file of service's icon, or its variant of
+       the given size (see icon_response)
    '''
    # Grab service
    service = data_store.get_api_by_id(sid)
@@ -341,7 +382,7 @@ def service_get_icon_wrapper(sid: str) -> FileResponse:
    # Grab image file
    icon_id = service.get_icon()
    icon = data_store.get_doc_by_id(icon_id)
-   return FileResponse(icon.get_path())
+   return await icon_response(icon, size, accept)
 
 
 def service_add_review_wrapper(uid: str, info: ServiceReviewInfo):
@@ -393,6 +434,9 @@ def service_add_review_wrapper(uid: str, info: ServiceReviewInfo):
    data_store.add_review(review)
    service.add_review(review.get_id(), rating)
    user.add_review(review.get_id())
+   db_queue_review(review.get_id(), review)
+   db_queue_service(sid, service)
+   db_queue_user(uid, user)
 
 
    owner = service.get_owner()
@@ -403,7 +447,7 @@ def service_add_review_wrapper(uid: str, info: ServiceReviewInfo):
    sname = service.get_name()
    uemail = owner.get_email()
    content = {'action': action, 'msg': msg, 'subname': subname, 'rname': rname, 'sname': sname}
-   send_email(uemail, '', 'reivew_reply', content)
+   queue_email(uemail, '', 'reivew_reply', content)
 
 
 def service_get_rating_wrapper(sid: str) -> dict[str, Union[int, float]]:
@@ -419,7 +463,8 @@ def service_get_rating_wrapper(sid: str) -> dict[str, Union[int, float]]:
    return service.get_ratings()
 
 
-def service_get_reviews_wrapper(sid: str, filter: str = '', uid: str = '') -> List[dict[str, str]]:
+def service_get_reviews_wrapper(sid: str, filter: str = '', uid: str = '',
+                                page: Optional[Page] = None) -> List[dict[str, str]]:
     '''
         Wrapper which grabs all reviews associated with the particular service
     '''
@@ -428,34 +473,55 @@ def service_get_reviews_wrapper(sid: str, filter: str = '', uid: str = '') -> Li
     if service is None:
         raise HTTPException(status_code=404, detail="Service not found")
 
-    # Grab reviews
-    reviews = []
-    for rid in service.get_reviews():
-        review = data_store.get_review_by_id(rid)
-        
-        # This should not trigger, but is there just in case
-        if review is None:
-            continue
-
-        reviews.append(review)
+    # Grab reviews, best/worst already ranked by net vote
+    if page is not None:
+        reviews = service_reviews_page(service, filter, page)
+    elif filter == 'best':
+        reviews = data_store.get_reviews_by_ids(data_store.get_review_ranking(sid).best())
+    elif filter == 'worst':
+        reviews = data_store.get_reviews_by_ids(data_store.get_review_ranking(sid).worst())
+    else:
+        reviews = data_store.get_reviews_by_ids(service.get_reviews())
 
-    # Sorting the review list
-    if filter == 'best':
-        reviews.sort(reverse=True, key=lambda x: x.get_net_vote())
-    elif filter == 'worst': 
-        reviews.sort(key=lambda x: x.get_net_vote())
+    # Grab their reviewers in bulk
+    reviewers = data_store.get_users_by_ids({review.get_owner() for review in reviews})
 
     output = []
     for review in reviews:
         r = review.to_json(uid=uid)
-        user = data_store.get_user_by_id(review.get_owner())
-        r['reviewerName'] = user.get_displayname()
+        r['reviewerName'] = reviewers[review.get_owner()].get_displayname()
         output.append(r)
 
     return output
 
 
-def approve_service_wrapper(sid: str, approved: bool, reason: str, service_global: bool, version: Optional[str]):
+def review_seq(review: Review) -> int:
+    '''
+        Returns a review's position in creation order
+    '''
+    return data_store.get_review_seq(review.get_id())
+
+def service_reviews_page(service: Service, filter: str, page: Page) -> List[Review]:
+    '''
+        Returns a page of a service's reviews, in the same order as
+        service_get_reviews_wrapper - equal votes in creation order
+    '''
+    ranking = data_store.get_review_ranking(service.get_id())
+    if filter == 'best':
+        return page_in_order(map(data_store.get_review_by_id, ranking.best(page.after(filter, 2))),
+                             page, filter, lambda review: (-review.get_net_vote(), review_seq(review)))
+    if filter == 'worst':
+        return page_in_order(map(data_store.get_review_by_id, ranking.worst(page.after(filter, 2))),
+                             page, filter, lambda review: (review.get_net_vote(), review_seq(review)))
+
+    # Reviews are added to the service as they are created
+    rids = service.get_reviews()
+    after = page.after('created')
+    start = 0 if after is None else bisect_right(rids, after[0], key=data_store.get_review_seq)
+    reviews = data_store.get_reviews_by_ids(rids[start:start + page.limit + 1])
+    return page.finish(reviews, 'created', lambda review: (review_seq(review),))
+
+async def approve_service_wrapper(sid: str, approved: bool, reason: str, service_global: bool, version: Optional[str]):
 
     service : API = data_store.get_api_by_id(sid)
     sname = service.get_name()
@@ -484,6 +550,9 @@ def approve_service_wrapper(sid: str, approved: bool, reason: str, service_globa
             tag = data_store.get_tag_by_name(_tag)
             tag.add_server(service.get_id())
 
+        # Approved fields (incl. version endpoints) become searchable
+        data_store.index_api(service)
+
     else:
         for object in approvalObjects:
             if object.get_status() == ServiceStatus.PENDING:
@@ -491,13 +560,13 @@ def approve_service_wrapper(sid: str, approved: bool, reason: str, service_globa
             elif object.get_status() == ServiceStatus.UPDATE_PENDING:
                 object.update_status(ServiceStatus.UPDATE_REJECTED, reason)
     
-    db_update_service(sid, service.to_json())
+    await db_update_service(sid, service)
 
     content = {'action': action, 'sname': sname, 'uname': uname, 'reason': reason}
-    send_email(uemail, '', 'service_approval', content)
+    queue_email(uemail, '', 'service_approval', content)
   
       
-def parse_yaml_to_api(yaml_data: dict, user: User) -> Service:
+async def parse_yaml_to_api(yaml_data: dict, user: User) -> Service:
     '''
         Function which uploads YAML files - returns a Service object
     '''
@@ -555,9 +624,11 @@ def parse_yaml_to_api(yaml_data: dict, user: User) -> Service:
         service_tags.append('API')
 
     for tag in service_tags:
-        data_store.add_tag(tag)
+        new_tag = data_store.add_tag(tag)
+        if new_tag is not None:
+            db_queue_tag(new_tag.get_id(), new_tag)
 
-    return_api = API(str(data_store.num_apis()),
+    return_api = API(str(data_store.max_num_apis()),
                         service_name,
                         user,
                         "", # replce with actual icon url
@@ -570,7 +641,7 @@ def parse_yaml_to_api(yaml_data: dict, user: User) -> Service:
                     )
 
     data_store.add_api(return_api)
-    db_add_service(return_api.to_json())
+    await db_add_service(return_api.to_json())
     user.add_service(return_api.get_id())
     return return_api
 
@@ -1,36 +1,200 @@
 from fastapi import HTTPException
 from src.backend.classes.datastore import data_store, defaults
-import requests
+from collections import OrderedDict
+from hashlib import sha256
+from typing import List, Optional
+import asyncio
+import httpx
 import json
+import os
+import time
 from src.backend.classes.Tag import SYSTEM, CUSTOM
+from src.backend.database import db_queue_tag, db_queue_service, db_queue_delete
 
 vm_ip = "34.116.117.133"
-url = f"http://{vm_ip}:11434/api/generate"
+url = os.getenv("OLLAMA_URL", f"http://{vm_ip}:11434/api/generate")
 
 n_tags_max = 10
 n_tags_min = 1
-def auto_generate_tags(description: str):
-    headers = {"Content-Type": "application/json"}
-    data = {
-        "model": "llama3:latest",
-        "prompt": f"Generate exactly betwen {n_tags_min} to {n_tags_max} concise tags for the following text (depending how descriptive the text is). Provide the tags only as a comma-separated list, with no additional text or explanation. Here's the text: {description}"
-    }
 
-    response = requests.post(url, headers=headers, data=json.dumps(data), stream=False)
+# Tag generation
+TAG_MODEL = "llama3:latest"
+TAG_CACHE_SIZE = 1024       # Descriptions whose generated tags are kept
+TAG_CACHE_TTL = 3600.0      # Seconds generated tags are reused for
+TAG_CONNECT_TIMEOUT = 5.0
+TAG_READ_TIMEOUT = 60.0     # Max seconds between chunks of a generation
+TAG_MAX_CONNECTIONS = 10
 
-    if response.status_code == 200:
+# Local suggestions, from the tags of similar live services
+#   - 'local':      Only suggest locally (works offline)
+#   - 'first':      Suggest locally, asking the model if too few tags are found
+#   - 'fallback':   Ask the model, suggesting locally if it is unavailable
+TAG_SUGGEST_MODE = os.getenv("TAG_SUGGEST_MODE", "first")
+TAG_SUGGEST_MIN = 3         # Local suggestions needed to skip the model
+
+
+class TagGenerator:
+
+    '''
+        Generates tags for service descriptions with an Ollama model
+
+        Requests share one pooled async HTTP client, with timeouts. Generated
+        tags are cached by a hash of the description, least recently used
+        first out once cache_size are held, and expire after ttl seconds.
+        Concurrent requests for the same description share one upstream
+        call. Failed generations are not cached
+
+        Stores:
+            - cache:    description hash -> (expiry, tags)
+            - inflight: description hash -> future of the generation running
+    '''
+
+    def __init__(self,
+                 url: str,
+                 cache_size: int = TAG_CACHE_SIZE,
+                 ttl: float = TAG_CACHE_TTL) -> None:
+        self._url = url
+        self._cache_size = cache_size
+        self._ttl = ttl
+        self._cache: OrderedDict[str, tuple[float, List[str]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._calls = 0
+
+    async def generate(self, description: str) -> List[str]:
+        '''
+            Returns tags for a description, from the cache if generated recently
+        '''
+        key = sha256(description.strip().encode()).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                return list(cached[1])
+            del self._cache[key]
+
+        # Join an identical generation already running
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight.get_loop() is asyncio.get_running_loop():
+            try:
+                return list(await asyncio.shield(inflight))
+            except asyncio.CancelledError:
+                # The leading request was cancelled (so its generation was),
+                # rather than this one - generate afresh
+                if not inflight.cancelled():
+                    raise
+                return await self.generate(description)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            tags = await self.__request(description)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved, as there may be no other waiters
+            future.exception()
+            raise
+        else:
+            future.set_result(tags)
+            self._cache[key] = (time.monotonic() + self._ttl, tags)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            return list(tags)
+        finally:
+            # Cancelled (eg. the client disconnected) - release those waiting
+            if not future.done():
+                future.cancel()
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def __request(self, description: str) -> List[str]:
+        '''
+            Asks the model for tags, raising a HTTPException if it fails
+        '''
+        data = {
+            "model": TAG_MODEL,
+            "prompt": f"Generate exactly betwen {n_tags_min} to {n_tags_max} concise tags for the following text (depending how descriptive the text is). Provide the tags only as a comma-separated list, with no additional text or explanation. Here's the text: {description}"
+        }
+
+        self._calls += 1
         final_response = ""
-        for line in response.iter_lines():
-            if line:
-                json_line = json.loads(line.decode('utf-8'))
-                if 'response' in json_line:
-                    final_response += json_line['response']
-                if json_line.get('done'):
-                    break
-        tag_list = [tag.strip() for tag in final_response.split(',')]
-        return tag_list
-    else:
-        raise HTTPException(status_code=response.status_code, detail=response.text)
+        try:
+            async with self.__get_client().stream("POST", self._url, json=data) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise HTTPException(status_code=response.status_code, detail=response.text)
+
+                async for line in response.aiter_lines():
+                    if line:
+                        json_line = json.loads(line)
+                        if 'response' in json_line:
+                            final_response += json_line['response']
+                        if json_line.get('done'):
+                            break
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="Tag generation timed out")
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=503, detail=f"Tag generation unavailable: {e}")
+
+        return [tag.strip() for tag in final_response.split(',') if tag.strip()]
+
+    def __get_client(self) -> httpx.AsyncClient:
+        '''
+            Returns the pooled client, making one for the running event loop
+        '''
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(TAG_READ_TIMEOUT, connect=TAG_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=TAG_MAX_CONNECTIONS,
+                                    max_keepalive_connections=TAG_MAX_CONNECTIONS))
+            self._loop = loop
+        return self._client
+
+    async def close(self) -> None:
+        '''
+            Closes the pooled client's connections
+        '''
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def get_stats(self) -> dict[str, int]:
+        '''
+            Returns number of cached descriptions, running and upstream calls
+        '''
+        return {
+            'cached': len(self._cache),
+            'inflight': len(self._inflight),
+            'calls': self._calls
+        }
+
+global tag_generator
+tag_generator = TagGenerator(url)
+
+async def auto_generate_tags(description: str, mode: str = TAG_SUGGEST_MODE) -> List[str]:
+    '''
+        Generates tags for a service description, locally and/or with the
+        model depending on mode (see TAG_SUGGEST_MODE)
+    '''
+    suggested = []
+    if mode != 'fallback':
+        suggested = data_store.suggest_tags(description, n_tags_max)
+        if mode == 'local' or len(suggested) >= TAG_SUGGEST_MIN:
+            return suggested
+
+    try:
+        return await tag_generator.generate(description)
+    except HTTPException:
+        if mode == 'fallback':
+            suggested = data_store.suggest_tags(description, n_tags_max)
+        if not suggested:
+            raise
+        print("Tag generation unavailable, using local suggestions")
+        return suggested
 
 def add_tag_wrapper(tag: str):
     '''
@@ -39,8 +203,10 @@ def add_tag_wrapper(tag: str):
     if tag == '':
         raise HTTPException(status_code=400, detail="Empty tag given")
     
-    if data_store.add_tag(tag) is None:
+    new_tag = data_store.add_tag(tag)
+    if new_tag is None:
         raise HTTPException(status_code=400, detail="Duplicate tag given")
+    db_queue_tag(new_tag.get_id(), new_tag)
 
 def get_tags_wrapper(_system: bool = False):
     '''
@@ -60,9 +226,15 @@ def delete_tag_wrapper(tag: str):
     if tag in defaults:
         raise HTTPException(status_code=400, detail="Attempted to delete system tag")
 
+    _tag = data_store.get_tag_by_name(tag)
+    services = data_store.filter_apis([tag], None, None)
     if data_store.delete_tag(tag) is None:
         raise HTTPException(status_code=404, detail="Tag not found")
 
+    for service in services:
+        db_queue_service(service.get_id(), service)
+    db_queue_delete('tags', _tag.get_id())
+
 def get_top_tags_wrapper(num: int, custom: bool = False):
     '''
         Wrapper function which grabs the top 'num' tags
@@ -0,0 +1,122 @@
+from typing import Dict, Optional, Set
+from concurrent.futures import Future, ThreadPoolExecutor
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+from PIL import Image
+from src.backend.classes.Document import Document
+from src.backend.server.documents import (ICON_SIZES, VARIANT_EXTENSIONS, VARIANT_PATH,
+                                          doc_response, variant_key, variant_path)
+import asyncio
+import os
+import tempfile
+
+
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+WEBP_QUALITY = 80
+
+# Pillow format each variant type is saved as, and its options
+VARIANT_FORMATS = {
+    'image/webp': ('WEBP', {'quality': WEBP_QUALITY, 'method': 4}),
+    'image/png': ('PNG', {'optimize': True}),
+}
+
+# Pillow releases the GIL while decoding, resizing and encoding, so
+# rendering runs on a thread pool, off the event loop
+_pool = ThreadPoolExecutor(THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+_rendering: Dict[str, Future] = {}     # variant key -> render running or waiting
+_unrenderable: Set[str] = set()         # variant keys of images Pillow can't decode
+
+
+def render_variants(source: str, key: str) -> None:
+    '''
+        Writes every size and type of variant of an image. Sizes are
+        rendered largest first, each shrunk from the one before, and each
+        file is renamed into place once written - so a variant which exists
+        is complete
+    '''
+    os.makedirs(VARIANT_PATH, exist_ok=True)
+    with Image.open(source) as image:
+        # JPEGs can be decoded straight to a reduced scale
+        image.draft('RGB', (ICON_SIZES[0], ICON_SIZES[0]))
+        transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if transparent else 'RGB')
+
+    for size in ICON_SIZES:
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for content_type, (format, options) in VARIANT_FORMATS.items():
+            fd, temp_path = tempfile.mkstemp(dir=VARIANT_PATH, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    image.save(out, format=format, **options)
+                os.replace(temp_path, variant_path(key, size, content_type))
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+
+def has_variants(key: str) -> bool:
+    '''
+        Returns whether every variant under the given key has been written
+    '''
+    return all(os.path.exists(variant_path(key, size, content_type))
+               for size in ICON_SIZES for content_type in VARIANT_EXTENSIONS)
+
+
+def schedule_variants(doc: Document) -> Future:
+    '''
+        Queues rendering a document's variants on the thumbnail pool, unless
+        already rendered or queued. Returns the render
+    '''
+    key = variant_key(doc)
+    render = _rendering.get(key)
+    if render is not None:
+        return render
+
+    render = Future()
+    if has_variants(key):
+        render.set_result(None)
+        return render
+
+    render = _pool.submit(render_variants, doc.get_path(), key)
+    _rendering[key] = render
+    render.add_done_callback(lambda done: _finish_render(key, done))
+    return render
+
+
+def _finish_render(key: str, render: Future) -> None:
+    _rendering.pop(key, None)
+    if render.exception() is not None:
+        _unrenderable.add(key)
+        print(f"Failed to render icon variants of {key}: {render.exception()}")
+
+
+async def icon_response(doc: Document, size: Optional[int], accept: Optional[str]) -> FileResponse:
+    '''
+        Returns an icon's file - the original if size is not given, else its
+        variant of that size, as WebP if the client accepts it (by its Accept
+        header) or optimised PNG if not. Variants not yet rendered are
+        rendered first, and the original is returned if it can't be
+
+        Raises:     HTTP Error 400 if size is not one of ICON_SIZES
+    '''
+    if size is None:
+        return doc_response(doc)
+    if size not in ICON_SIZES:
+        sizes = ', '.join(map(str, sorted(ICON_SIZES)))
+        raise HTTPException(status_code=400, detail=f"Icon size must be one of {sizes}")
+
+    content_type = 'image/webp' if accept is not None and 'image/webp' in accept else 'image/png'
+    key = variant_key(doc)
+    path = variant_path(key, size, content_type)
+    if key in _unrenderable:
+        return doc_response(doc)
+    if not os.path.exists(path):
+        try:
+            await asyncio.wrap_future(schedule_variants(doc))
+        except Exception:
+            return doc_response(doc)
+
+    # Variants are named by their original's digest, so can be cached by it
+    return FileResponse(path, media_type=content_type,
+                        headers={'ETag': f'"{key}_{size}{VARIANT_EXTENSIONS[content_type]}"',
+                                 'Vary': 'Accept'})
@@ -12,10 +12,15 @@ from src.backend.classes.Endpoint import Endpoint
 from src.backend.classes.Response import Response
 from src.backend.classes.Parameter import Parameter
 from src.backend.server.service import parse_yaml_to_api
+from src.backend.server.documents import place_blob, store_document
+from src.backend.server.thumbnails import schedule_variants
 from src.backend.classes.User import User
 from src.backend.database import *
+from typing import Dict, Optional
 import aiofiles
+import hashlib
 import os
+import tempfile
 
 
 # Constants
@@ -23,65 +28,104 @@ IMAGE_PATH = "static/imgs"
 DOC_PATH = "static/docs"
 YAML_PATH = "static/yaml"
 MB1 = 1024 * 1024
+UPLOAD_CHUNK = 64 * 1024    # Bytes read, hashed and written at a time
 IMAGE_TYPES = ["image/jpg", "image/jpeg", "image/png"]
 
+# Largest upload accepted of each type, in bytes
+IMAGE_LIMITS = {'image/png': 5 * MB1, 'image/jpeg': 5 * MB1}
+DOC_LIMITS = {'application/pdf': 20 * MB1}
 
-async def upload_file(file: UploadFile, path: str) -> str:
+# Leading bytes identifying each accepted type
+MAGIC_BYTES = {
+    'application/pdf': b'%PDF-',
+    'image/png': b'\x89PNG\r\n\x1a\n',
+    'image/jpeg': b'\xff\xd8\xff',
+}
+MAGIC_LENGTH = max(map(len, MAGIC_BYTES.values()))
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+   '''
+       Returns the type a file's leading bytes identify, if accepted
    '''
-       Helper function which uploads a given file to the given file path,
-       returning the file path
+   for content_type, magic in MAGIC_BYTES.items():
+       if head.startswith(magic):
+           return content_type
+   return None
+
+
+async def upload_file(file: UploadFile, path: str, limits: Dict[str, int], type_error: str) -> dict[str, str]:
    '''
-   path_name = os.path.splitext(f"/{file.filename}")
-   path_ext = f"{path_name[0]}_{data_store.num_docs()}{path_name[1]}"
-   path += path_ext
+       Helper function which streams a given file into the given directory,
+       returning its path, type (sniffed from its contents, as the client's
+       content_type can't be trusted) and SHA-256 digest
 
+       The file is written to a temporary file alongside its destination,
+       hashing each chunk as it is written, then renamed into place under
+       its digest (see place_blob) - so only a chunk is held in memory, and
+       identical uploads are stored once
 
+       Raises:     HTTP Error 400 (type_error) if the file is not of a type
+                   in limits, HTTP Error 413 once it exceeds its type's limit
+   '''
+   fd, temp_path = tempfile.mkstemp(dir=path, suffix='.part')
+   os.close(fd)
+
+   streamed = False
    try:
-       async with aiofiles.open(path, 'wb') as f:
-           while contents := await file.read(MB1):
+       head = b''
+       while len(head) < MAGIC_LENGTH and (chunk := await file.read(MAGIC_LENGTH - len(head))):
+           head += chunk
+       content_type = sniff_type(head)
+       if content_type not in limits:
+           raise HTTPException(status_code=400, detail=type_error)
+       limit = limits[content_type]
+
+       digest = hashlib.sha256(head)
+       size = len(head)
+       async with aiofiles.open(temp_path, 'wb') as f:
+           await f.write(head)
+           while contents := await file.read(UPLOAD_CHUNK):
+               size += len(contents)
+               if size > limit:
+                   raise HTTPException(status_code=413,
+                                       detail=f"File exceeds the {limit // MB1}MB limit")
+               digest.update(contents)
                await f.write(contents)
+
+       streamed = True
+   except HTTPException:
+       raise
    except Exception as e:
        raise HTTPException(status_code=400, detail=f"Error with uploading file: {e}")
-  
    finally:
+       if not streamed:
+           os.remove(temp_path)
        await file.close()
-  
-   return path
+
+   # Nothing is awaited from here until the caller stores the document, so
+   # a stored file identical to this one can't be collected in between
+   sha256 = digest.hexdigest()
+   return {'path': place_blob(temp_path, path, sha256, content_type), 'type': content_type, 'sha256': sha256}
 
 
 async def upload_pdf_wrapper(file: UploadFile) -> str:
    '''
        Function which uploads pdf files
    '''
-   path = DOC_PATH
-   # Check type
-   if file.content_type != 'application/pdf':
-       raise HTTPException(status_code=400, detail="File uploaded is not PDF")
-
-
-   path = await upload_file(file, path)
-   doc = Document(str(data_store.num_docs()), path, file.content_type)
-
-
-   data_store.add_docs(doc)
+   upload = await upload_file(file, DOC_PATH, DOC_LIMITS, "File uploaded is not PDF")
+   doc = store_document(upload)
    return str(doc.get_id())
 
 
 async def upload_img_wrapper(file: UploadFile) -> int:
    '''
-       Function which uploads image files
+       Function which uploads image files, queueing rendering its resized
+       variants (see icon_response) in the background
    '''
-   path = IMAGE_PATH
-   # Check type
-   if file.content_type not in IMAGE_TYPES:
-       raise HTTPException(status_code=400, detail="File uploaded is not JPG, JPEG or PNG")
-
-
-   path = await upload_file(file, path)
-   doc = Document(str(data_store.num_docs()), path, file.content_type)
-
-
-   data_store.add_docs(doc)
+   upload = await upload_file(file, IMAGE_PATH, IMAGE_LIMITS, "File uploaded is not JPG, JPEG or PNG")
+   doc = store_document(upload)
+   schedule_variants(doc)
    return str(doc.get_id())
 
 
@@ -96,7 +140,7 @@ async def import_yaml_wrapper(file: UploadFile, user: User) -> Service:
        raise HTTPException(status_code=400, detail=f"Invalid YAML format")
 
 
-   api = parse_yaml_to_api(yaml_data, user)
+   api = await parse_yaml_to_api(yaml_data, user)
    return str(api.get_id())
 
 
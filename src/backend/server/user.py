@@ -1,4 +1,4 @@
-from typing import TypeVar, List
+from typing import TypeVar, List, Optional
 from fastapi import File, UploadFile, HTTPException
 from fastapi.responses import FileResponse
 from PIL import Image
@@ -8,10 +8,10 @@ from src.backend.classes.datastore import data_store
 from src.backend.classes.API import API
 from src.backend.database import *
 import re
-from src.backend.server.email import send_email
-from src.backend.server.service import delete_service
-from src.backend.server.review import review_delete_wrapper, review_remove_vote_wrapper
-from src.backend.classes.Manager import blacklist_user_token
+from src.backend.server.email import queue_email
+from src.backend.server.cascade import cascade_delete
+from src.backend.server.documents import release_docs
+from src.backend.server.thumbnails import icon_response
 
 def user_add_icon_wrapper(uid: str, doc_id: str) -> None:
     '''
@@ -29,7 +29,11 @@ def user_add_icon_wrapper(uid: str, doc_id: str) -> None:
         raise HTTPException(status_code=404, detail="No such icon found")
     
     # Link icon with user
+    previous = user.get_icon()
     user.modify_icon(doc_id)
+    data_store.retain_doc(doc_id)
+    release_docs([previous])
+    db_queue_user(uid, user)
 
 def user_delete_icon_wrapper(uid: str) -> None:
     '''
@@ -41,7 +45,11 @@ def user_delete_icon_wrapper(uid: str) -> None:
         raise HTTPException(status_code=404, detail="No such user found")
 
     # Remove icon (restore to default)
+    previous = user.get_icon()
     user.remove_icon()
+    data_store.retain_doc(user.get_icon())
+    release_docs([previous])
+    db_queue_user(uid, user)
 
 def user_get_wrapper(uid: str):
     '''
@@ -54,9 +62,10 @@ def user_get_wrapper(uid: str):
 
     return user.to_summary_json()
 
-def user_get_icon_wrapper(uid: str) -> FileResponse:
+async def user_get_icon_wrapper(uid: str, size: Optional[int] = None, accept: Optional[str] = None) -> FileResponse:
     '''
-        Wrapper which returns user's icon file
+        Wrapper which returns user's icon file, or its variant of the given
+        size (see icon_response)
     '''
     # Grab user
     user = data_store.get_user_by_id(uid)
@@ -65,7 +74,7 @@ def user_get_icon_wrapper(uid: str) -> FileResponse:
 
     icon_id = user.get_icon()
     icon = data_store.get_doc_by_id(icon_id)
-    return FileResponse(icon.get_path())
+    return await icon_response(icon, size, accept)
 
 def user_get_reviews_wrapper(uid: str) -> List[dict[str, str]]:
     '''
@@ -77,10 +86,10 @@ def user_get_reviews_wrapper(uid: str) -> List[dict[str, str]]:
         raise HTTPException(status_code=404, detail="No such user found")
 
     reviews = []
-    for rid in user.get_reviews():
-        review = data_store.get_review_by_id(rid)
+    name = user.get_displayname()
+    for review in data_store.get_reviews_by_ids(user.get_reviews()):
         json = review.to_json(brief=True)
-        json['reviewerName'] = user.get_displayname()
+        json['reviewerName'] = name
         reviews.append(json)
     return reviews
 
@@ -96,7 +105,7 @@ def user_get_profile_wrapper(uid: str) -> dict[str, str]:
 
     return user.get_profile()
 
-def user_self_delete(uid: str):
+async def user_self_delete(uid: str):
     '''
         Allows the user to delete their own account  
     '''
@@ -104,38 +113,23 @@ def user_self_delete(uid: str):
     if user is None:
         raise HTTPException(status_code=404, detail="No such user found")
     username = user.get_name()
-    user_delete_association(uid)
-    data_store.delete_item(uid, 'user')
-    db_status = db_delete_user(username)
+    db_status = await user_delete_association(uid)
     action = "self"
     uname = username
     uemail = user.get_email()
     content = {'action': action, 'uname': uname}
-    send_email(uemail, '', 'account_deleted', content)
+    queue_email(uemail, '', 'account_deleted', content)
 
     return {"name": username, "deleted": db_status}
 
-def user_delete_association(uid: str):
-    user = data_store.get_user_by_id(uid)
-    upvoted_review_ids = user.get_upvotes()
-    downvoted_review_ids = user.get_downvotes()
-    for rid in upvoted_review_ids:
-        review_remove_vote_wrapper(rid, uid)
-
-    for rid in downvoted_review_ids:
-        review_remove_vote_wrapper(rid, uid)
-    
-    review_ids = user.get_reviews()
-    for rid in review_ids:
-        review_delete_wrapper(rid, '0', True) 
-
-    service_ids = user.get_services()
-    for sid in service_ids:
-        delete_service(sid, '0', True)
-
-    blacklist_user_token(uid)
+async def user_delete_association(uid: str) -> bool:
+    '''
+        Deletes a user along with their services, reviews, replies and
+        votes (see Cascade)
+    '''
+    return await cascade_delete(uids=[uid])
 
-def user_update_displayname(uid: str, new: str) -> None:
+async def user_update_displayname(uid: str, new: str) -> None:
     '''
         Allows the user to update their displayname
     '''
@@ -143,7 +137,7 @@ def user_update_displayname(uid: str, new: str) -> None:
     if user is None:
         raise HTTPException(status_code=404, detail="No such user found")
     user.modify_displayname(new)
-    db_update_user(uid, user.to_json())
+    await db_update_user(uid, user)
 
     return {"displayname": new, "updated": True}
 
@@ -157,11 +151,11 @@ def user_get_replies_wrapper(uid: str) -> List[dict[str, str]]:
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    replies = user.get_replies()
     output = []
-    for _reply in replies:
-        reply = data_store.get_reply_by_id(_reply).to_json()
-        reply['reviewerName'] = user.get_displayname()
+    name = user.get_displayname()
+    for _reply in data_store.get_replies_by_ids(user.get_replies()):
+        reply = _reply.to_json()
+        reply['reviewerName'] = name
         output.append(reply)
     return {
         'replies' : output
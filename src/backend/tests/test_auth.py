@@ -234,4 +234,331 @@ def test_register_duplicate_email():
         "email" : "doxxed@gmail.com"
     })
     assert response.status_code == 400
-    assert response.json() == {"detail": "Email already registered"}
\ No newline at end of file
+    assert response.json() == {"detail": "Email already registered"}
+
+
+def test_register_duplicate_case_insensitive():
+    """Test usernames and emails are unique regardless of case."""
+    client.post("/auth/register", json={
+        "displayname": "testuser",
+        "username": "testuser",
+        "password": "testpassword",
+        "email" : "doxxed@gmail.com"
+    })
+    response = client.post("/auth/register", json={
+        "displayname": "testuser",
+        "username": "TestUser",
+        "password": "newpassword",
+        "email" : "other@gmail.com"
+    })
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Username already taken"}
+
+    response = client.post("/auth/register", json={
+        "displayname": "testuser",
+        "username": "testuser2",
+        "password": "newpassword",
+        "email" : "Doxxed@Gmail.com"
+    })
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Email already registered"}
+
+    response = client.post("/auth/login", json={
+        "username": "TESTUSER",
+        "password": "testpassword"
+    })
+    assert response.status_code == 200
+
+
+def test_register_concurrent_unique():
+    """Test only one of many concurrent registrations of a name succeeds."""
+    from threading import Thread
+    from src.backend.classes.datastore import data_store, DuplicateError
+    from src.backend.classes.User import User
+
+    results = []
+    def attempt(i):
+        user = User(f"race{i}", "racer", "racer", "", f"racer{i}@gmail.com", False, False)
+        try:
+            data_store.add_user(user)
+            results.append(True)
+        except DuplicateError:
+            results.append(False)
+
+    threads = [Thread(target=attempt, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 1
+    assert data_store.get_user_by_name("RACER") is not None
+
+
+def test_modify_username_email_unique():
+    """Test renaming a user keeps usernames and emails unique and reindexed."""
+    from src.backend.classes.datastore import Datastore, DuplicateError
+    from src.backend.classes.User import User
+
+    store = Datastore()
+    first = User("0", "first", "first", "", "first@gmail.com", False, False)
+    second = User("1", "second", "second", "", "second@gmail.com", False, False)
+    store.add_user(first)
+    store.add_user(second)
+
+    with pytest.raises(DuplicateError):
+        store.modify_username("1", "FIRST")
+    with pytest.raises(DuplicateError):
+        store.modify_email("1", "First@Gmail.com")
+    assert second.get_name() == "second" and second.get_email() == "second@gmail.com"
+
+    store.modify_username("0", "Renamed")
+    store.modify_email("0", "renamed@gmail.com")
+    assert store.get_user_by_name("renamed") is first
+    assert store.get_user_by_name("first") is None
+    assert store.get_user_by_email("RENAMED@gmail.com") is first
+
+    # Freed names can be taken, and a user may change their own name's case
+    store.modify_username("1", "first")
+    store.modify_email("1", "first@gmail.com")
+    store.modify_username("0", "RENAMED")
+    assert store.get_user_by_name("first") is second
+    assert first.get_name() == "RENAMED"
+
+
+def test_deleted_user_frees_username():
+    """Test deleting a user releases their username and email."""
+    response = client.post("/auth/register", json={
+        "displayname": "testuser",
+        "username": "testuser",
+        "password": "testpassword",
+        "email" : "doxxed@gmail.com"
+    })
+    token = client.post("/auth/login", json={
+        "username": "testuser",
+        "password": "testpassword"
+    }).json()["access_token"]
+    response = client.delete("/user/delete/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    response = client.post("/auth/register", json={
+        "displayname": "testuser",
+        "username": "testuser",
+        "password": "testpassword",
+        "email" : "doxxed@gmail.com"
+    })
+    assert response.status_code == 200
+
+
+def test_hashing_saturated():
+    """Test password hashing is rejected with a 429 once its queue is full."""
+    import asyncio
+    from threading import Event
+    from fastapi import HTTPException
+    from src.backend.classes.Manager import Manager, _manager
+
+    release = Event()
+    class SlowContext:
+        def hash(self, password):
+            release.wait(5)
+            return f"hashed {password}"
+
+    pool = Manager(_manager, SlowContext(), hash_workers=1, hash_queue_limit=1)
+
+    async def scenario():
+        running = asyncio.create_task(pool.hash_password("a"))
+        waiting = asyncio.create_task(pool.hash_password("b"))
+        await asyncio.sleep(0.05)
+        assert pool.get_hash_queue_depth() == 1
+
+        with pytest.raises(HTTPException) as error:
+            await pool.hash_password("c")
+        assert error.value.status_code == 429
+        assert error.value.headers["Retry-After"] == "1"
+
+        release.set()
+        return await asyncio.gather(running, waiting)
+
+    assert asyncio.run(scenario()) == ["hashed a", "hashed b"]
+    assert pool.get_hash_stats() == {
+        'workers': 1, 'in_flight': 0, 'queue_depth': 0, 'queue_limit': 1, 'rejected': 1
+    }
+
+
+def test_hashing_metrics():
+    """Test admins can read the hashing pool's load."""
+    token = client.post("/auth/login", json={
+        "username": "superadmin",
+        "password": "superadminpassword"
+    }).json()["access_token"]
+    response = client.get("/admin/metrics/hashing", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()['in_flight'] == 0
+    assert response.json()['workers'] >= 1
+
+
+def test_token_cache(monkeypatch):
+    """Test cached tokens expire, are evicted oldest first and drop per user."""
+    from src.backend.classes import Manager
+
+    now = [1000.0]
+    monkeypatch.setattr(Manager.time, 'time', lambda: now[0])
+    cache = Manager.TokenCache(ttl=10, size=3)
+    cache.put('a', '1', 'principal a')
+    cache.put('b', '1', 'principal b', expires=1005)
+    cache.put('c', '2', 'principal c')
+    assert cache.get('a') == 'principal a' and len(cache) == 3
+
+    now[0] = 1006
+    assert cache.get('b') is None and cache.get('c') == 'principal c'
+    cache.put('d', '3', 'principal d')
+    cache.put('e', '3', 'principal e')
+    assert cache.get('a') is None and len(cache) == 3
+
+    cache.invalidate('3')
+    assert cache.get('d') is None and cache.get('c') == 'principal c'
+    now[0] = 1011
+    assert cache.get('c') is None and len(cache) == 0
+
+    disabled = Manager.TokenCache(ttl=0, size=3)
+    disabled.put('a', '1', 'principal a')
+    assert disabled.get('a') is None
+
+
+def test_principal_invalidated():
+    """Test role changes, logout and deletion apply to cached principals at once."""
+    from src.backend.classes.Manager import _manager
+
+    client.post("/auth/register", json={
+        "displayname": "testuser",
+        "username": "testuser",
+        "password": "testpassword",
+        "email" : "doxxed@gmail.com"
+    })
+    user = {"Authorization": f"Bearer {client.post('/auth/login', json={'username': 'testuser', 'password': 'testpassword'}).json()['access_token']}"}
+    admin = {"Authorization": f"Bearer {client.post('/auth/login', json={'username': 'superadmin', 'password': 'superadminpassword'}).json()['access_token']}"}
+
+    assert client.get("/auth/admin", headers=user).status_code == 403
+    assert len(_manager.principals) == 1
+
+    assert client.post("/admin/promote", headers=admin, params={'uid': '1'}).status_code == 200
+    assert client.get("/auth/admin", headers=user).status_code == 200
+    assert client.post("/admin/demote", headers=admin, params={'uid': '1'}).status_code == 200
+    assert client.get("/auth/admin", headers=user).status_code == 403
+
+    assert client.post("/auth/logout", headers=user).status_code == 200
+    assert client.get("/auth/account", headers=user).status_code == 401
+
+    user = {"Authorization": f"Bearer {client.post('/auth/login', json={'username': 'testuser', 'password': 'testpassword'}).json()['access_token']}"}
+    assert client.get("/auth/account", headers=user).status_code == 200
+    assert client.delete("/admin/delete/user", headers=admin, params={'uid': '1'}).status_code == 200
+    assert client.get("/auth/account", headers=user).status_code == 401
+
+
+def test_revocation_expiry(monkeypatch):
+    """Test revoked tokens expire in order, and restored tokens are skipped."""
+    from src.backend.classes import RevocationStore
+
+    now = [1000.0]
+    monkeypatch.setattr(RevocationStore.time, 'time', lambda: now[0])
+    store = RevocationStore.RevocationStore()
+    for i in range(10):
+        store.revoke(f"token {i}", str(i), 1010 + i)
+    store.restore("token 3", 2000)
+    store.revoke("token 5", '5', 1100)
+    assert store.is_revoked("token 0") and not store.is_revoked("token 3")
+    assert len(store) == 9
+
+    now[0] = 1010
+    assert not store.is_revoked("token 0")
+    assert store.purge() == 1
+    assert store.purge(1015) == 3
+    assert [store.is_revoked(f"token {i}") for i in range(4, 10)] == [False, True, True, True, True, True]
+    assert store.purge(1100) == 5 and len(store) == 0
+
+
+def test_revocation_shared():
+    """Test revocations made by one worker reach another through MongoDB."""
+    import asyncio
+    import time
+    from src.backend.classes.RevocationStore import RevocationStore
+
+    collection = db.test_revoked_tokens
+    revoked = []
+    first = RevocationStore(collection)
+    second = RevocationStore(collection, on_revoke=revoked.append)
+
+    async def scenario():
+        await collection.delete_many({})
+        first.revoke("token a", '1', time.time() + 60)
+        first.revoke("token b", '2', time.time() + 60)
+        await first.sync()
+        await second.sync()
+        assert second.is_revoked("token a") and second.is_revoked("token b")
+        assert sorted(revoked) == ['1', '2']
+
+        second.restore("token a", time.time() + 60)
+        await second.sync()
+        await first.sync()
+        assert not first.is_revoked("token a") and first.is_revoked("token b")
+
+        # Re-reading the same changes does nothing
+        await second.sync()
+        assert sorted(revoked) == ['1', '2']
+
+        first.clear()
+        await first.sync()
+        assert await collection.count_documents({}) == 0
+
+    asyncio.run(scenario())
+
+
+def test_revoked_request_token():
+    """Test a token revoked by another worker is refused, whatever token the user holds here."""
+    import time
+    from src.backend.classes.Manager import revoked_tokens
+    from src.backend.classes.datastore import data_store
+
+    client.post("/auth/register", json={
+        "displayname": "testuser",
+        "username": "testuser",
+        "password": "testpassword",
+        "email" : "doxxed@gmail.com"
+    })
+    token = client.post('/auth/login', json={'username': 'testuser', 'password': 'testpassword'}).json()['access_token']
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/auth/account", headers=headers).status_code == 200
+
+    # Another worker's login isn't written back, so its copy of the user holds an older token
+    data_store.get_user_by_id('1').update_token('older token')
+    revoked_tokens.revoke(token, '1', time.time() + 60)
+    assert client.get("/auth/account", headers=headers).status_code == 401
+
+
+def test_revocation_write_failed():
+    """Test revocations whose write fails are written on the next sync."""
+    import asyncio
+    import time
+    from src.backend.classes.RevocationStore import RevocationStore
+
+    collection = db.test_revoked_tokens
+
+    class Failing:
+        def __getattr__(self, name):
+            return getattr(collection, name)
+
+        async def bulk_write(self, requests, ordered=True):
+            raise ConnectionError("mongo is down")
+
+    async def scenario():
+        await collection.delete_many({})
+        store = RevocationStore(Failing())
+        store.revoke("token a", '1', time.time() + 60)
+        with pytest.raises(ConnectionError):
+            await store.sync()
+
+        store._collection = collection
+        await store.sync()
+        assert await collection.count_documents({'revoked': True}) == 1
+
+    asyncio.run(scenario())
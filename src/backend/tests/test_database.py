@@ -0,0 +1,376 @@
+import asyncio
+from datetime import timezone
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from src.backend.database import WriteBehindQueue, db_load_datastore
+from src.backend.classes.API import API
+from src.backend.classes.datastore import Datastore
+from src.backend.classes.Document import Document
+from src.backend.classes.Review import Review
+from src.backend.classes.ReviewReply import ReviewReply
+from src.backend.classes.Service import ServiceStatus
+from src.backend.classes.Tag import Tag, CUSTOM
+from src.backend.classes.User import User
+
+
+class RecordingCollection:
+    '''
+        Wraps a mock Motor collection, recording the size of each bulk write
+    '''
+    def __init__(self, collection, fail: bool = False):
+        self.collection = collection
+        self.batches = []
+        self.fail = fail
+
+    async def bulk_write(self, requests, ordered=True):
+        if self.fail:
+            raise ConnectionError("mongo is down")
+        self.batches.append(len(requests))
+        return await self.collection.bulk_write(requests, ordered=ordered)
+
+
+def make_user(uid: str) -> User:
+    return User(uid, 'display', f"user{uid}", 'hash', f"user{uid}@email.com", False, False)
+
+@pytest.fixture
+def store():
+    '''
+        Mock database with two users, exposed through recording collections
+    '''
+    database = AsyncMongoMockClient().local
+    users = [make_user('0'), make_user('1')]
+    asyncio.run(database.users.insert_many([user.to_json() for user in users]))
+    return database, {'users': RecordingCollection(database.users)}, users
+
+def find_name(database, uid: str) -> str:
+    return asyncio.run(database.users.find_one({'id': uid}))['displayname']
+
+
+def test_coalesced_updates(store):
+    '''
+        Test that repeated updates to a document are written once, in one batch
+    '''
+    database, collections, users = store
+    queue = WriteBehindQueue(collections)
+
+    async def scenario():
+        for name in ['x', 'y', 'z']:
+            users[0].modify_displayname(name)
+            await queue.put('users', 'id', '0', users[0])
+        users[1].modify_displayname('w')
+        await queue.put('users', 'id', '1', users[1])
+        assert queue.num_pending() == 2
+        assert (await database.users.find_one({'id': '0'}))['displayname'] == 'display'
+        await queue.flush()
+
+    asyncio.run(scenario())
+    assert queue.num_pending() == 0
+    assert collections['users'].batches == [2]
+    assert find_name(database, '0') == 'z'
+    assert find_name(database, '1') == 'w'
+
+def test_size_threshold_flush(store):
+    '''
+        Test that reaching the batch size flushes without a background flusher
+    '''
+    database, collections, users = store
+    queue = WriteBehindQueue(collections, flush_size=2)
+    users[0].modify_displayname('x')
+    asyncio.run(queue.put('users', 'id', '0', users[0]))
+    assert collections['users'].batches == []
+
+    users[1].modify_displayname('y')
+    asyncio.run(queue.put('users', 'id', '1', users[1]))
+    assert collections['users'].batches == [2]
+    assert find_name(database, '1') == 'y'
+
+def test_background_flusher(store):
+    '''
+        Test that the background flusher writes on its interval
+    '''
+    database, collections, users = store
+    queue = WriteBehindQueue(collections, flush_interval=0.01)
+
+    async def scenario():
+        flusher = asyncio.create_task(queue.run())
+        await asyncio.sleep(0)
+        users[0].modify_displayname('x')
+        await queue.put('users', 'id', '0', users[0])
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if queue.num_pending() == 0:
+                break
+        flusher.cancel()
+
+    asyncio.run(scenario())
+    assert find_name(database, '0') == 'x'
+
+def test_failed_flush_requeued(store):
+    '''
+        Test that writes are kept when a flush fails
+    '''
+    database, collections, users = store
+    collections['users'].fail = True
+    queue = WriteBehindQueue(collections)
+    users[0].modify_displayname('x')
+    asyncio.run(queue.put('users', 'id', '0', users[0]))
+    with pytest.raises(ConnectionError):
+        asyncio.run(queue.flush())
+    assert queue.num_pending() == 1
+
+    collections['users'].fail = False
+    asyncio.run(queue.flush())
+    assert find_name(database, '0') == 'x'
+
+def test_cancelled_flush_requeued(store):
+    '''
+        Test that writes are kept when a flush is cancelled mid-write
+    '''
+    database, collections, users = store
+    queue = WriteBehindQueue(collections)
+    started = asyncio.Event()
+
+    async def stalled_write(requests, ordered=True):
+        started.set()
+        await asyncio.sleep(10)
+    collections['users'].bulk_write = stalled_write
+
+    async def scenario():
+        users[0].modify_displayname('x')
+        await queue.put('users', 'id', '0', users[0])
+        flush = asyncio.create_task(queue.flush())
+        await started.wait()
+        flush.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+    asyncio.run(scenario())
+    assert queue.num_pending() == 1
+
+    del collections['users'].bulk_write
+    asyncio.run(queue.flush())
+    assert find_name(database, '0') == 'x'
+
+def test_discard(store):
+    '''
+        Test that discarded writes are never flushed
+    '''
+    database, collections, users = store
+    queue = WriteBehindQueue(collections)
+    users[0].modify_displayname('x')
+    asyncio.run(queue.put('users', 'id', '0', users[0]))
+    asyncio.run(queue.discard('users'))
+    asyncio.run(queue.flush())
+    assert collections['users'].batches == []
+    assert find_name(database, '0') == 'display'
+
+def test_upserts_and_deletes():
+    '''
+        Test that reviews, replies, docs and tags are upserted in full, and
+        that a queued deletion replaces a pending write
+    '''
+    database = AsyncMongoMockClient().local
+    queue = WriteBehindQueue(database)
+    review = Review('0', '1', '2', 'positive', 'good')
+    reply = ReviewReply('3', '2', '2', 'thanks', '0')
+    review.add_reply('3')
+    doc = Document('4', 'static/docs/abc.pdf', 'application/pdf', 'abc')
+    tag = Tag(9, 'Weather', CUSTOM)
+    tag.add_live_server('2')
+
+    async def scenario():
+        queue.queue('reviews', 'rid', '0', review, upsert=True)
+        queue.queue('replies', 'rid', '3', reply, upsert=True)
+        queue.queue('docs', 'id', '4', doc, upsert=True)
+        queue.queue('tags', 'tid', 9, tag, upsert=True)
+        await queue.flush()
+        assert await database.docs.find_one({'id': '4'}, {'_id': 0}) == doc.to_json()
+        assert await database.tags.find_one({'tid': 9}, {'_id': 0}) == {'tid': 9, 'tag': 'Weather', 'type': CUSTOM}
+        stored = await database.reviews.find_one({'rid': '0'}, {'_id': 0})
+        assert Review.from_json(stored).to_json() == review.to_json()
+
+        review.update_vote('5', 'negative')
+        queue.queue('reviews', 'rid', '0', review, upsert=True)
+        queue.queue('replies', 'rid', '3', reply, upsert=True)
+        queue.queue('replies', 'rid', '3', None)
+        assert queue.num_pending() == 2
+        await queue.flush()
+        assert (await database.reviews.find_one({'rid': '0'}))['downvote_ids'] == ['5']
+        assert await database.replies.find_one({'rid': '3'}) is None
+    asyncio.run(scenario())
+
+def test_user_update_document():
+    '''
+        Test that only changed user fields are written, with list appends
+        and removals as $push/$pull
+    '''
+    user = make_user('0')
+    assert user.pop_changes() == {}
+
+    user.modify_displayname('new')
+    user.add_review('r0')
+    user.add_review('r1')
+    user.add_vote('r2', 'positive')
+    user.remove_vote('r3')
+    assert user.pop_changes() == {
+        '$set': {'displayname': 'new'},
+        '$push': {'reviews': {'$each': ['r0', 'r1']}, 'upvotes': {'$each': ['r2']}}
+    }
+    assert user.pop_changes() == {}
+
+    user.remove_review('r0')
+    assert user.pop_changes() == {'$pull': {'reviews': {'$in': ['r0']}}}
+
+    # Pushing and pulling the same list conflicts, so it is written whole
+    user.add_reply('p0')
+    user.add_reply('p1')
+    user.remove_reply('p0')
+    assert user.pop_changes() == {'$set': {'replies': ['p1']}}
+
+def test_service_update_document():
+    '''
+        Test that only changed service fields are written, with versions
+        edited in place set by index
+    '''
+    owner = make_user('0')
+    service = API('0', 'name', owner, '', 'desc', ['API'], [], 'v1', '', 'Free')
+    assert service.pop_changes() == {}
+
+    service.update_status(ServiceStatus.LIVE, 'ok')
+    service.add_review('r0', 'positive')
+    assert service.pop_changes() == {
+        '$set': {'status': 'LIVE', 'status_reason': 'ok', 'upvotes': 1, 'downvotes': 0},
+        '$push': {'reviews': {'$each': ['r0']}}
+    }
+
+    service.get_latest_version().update_status(ServiceStatus.LIVE, '')
+    owner.modify_displayname('renamed')
+    update = service.pop_changes()
+    assert list(update) == ['$set']
+    assert set(update['$set']) == {'owner', 'versions.0'}
+    assert update['$set']['versions.0']['status'] == 'LIVE'
+    assert update['$set']['owner']['displayName'] == 'renamed'
+
+    service.update_newly_created()
+    service.add_service_version('v2', [], '')
+    update = service.pop_changes()
+    assert set(update['$set']) == {'newly_created', 'versions'}
+    assert [version['version_name'] for version in update['$set']['versions']] == ['v2', 'v1']
+
+def test_flush_applies_update_documents(store):
+    '''
+        Test that flushed update documents leave the stored user matching
+        the object
+    '''
+    database, collections, users = store
+    queue = WriteBehindQueue(collections)
+    users[0].add_review('r0')
+    users[0].add_vote('r1', 'negative')
+    users[0].promote_to_admin()
+    asyncio.run(queue.put('users', 'id', '0', users[0]))
+    asyncio.run(queue.flush())
+
+    stored = asyncio.run(database.users.find_one({'id': '0'}, {'_id': 0}))
+    assert stored == users[0].to_json()
+
+def test_warm_start():
+    '''
+        Test that the datastore is rebuilt from stored users, services,
+        reviews, replies, tags and documents
+    '''
+    owner, reviewer = make_user('0'), make_user('3')
+    live = API('5', 'live', owner, '', 'weather data', ['API', 'Weather'], [], 'v1', '', 'Free')
+    live.update_status(ServiceStatus.LIVE, '')
+    live.add_review('7', 'positive')
+    pending = API('2', 'pending', owner, '', 'desc', ['API'], [], 'v1', '', 'Premium')
+    pending.update_status(ServiceStatus.UPDATE_PENDING, '')
+    review = Review('7', '3', '5', 'positive', 'great')
+    review.update_vote('0', 'positive')
+    reply = ReviewReply('1', '0', '5', 'thanks', '7')
+    review.add_reply('1')
+    reviewer.add_review('7')
+
+    database = AsyncMongoMockClient().local
+    async def seed():
+        await database.users.insert_many([owner.to_json(), reviewer.to_json()])
+        await database.services.insert_many([live.to_json(), pending.to_json()])
+        await database.reviews.insert_one(review.to_storage_json())
+        await database.replies.insert_one(reply.to_storage_json())
+        await database.tags.insert_one({'tid': 9, 'tag': 'Unused', 'type': CUSTOM, 'num': 0})
+        await database.docs.insert_one(Document('4', 'static/doc.pdf', 'application/pdf').to_json())
+    asyncio.run(seed())
+
+    store = Datastore()
+    timings = asyncio.run(db_load_datastore(store, database))
+    assert timings['total'] >= timings['services']
+
+    user = store.get_user_by_name('USER0')
+    assert user.get_services() == ['5', '2']
+    assert store.get_user_by_id('3').get_reviews() == ['7']
+    assert (store.num_users(), store.max_num_users()) == (2, 4)
+
+    api = store.get_api_by_id('5')
+    assert api.get_owner() is user
+    assert api.to_json() == live.to_json()
+    assert [api.get_id() for api in store.filter_apis(['Weather'], None, None)] == ['5']
+    assert [api.get_id() for api in store.search_apis('weather')] == ['5']
+    assert store.get_tag_ranking(-1, True)['tags'] == [{'tid': 10, 'tag': 'Weather', 'type': CUSTOM, 'num': 1}]
+    assert sorted(store.suggest_tags('weather', 5)) == ['API', 'Weather']
+    assert store.max_num_apis() == 6
+
+    # Pending updates are restored, so they can still be approved
+    assert store.get_api_by_id('2').to_updated_json()['pay_model'] == 'Premium'
+
+    loaded = store.get_review_by_id('7')
+    assert loaded.to_json(uid='0') == review.to_json(uid='0')
+    naive = review.to_storage_json() | {'timestamp': review._timestamp.astimezone(timezone.utc).replace(tzinfo=None)}
+    assert Review.from_json(naive).get_timestamp() == review.get_timestamp()
+    assert store.get_reply_by_id('1').to_json() == reply.to_json()
+    assert (store.total_reviews(), store.total_replies()) == (8, 2)
+    assert store.get_doc_by_id('4').get_path() == 'static/doc.pdf'
+    assert store.get_tag_by_name('Unused').get_id() == 9
+    assert store.num_docs() == 5
+
+    # Nothing loaded is pending a write
+    assert api.pop_changes() == {} and user.pop_changes() == {}
+
+def test_warm_start_lost_references():
+    '''
+        Test that references to reviews, replies and docs which weren't
+        stored are dropped, and their ids aren't reused
+    '''
+    owner, reviewer = make_user('0'), make_user('1')
+    kept, lost = Review('3', '1', '5', 'negative', 'meh'), Review('9', '1', '5', 'positive', 'lost')
+    kept.add_reply('6')
+    service = API('5', 'service', owner, '', 'desc', ['API'], [], 'v1', '', 'Free')
+    service.add_review('3', 'negative')
+    service.add_review('9', 'positive')
+    service.update_icon_id('12')
+    service.add_docs(['4', '8'], None)
+    reviewer.add_review('3')
+    reviewer.add_review('9')
+    reviewer.add_vote('9', 'positive')
+    reviewer.add_reply('6')
+    reviewer.modify_icon('12')
+
+    database = AsyncMongoMockClient().local
+    async def seed():
+        await database.users.insert_many([owner.to_json(), reviewer.to_json()])
+        await database.services.insert_one(service.to_json())
+        await database.reviews.insert_one(kept.to_storage_json())
+        await database.docs.insert_one(Document('4', 'static/doc.pdf', 'application/pdf').to_json())
+    asyncio.run(seed())
+
+    store = Datastore()
+    asyncio.run(db_load_datastore(store, database))
+    user, api = store.get_user_by_id('1'), store.get_api_by_id('5')
+    assert user.get_reviews() == ['3'] and user.get_upvotes() == [] and user.get_replies() == []
+    assert user.get_icon() == '0'
+    assert api.get_reviews() == ['3'] and api.get_icon() == '0' and api.get_docs() == ['4']
+    assert (api.to_json()['upvotes'], api.to_json()['downvotes']) == (0, 1)
+    assert store.get_review_by_id('3').get_reply() is None
+
+    # Counters continue after the lost ids
+    assert (store.total_reviews(), store.total_replies(), store.num_docs()) == (10, 7, 13)
+
+    # Dropping them isn't written back to MongoDB
+    assert user.pop_changes() == {} and api.pop_changes() == {}
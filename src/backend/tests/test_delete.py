@@ -3,6 +3,7 @@ from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from src.backend.app import app 
 from src.backend.classes.models import db
+from src.backend.classes.datastore import data_store
 from src.backend.classes.Endpoint import Endpoint
 from src.backend.classes.Parameter import Parameter 
 from src.backend.classes.Response import Response
@@ -378,3 +379,52 @@ def test_upvote_review_removed_service_delete(simple_user):
     assert response.json()["users"][3]["downvotes"] == []
 
 
+
+def test_cascade_user_delete(simple_user):
+    '''
+        Test that deleting a user removes their services, reviews, replies
+        and votes from every surviving user, service and review
+    '''
+    data = simple_user
+    creator = {"Authorization": f"Bearer {data['c_token']}"}
+    imposter = {"Authorization": f"Bearer {data['u_token']}"}
+    response = client.post("/auth/register", json={"displayname": "guest", "username": "guest",
+                                                   "password": "guestpassword", "email": "guest@gmail.com"})
+    gid = response.json()['uid']
+    response = client.post("/auth/login", json={"username": "guest", "password": "guestpassword"})
+    guest = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    # Imposter reviews the creator's service, which the creator replies to
+    response = client.post("/service/review/add", headers=imposter,
+                           json={'sid': data['sid'], 'rating': 'positive', 'comment': 'good'})
+    assert response.status_code == SUCCESS
+    response = client.post("/review/reply", headers=creator, json={'rid': '0', 'content': 'thanks'})
+    assert response.status_code == SUCCESS
+
+    # Creator reviews the imposter's service, voted on by both others
+    response = client.post("/service/add", headers=imposter,
+                           json={'name': 'Other API', 'description': 'other', 'tags': ['API'],
+                                 'endpoints': [simple_endpoint.model_dump()]})
+    other = response.json()['id']
+    response = client.post("/service/review/add", headers=creator,
+                           json={'sid': other, 'rating': 'negative', 'comment': 'bad'})
+    assert response.status_code == SUCCESS
+    for voter, vote in [(imposter, 'upvote'), (guest, 'downvote')]:
+        for rid in ['0', '1']:
+            response = client.post(f"/review/{vote}", headers=voter, json={'rid': rid})
+            assert response.status_code == (FORBIDDEN_ERROR if voter is imposter and rid == '0' else SUCCESS)
+
+    response = client.delete("/user/delete/me", headers=creator)
+    assert response.status_code == SUCCESS
+
+    assert data_store.get_api_by_id(data['sid']) is None
+    assert data_store.num_reviews() == 0 and data_store.get_reply_by_id('0') is None
+    survivor = data_store.get_user_by_id(data_store.get_api_by_id(other).get_owner().get_id())
+    assert survivor.get_reviews() == [] and survivor.get_upvotes() == []
+    assert data_store.get_user_by_id(gid).get_downvotes() == []
+    assert data_store.get_api_by_id(other).get_reviews() == []
+    assert data_store.get_api_by_id(other).get_ratings()['negative'] == 0
+    assert data_store.get_user_by_id(data['uid']) is None
+
+    response = client.get("/service/get/reviews", params={'sid': other})
+    assert response.json()['reviews'] == []
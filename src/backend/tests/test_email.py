@@ -10,6 +10,7 @@ from unittest.mock import patch, MagicMock
 from src.backend.classes.User import User
 import base64
 import os
+import asyncio
 
 # Create a test client
 client = TestClient(app)
@@ -177,4 +178,136 @@ def test_bad_token():
                             json={
                               'newpass' : "newpassword"
                             })
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+class StubTransport:
+    '''
+        Records batches instead of sending them, failing the first
+        `failures` sends of each message
+    '''
+    def __init__(self, failures: int = 0):
+        self.batches = []
+        self.failures = failures
+        self.attempts = {}
+
+    def send(self, messages):
+        self.batches.append(messages)
+        sent = []
+        for message in messages:
+            attempt = self.attempts.get(message['raw'], 0)
+            self.attempts[message['raw']] = attempt + 1
+            sent.append(attempt >= self.failures)
+        return sent
+
+def make_message(i):
+    return compose_email(f"user{i}@example.com", f"token{i}")
+
+def test_dispatcher_batches():
+    transport = StubTransport()
+    dispatcher = EmailDispatcher(transport, batch_size=2)
+    for i in range(5):
+        assert dispatcher.enqueue(make_message(i))
+
+    asyncio.run(dispatcher.flush())
+    assert [len(batch) for batch in transport.batches] == [2, 2, 1]
+    assert dispatcher.get_stats() == {'pending': 0, 'sent': 5, 'failed': 0, 'dropped': 0}
+
+def test_dispatcher_retries_with_backoff():
+    now = [100.0]
+    transport = StubTransport(failures=2)
+    dispatcher = EmailDispatcher(transport, max_attempts=3, retry_base=0.05, clock=lambda: now[0])
+    dispatcher.enqueue(make_message(0))
+
+    asyncio.run(dispatcher.flush())
+    assert dispatcher._queue[0]['due'] == pytest.approx(100.05)
+    asyncio.run(dispatcher.flush())
+    # Not yet due for a retry
+    assert len(transport.batches) == 1
+    assert dispatcher.num_pending() == 1
+
+    now[0] = dispatcher._queue[0]['due']
+    asyncio.run(dispatcher.flush())
+    assert len(transport.batches) == 2
+    # Second retry waits twice as long
+    assert dispatcher._queue[0]['due'] == pytest.approx(100.15)
+    now[0] = dispatcher._queue[0]['due'] - 0.001
+    asyncio.run(dispatcher.flush())
+    assert len(transport.batches) == 2
+    now[0] = dispatcher._queue[0]['due']
+    asyncio.run(dispatcher.flush())
+    assert dispatcher.get_stats() == {'pending': 0, 'sent': 1, 'failed': 0, 'dropped': 0}
+
+    # Gives up after max_attempts
+    transport.failures = 10
+    dispatcher = EmailDispatcher(transport, max_attempts=1)
+    dispatcher.enqueue(make_message(1))
+    asyncio.run(dispatcher.flush())
+    assert dispatcher.get_stats() == {'pending': 0, 'sent': 0, 'failed': 1, 'dropped': 0}
+
+def test_dispatcher_bounded():
+    dispatcher = EmailDispatcher(StubTransport(), max_queue=2)
+    assert dispatcher.enqueue(make_message(0))
+    assert dispatcher.enqueue(make_message(1))
+    assert not dispatcher.enqueue(make_message(2))
+    assert dispatcher.get_stats()['dropped'] == 1
+
+def test_dispatcher_background_send():
+    transport = StubTransport()
+    dispatcher = EmailDispatcher(transport, batch_size=2, interval=60)
+
+    async def scenario():
+        sender = asyncio.create_task(dispatcher.run())
+        await asyncio.sleep(0)
+        dispatcher.enqueue(make_message(0))
+        dispatcher.enqueue(make_message(1))
+        # A full batch is sent without waiting for the interval
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if dispatcher.num_pending() == 0:
+                break
+        sender.cancel()
+
+    asyncio.run(scenario())
+    assert len(transport.batches) == 1
+
+def test_dispatcher_persisted():
+    from mongomock_motor import AsyncMongoMockClient
+    collection = AsyncMongoMockClient().local.email_queue
+    dispatcher = EmailDispatcher(StubTransport(failures=1), collection)
+    dispatcher.enqueue(make_message(0))
+    dispatcher.enqueue(make_message(1))
+    asyncio.run(dispatcher.flush())
+    assert asyncio.run(collection.count_documents({})) == 2
+
+    # A restarted dispatcher sends what the last one left behind
+    transport = StubTransport()
+    restarted = EmailDispatcher(transport, collection, interval=0.01)
+
+    async def scenario():
+        sender = asyncio.create_task(restarted.run())
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if restarted.get_stats()['sent'] == 2:
+                break
+        sender.cancel()
+
+    asyncio.run(scenario())
+    assert restarted.get_stats()['sent'] == 2
+    assert asyncio.run(collection.count_documents({})) == 0
+
+def test_register_email_queued():
+    from src.backend.server.auth import register_wrapper
+    before = email_dispatcher.num_pending()
+    with patch('src.backend.server.email.get_credentials') as mock_get_credentials:
+        asyncio.run(register_wrapper("testuser", "testuser", "testpassword", "test@gmail.com", True))
+        # Registering only queues the email, leaving the send to the dispatcher
+        mock_get_credentials.assert_not_called()
+    assert email_dispatcher.num_pending() == before + 1
+
+def test_email_metrics():
+    token = client.post("/auth/login", json={
+        "username": "superadmin",
+        "password": "superadminpassword"
+    }).json()["access_token"]
+    response = client.get("/admin/metrics/email", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert set(response.json()) == {'pending', 'sent', 'failed', 'dropped'}
@@ -572,4 +572,182 @@ def test_duplicate_apis(simple_user):
         if "test2" == api['name'] and ['Not API', 'Public'] == api['tags']:
             found2 = True
     assert len(response_info) == 1
-    assert found1 and not found2
\ No newline at end of file
+    assert found1 and not found2
+def test_pay_model_filter(simple_user):
+    for name, pay_model in [('free1', 'Free'), ('premium1', 'Premium'), ('free2', 'Free')]:
+        response = client.post("/service/add",
+                               headers={"Authorization": f"Bearer {simple_user['token']}"},
+                               json={
+                                    'name' : name,
+                                    'description' : 'This is a test API',
+                                    'tags' : ['API'],
+                                    'endpoints': [simple_endpoint.model_dump()],
+                                    'pay_model': pay_model
+                               })
+        assert response.status_code == SUCCESS
+
+    response = client.get("/service/filter",
+                          params={
+                              'tags': ['API'],
+                              'pay_models': ['Free'],
+                              'hide_pending': False
+                          })
+    assert response.status_code == SUCCESS
+    assert [api['name'] for api in response.json()] == ['free1', 'free2']
+
+def test_filter_after_delete(simple_user):
+    sids = []
+    for name in ['test1', 'test2']:
+        response = client.post("/service/add",
+                               headers={"Authorization": f"Bearer {simple_user['token']}"},
+                               json={
+                                    'name' : name,
+                                    'description' : 'This is a test API',
+                                    'tags' : ['API', 'Private'],
+                                    'endpoints': [simple_endpoint.model_dump()]
+                               })
+        assert response.status_code == SUCCESS
+        sids.append(response.json()['id'])
+
+    response = client.delete("/service/delete",
+                             headers={"Authorization": f"Bearer {simple_user['token']}"},
+                             params={'sid': sids[0]})
+    assert response.status_code == SUCCESS
+
+    response = client.get("/service/filter",
+                          params={
+                              'tags': ['Private'],
+                              'providers': [simple_user['uid']],
+                              'hide_pending': False
+                          })
+    assert response.status_code == SUCCESS
+    assert [api['id'] for api in response.json()] == [sids[1]]
+
+def test_filter_after_tag_update(simple_user):
+    response = client.post("/service/add",
+                           headers={"Authorization": f"Bearer {simple_user['token']}"},
+                           json={
+                                'name' : 'test1',
+                                'description' : 'This is a test API',
+                                'tags' : ['API'],
+                                'endpoints': [simple_endpoint.model_dump()]
+                           })
+    assert response.status_code == SUCCESS
+    sid = response.json()['id']
+
+    response = client.post("/auth/login", json={
+        "username": "superadmin",
+        "password": "superadminpassword"
+    })
+    admin_token = response.json()["access_token"]
+
+    response = client.post("/service/update",
+                           headers={"Authorization": f"Bearer {simple_user['token']}"},
+                           json={
+                                'sid': sid,
+                                'name' : 'test1',
+                                'description' : 'This is a test API',
+                                'tags' : ['AI'],
+                                'pay_model': 'Premium'
+                           })
+    assert response.status_code == SUCCESS
+
+    response = client.post("/admin/service/approve",
+                           headers={"Authorization": f"Bearer {admin_token}"},
+                           json={
+                                'sid': sid,
+                                'reason': 'ok',
+                                'approved': True,
+                                'service_global': True
+                           })
+    assert response.status_code == SUCCESS
+
+    response = client.get("/service/filter", params={'tags': ['API']})
+    assert response.json() == []
+
+    response = client.get("/service/filter", params={'tags': ['AI'], 'pay_models': ['Premium']})
+    assert [api['id'] for api in response.json()] == [sid]
+
+def test_filter_summary_refreshes(simple_user):
+    '''
+        Test that cached service summaries reflect later changes
+    '''
+    response = client.post("/service/add",
+                           headers={"Authorization": f"Bearer {simple_user['token']}"},
+                           json={
+                                'name' : 'Googl3',
+                                'description' : 'This is a test API',
+                                'tags' : ['API'],
+                                'endpoints': [simple_endpoint.model_dump()],
+                                'version_name': 'v1'
+                           })
+    assert response.status_code == SUCCESS
+    sid = response.json()['id']
+
+    params = {'tags': ['API'], 'hide_pending': False}
+    response = client.get("/service/filter", params=params)
+    assert response.status_code == SUCCESS
+    assert response.json()[0]['owner'] == 'Tester 1'
+    assert response.json() == client.get("/service/filter", params=params).json()
+
+    response = client.post("/user/update/displayname",
+                           headers={"Authorization": f"Bearer {simple_user['token']}"},
+                           json={'content': 'Renamed'})
+    assert response.status_code == SUCCESS
+
+    response = client.get("/service/filter", params=params)
+    assert response.status_code == SUCCESS
+    assert response.json()[0]['owner'] == 'Renamed'
+
+    response = client.get("/service/search", params={'name': 'googl3', 'hide_pending': False})
+    assert response.status_code == SUCCESS
+    assert response.json()[0]['owner'] == 'Renamed'
+
+    response = client.get("/service/get_service", params={'sid': sid})
+    assert response.status_code == SUCCESS
+    assert response.json()['owner']['displayName'] == 'Renamed'
+    assert '_id' not in response.json()
+
+    response = client.get("/service/my_services",
+                          headers={"Authorization": f"Bearer {simple_user['token']}"})
+    assert response.status_code == SUCCESS
+    assert response.json()[0]['owner'] == 'Renamed'
+
+def test_private_datastore_reindexes():
+    '''
+        Test that services reindex through the datastore holding them,
+        rather than the global one
+    '''
+    from src.backend.classes.API import API
+    from src.backend.classes.User import User as Owner
+    from src.backend.classes.datastore import Datastore, data_store
+
+    clear_all()
+    store = Datastore()
+    owner = Owner('0', 'owner', 'owner', '', 'owner@test', False, False)
+    store.add_user(owner)
+    api = API('0', 'alpha', owner, '', 'first', ['API'], [], 'v1', '', 'Free')
+    store.add_api(api)
+
+    api.update_name('bravo')
+    api.add_tag('AI')
+    api.update_pay_model('Premium')
+    assert [a.get_id() for a in store.search_apis('bravo')] == ['0']
+    assert store.search_apis('alpha') == []
+    assert store.filter_api_ids(['AI'], None, ['Premium']) == {'0'}
+    assert data_store.filter_api_ids(['AI'], None, None) == set()
+
+    # Approved updates move the service between the store's own tags
+    store.add_tag('AI')
+    store.add_tag('Maps')
+    store.get_tag_by_name('AI').add_server('0')
+    api.create_pending_update('bravo', 'first', ['API', 'Maps'], 'Premium')
+    api.complete_update()
+    assert store.get_tag_by_name('Maps').get_servers() == {'0'}
+    assert store.get_tag_by_name('AI').get_servers() == set()
+    assert data_store.get_tag_by_name('Maps') is None
+    assert store.filter_api_ids(['Maps'], None, None) == {'0'}
+
+    store.delete_item('0', 'api')
+    api.update_name('charlie')
+    assert store.search_apis('charlie') == []
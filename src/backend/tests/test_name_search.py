@@ -210,4 +210,106 @@ def test_simple_regex_sensitivity(simple_user):
                           })
     assert (response.status_code) == SUCCESS 
     response_info = response.json()
-    assert any(api['name'] == api1['name'] for api in response_info)
\ No newline at end of file
+    assert any(api['name'] == api1['name'] for api in response_info)
+
+def test_search_ranking_and_fields(simple_user):
+    apis = [
+        {
+            'name' : 'Weather Service',
+            'description' : 'Forecasts for any city',
+            'tags' : ['API'],
+            'endpoints': [simple_endpoint.model_dump()]
+        },
+        {
+            'name' : 'Maps',
+            'description' : 'Weather overlays on maps',
+            'tags' : ['API'],
+            'endpoints': [simple_endpoint.model_dump()]
+        },
+        {
+            'name' : 'Payments',
+            'description' : 'Card processing',
+            'tags' : ['Finance'],
+            'endpoints': [simple_endpoint.model_dump()]
+        }
+    ]
+    for api in apis:
+        response = client.post("/service/add",
+                               headers={"Authorization": f"Bearer {simple_user['token']}"},
+                               json=api)
+        assert response.status_code == SUCCESS
+
+    # Name matches rank above description matches
+    response = client.get("/service/search", params={'name': "weather", 'hide_pending': False})
+    assert response.status_code == SUCCESS
+    assert [api['name'] for api in response.json()] == ['Weather Service', 'Maps']
+
+    # Tags and endpoint titles are searchable, every token must match
+    response = client.get("/service/search", params={'name': "finance card", 'hide_pending': False})
+    assert [api['name'] for api in response.json()] == ['Payments']
+
+    response = client.get("/service/search", params={'name': "testtitle", 'hide_pending': False})
+    assert len(response.json()) == 3
+
+def test_search_regex_input(simple_user):
+    response = client.post("/service/add",
+                           headers={"Authorization": f"Bearer {simple_user['token']}"},
+                           json={
+                                'name' : 'Google',
+                                'description' : 'This is a test API',
+                                'tags' : ['API'],
+                                'endpoints': [simple_endpoint.model_dump()]
+                           })
+    assert response.status_code == SUCCESS
+
+    # Input is treated as text rather than compiled as a regex
+    response = client.get("/service/search", params={'name': "(zq+)+$[", 'hide_pending': False})
+    assert response.status_code == SUCCESS
+    assert response.json() == []
+
+def test_search_after_delete(simple_user):
+    response = client.post("/service/add",
+                           headers={"Authorization": f"Bearer {simple_user['token']}"},
+                           json={
+                                'name' : 'Google',
+                                'description' : 'This is a test API',
+                                'tags' : ['API'],
+                                'endpoints': [simple_endpoint.model_dump()]
+                           })
+    sid = response.json()['id']
+
+    response = client.delete("/service/delete",
+                             headers={"Authorization": f"Bearer {simple_user['token']}"},
+                             params={'sid': sid})
+    assert response.status_code == SUCCESS
+
+    response = client.get("/service/search", params={'name': "Google", 'hide_pending': False})
+    assert response.json() == []
+
+def test_expansion_budgets(monkeypatch):
+    '''
+        Test that prefix and infix matches are taken rarest first within
+        their budgets, while exact matches are always kept, and that a
+        single character only matches as a prefix
+    '''
+    from src.backend.classes import SearchIndex
+
+    index = SearchIndex.SearchIndex()
+    for i in range(6):
+        index.add(f"common{i}", {'name': ['weather']})
+        index.add(f"popular{i}", {'name': ['athletics']})
+    index.add('rare', {'name': ['leather']})
+    index.add('prefix', {'name': ['athens']})
+    index.add('exact', {'name': ['ath']})
+
+    assert len(index.search('ath')) == 15
+    monkeypatch.setattr(SearchIndex, 'MAX_INFIX_POSTINGS', 3)
+    monkeypatch.setattr(SearchIndex, 'MAX_PREFIX_POSTINGS', 3)
+    assert set(index.search('ath')) == {'exact', 'rare', 'prefix'}
+    assert index.expand('ath') == {'ath': SearchIndex.EXACT_MATCH,
+                                   'athens': SearchIndex.PREFIX_MATCH,
+                                   'leather': SearchIndex.INFIX_MATCH}
+
+    # 'a' is inside every term, but only starts some
+    assert index.expand('a') == {'athens': SearchIndex.PREFIX_MATCH, 'ath': SearchIndex.PREFIX_MATCH}
+    assert index.expand('w') == {}
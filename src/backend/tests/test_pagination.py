@@ -0,0 +1,228 @@
+import base64
+import json
+import pytest
+from fastapi.testclient import TestClient
+from src.backend.app import app
+from src.backend.classes.SequenceIndex import SequenceIndex
+from src.backend.classes.Endpoint import Endpoint
+from src.backend.server.pagination import NEXT_CURSOR_HEADER
+
+client = TestClient(app)
+
+SUCCESS = 200
+INPUT_ERROR = 400
+
+simple_endpoint = Endpoint(link='https://api.example.com/users/12345', title_description='testTitle1',
+                           main_description='tests endpoint', tab='tabTest', parameters=[],
+                           method="POST", responses=[])
+
+
+def register(name: str) -> str:
+    creds = {"displayname": name, "username": name, "password": "password", "email": f"{name}@gmail.com"}
+    response = client.post("/auth/register", json=creds)
+    assert response.status_code == SUCCESS
+    response = client.post("/auth/login", json=creds)
+    assert response.status_code == SUCCESS
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture(scope='module')
+def catalogue():
+    '''
+        Owner with 7 services, 4 reviewers and an admin. Service 0 has a
+        review from each reviewer, with votes, other services a few reviews
+    '''
+    client.post("/testing/clear")
+    owner = register('owner')
+    reviewers = [register(f"reviewer{i}") for i in range(4)]
+    response = client.post("/auth/login", json={"username": "superadmin", "password": "superadminpassword"})
+    admin = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    sids = []
+    for i in range(7):
+        response = client.post("/service/add", headers=owner, json={
+                                    'name': f"weather {i}" if i % 2 else f"maps {i}",
+                                    'description': 'weather maps' if i % 3 else 'maps',
+                                    'tags': ['API', 'Public'] if i % 2 else ['API'],
+                                    'endpoints': [simple_endpoint.model_dump()]
+                                })
+        assert response.status_code == SUCCESS
+        sids.append(response.json()['id'])
+
+    for reviewer, (sid, rating) in zip(reviewers * 2, [(sids[0], 'positive'), (sids[0], 'negative'),
+                                                       (sids[0], 'positive'), (sids[0], 'negative'),
+                                                       (sids[3], 'positive'), (sids[5], 'negative'),
+                                                       (sids[3], 'positive'), (sids[6], 'positive')]):
+        response = client.post("/service/review/add", headers=reviewer,
+                               json={'sid': sid, 'rating': rating, 'comment': 'review'})
+        assert response.status_code == SUCCESS
+    rids = [review['rid'] for review in client.get("/service/get/reviews", params={'sid': sids[0]}).json()['reviews']]
+
+    for voter, rid, vote in [(1, rids[0], 'downvote'), (2, rids[0], 'downvote'),
+                             (0, rids[2], 'upvote'), (3, rids[2], 'upvote'), (0, rids[3], 'upvote')]:
+        response = client.post(f"/review/{vote}", headers=reviewers[voter], json={'rid': rid})
+        assert response.status_code == SUCCESS
+
+    yield {'owner': owner, 'admin': admin, 'sids': sids}
+    client.post("/testing/clear")
+
+def encode(cursor: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip('=')
+
+def collect(path: str, params: dict, headers: dict = {}, key: str = None) -> tuple[list, int]:
+    '''
+        Follows the cursors of a listing, returning every item and the
+        number of pages
+    '''
+    items, pages = [], 0
+    params = dict(params)
+    while True:
+        response = client.get(path, params=params, headers=headers)
+        assert response.status_code == SUCCESS
+        body = response.json()
+        page = body if key is None else body[key]
+        assert len(page) <= params['limit']
+        items.extend(page)
+        pages += 1
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return items, pages
+        params['cursor'] = cursor
+
+def assert_paged(path: str, params: dict, headers: dict = {}, key: str = None, limit: int = 2) -> list:
+    '''
+        Checks that paging through a listing returns the full listing
+    '''
+    response = client.get(path, params=params, headers=headers)
+    assert response.status_code == SUCCESS
+    assert NEXT_CURSOR_HEADER not in response.headers
+    full = response.json() if key is None else response.json()[key]
+
+    items, pages = collect(path, params | {'limit': limit}, headers, key)
+    assert items == full
+    assert pages == max(1, -(-len(full) // limit))
+    return full
+
+
+def test_sequence_index():
+    index = SequenceIndex()
+    for eid in ['e', 'a', 'c', 'x']:
+        index.append(eid)
+    assert index.append('a') == 1
+    assert list(index.after()) == ['e', 'a', 'c', 'x']
+    assert list(index.after(index.seq('a'))) == ['c', 'x']
+    index.remove('c')
+    index.remove('c')
+    assert list(index.after(1)) == ['x']
+    assert list(index.after(2)) == ['x']
+    index.remove_many(['e', 'nope'])
+    assert list(index.after()) == ['a', 'x']
+    index.load([str(i) for i in range(100)])
+    index.remove_many(str(i) for i in range(1, 100, 2))
+    assert list(index.after(index.seq('50'))) == [str(i) for i in range(52, 100, 2)]
+    index.load(['b', 'a'])
+    assert list(index.after()) == ['b', 'a'] and len(index) == 2
+
+def test_filter_paged(catalogue):
+    for params in [{'hide_pending': False},
+                   {'hide_pending': False, 'tags': ['Public']},
+                   {'hide_pending': False, 'sort_rating': True},
+                   {'hide_pending': False, 'tags': ['API'], 'sort_rating': True},
+                   {'hide_pending': True}]:
+        full = assert_paged("/service/filter", params)
+    assert full == []
+
+    ratings = [service['id'] for service in assert_paged("/service/filter", {'hide_pending': False, 'sort_rating': True})]
+    assert ratings[:2] == [catalogue['sids'][3], catalogue['sids'][6]]
+    assert ratings[-1] == catalogue['sids'][5]
+
+def test_search_paged(catalogue):
+    for name in ['weather', 'maps', '', 'nothing']:
+        assert_paged("/service/search", {'name': name, 'hide_pending': False}, limit=3)
+
+def test_my_services_paged(catalogue):
+    full = assert_paged("/service/my_services", {}, catalogue['owner'], limit=3)
+    assert [service['id'] for service in full] == catalogue['sids']
+
+def test_reviews_paged(catalogue):
+    sid = catalogue['sids'][0]
+    for filter in ['', 'best', 'worst']:
+        full = assert_paged("/service/get/reviews", {'sid': sid, 'filter': filter}, key='reviews', limit=3)
+        assert len(full) == 4
+    assert [review['upvotes'] - review['downvotes'] for review in full] == [-2, 0, 1, 2]
+
+def test_admin_paged(catalogue):
+    full = assert_paged("/admin/get/reviews", {}, catalogue['admin'], key='reviews', limit=3)
+    assert len(full) == 8
+    full = assert_paged("/admin/dashboard/users", {}, catalogue['admin'], key='users')
+    assert len(full) == 6
+
+def test_cursor_default_limit(catalogue):
+    first = client.get("/service/filter", params={'hide_pending': False, 'limit': 1})
+    response = client.get("/service/filter", params={'hide_pending': False,
+                                                     'cursor': first.headers[NEXT_CURSOR_HEADER]})
+    assert response.status_code == SUCCESS
+    assert [service['id'] for service in response.json()] == catalogue['sids'][1:]
+
+def test_invalid_cursor(catalogue):
+    for cursor in ['garbage', 'e30', 'WzEsMl0', encode(['catalogue', []]), encode(['catalogue', [1, 2]])]:
+        response = client.get("/service/filter", params={'hide_pending': False, 'cursor': cursor})
+        assert response.status_code == INPUT_ERROR
+    for cursor in [encode(['best', []]), encode(['best', [1]])]:
+        response = client.get("/service/get/reviews", params={'sid': catalogue['sids'][0], 'filter': 'best',
+                                                              'cursor': cursor})
+        assert response.status_code == INPUT_ERROR
+
+    # Cursors only resume the listing order they came from
+    response = client.get("/service/filter", params={'hide_pending': False, 'limit': 1})
+    cursor = response.headers[NEXT_CURSOR_HEADER]
+    response = client.get("/service/filter", params={'hide_pending': False, 'sort_rating': True, 'cursor': cursor})
+    assert response.status_code == INPUT_ERROR
+
+    for limit in [0, 10_000]:
+        response = client.get("/service/filter", params={'hide_pending': False, 'limit': limit})
+        assert response.status_code == 422
+
+def test_cursor_after_delete(catalogue):
+    '''
+        Test that a listing resumes after its cursor even once the last
+        item returned is deleted
+    '''
+    sids = catalogue['sids']
+    response = client.get("/service/filter", params={'hide_pending': False, 'limit': 2})
+    cursor = response.headers[NEXT_CURSOR_HEADER]
+    response = client.delete("/service/delete", headers=catalogue['owner'], params={'sid': sids[1]})
+    assert response.status_code == SUCCESS
+
+    response = client.get("/service/filter", params={'hide_pending': False, 'limit': 2, 'cursor': cursor})
+    assert [service['id'] for service in response.json()] == sids[2:4]
+
+def test_user_apis_in_order():
+    '''
+        Test that a provider's services are kept in catalogue order, and
+        can be listed from any catalogue position
+    '''
+    from src.backend.classes.API import API
+    from src.backend.classes.User import User
+    from src.backend.classes.datastore import Datastore
+
+    store = Datastore()
+    owners = [User(str(i), f"owner{i}", f"owner{i}", '', f"owner{i}@test", False, False) for i in range(2)]
+    for owner in owners:
+        store.add_user(owner)
+    for i in range(10):
+        store.add_api(API(str(i), f"api{i}", owners[i % 2], '', '', [], [], 'v1', '', 'Free'))
+
+    def ids(apis):
+        return [api.get_id() for api in apis]
+
+    assert ids(store.get_user_api_objects('0')) == ['0', '2', '4', '6', '8']
+    assert ids(store.iter_user_apis('0', store.get_api_seq('4'))) == ['6', '8']
+    assert ids(store.iter_user_apis('1', store.get_api_seq('4'))) == ['5', '7', '9']
+
+    # Updates keep the order, and deleted services leave it
+    store.get_api_by_id('2').update_pay_model('Premium')
+    seq = store.get_api_seq('6')
+    store.delete_item('6', 'api')
+    assert ids(store.iter_user_apis('0', seq)) == ['8']
+    assert ids(store.get_user_api_objects('0')) == ['0', '2', '4', '8']
+    assert ids(store.iter_user_apis('2')) == []
@@ -1,8 +1,13 @@
 import pytest
+import random
+from bisect import bisect_left, bisect_right, insort
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from src.backend.app import app 
 from src.backend.classes.models import db
+from src.backend.classes.datastore import Datastore, data_store
+from src.backend.classes.Review import Review
+from src.backend.classes import VoteRanking
 from src.backend.classes.Endpoint import Endpoint
 from src.backend.classes.Parameter import Parameter 
 from src.backend.classes.Response import Response
@@ -1367,4 +1372,97 @@ def test_user_get_replies_success(simple_user):
     response = client.get("/user/get/replies",
                           headers={"Authorization": f"Bearer {data['c_token']}"})
     assert response.status_code == SUCCESS
-    assert response.json()['replies'][0]['comment'] == 'blah blah blah'
\ No newline at end of file
+    assert response.json()['replies'][0]['comment'] == 'blah blah blah'
+
+def test_service_get_reviews_bulk(simple_user):
+    '''
+        Test that a service's reviews are listed with reviewer names, and
+        edits show once a review was already listed
+    '''
+    data = simple_user
+    response = client.post("/service/review/add",
+                headers={"Authorization": f"Bearer {data['u_token']}"},
+                json={'sid': data['sid'], 'rating': 'positive', 'comment': 'Mid at best'})
+    assert response.status_code == SUCCESS
+
+    response = client.get("/service/get/reviews", params={'sid': data['sid']})
+    assert response.status_code == SUCCESS
+    review = response.json()['reviews'][0]
+    assert review['reviewerName'] == 'Sus Imposter 6969'
+    assert review['e_timestamp'] is None
+
+    response = client.post("/review/edit",
+                           headers={"Authorization": f"Bearer {data['u_token']}"},
+                           json={'rid': review['rid'], 'rating': 'positive', 'comment': 'Good'})
+    assert response.status_code == SUCCESS
+
+    response = client.get("/service/get/reviews", params={'sid': data['sid']})
+    edited = response.json()['reviews'][0]
+    assert edited['timestamp'] == review['timestamp']
+    assert edited['e_timestamp'] is not None
+
+    assert [r.get_id() for r in data_store.get_reviews_by_ids(['x', review['rid'], 'y'])] == [review['rid']]
+    assert list(data_store.get_users_by_ids(['x', '2', '2'])) == ['2']
+    assert data_store.get_replies_by_ids(['x']) == []
+
+def test_sorted_keys(monkeypatch):
+    '''
+        Test that chunked sorted keys match a plain sorted list as keys are
+        added and removed, splitting and emptying chunks
+    '''
+    monkeypatch.setattr(VoteRanking, 'CHUNK', 3)
+    rng = random.Random(1)
+    keys, expected = VoteRanking.SortedKeys(), []
+    for _ in range(2000):
+        key = rng.randrange(100)
+        if key in expected:
+            keys.remove(key)
+            expected.remove(key)
+        else:
+            keys.add(key)
+            insort(expected, key)
+        assert len(keys) == len(expected)
+        probe = rng.randrange(-1, 101)
+        assert keys.position(probe) == bisect_left(expected, probe)
+        assert list(keys.iter_from(*keys.locate(probe, right=True))) == expected[bisect_right(expected, probe):]
+    assert list(keys.iter_from(0, 0)) == expected and keys.last() == expected[-1]
+
+def test_vote_ranking(monkeypatch):
+    '''
+        Test that a service's reviews stay ranked by net vote as they are
+        voted on, matching a full sort with ties in creation order
+    '''
+    monkeypatch.setattr(VoteRanking, 'CHUNK', 4)
+    rng = random.Random(0)
+    store = Datastore()
+    reviews = [Review(str(rid), 'owner', '0', 'positive', 'review') for rid in range(40)]
+    store.load([], [], reviews, [], [], [])
+    ranking = store.get_review_ranking('0')
+    assert len(ranking) == 40 and len(store.get_review_ranking('1')) == 0
+
+    for step in range(400):
+        review = rng.choice(reviews)
+        voter = str(rng.randrange(5))
+        if review.remove_vote(voter) is False:
+            review.update_vote(voter, rng.choice(['positive', 'negative']))
+
+        if step % 50 == 0:
+            best = sorted(reviews, key=lambda r: (-r.get_net_vote(), int(r.get_id())))
+            worst = sorted(reviews, key=lambda r: (r.get_net_vote(), int(r.get_id())))
+            assert list(ranking.best()) == [r.get_id() for r in best]
+            assert list(ranking.worst()) == [r.get_id() for r in worst]
+            for i, r in enumerate(best):
+                assert ranking.rank(r.get_id()) == i
+                assert ranking.rank(r.get_id(), best=False) == worst.index(r)
+            # Resuming after any review continues the order
+            middle = best[17]
+            assert list(ranking.best((-middle.get_net_vote(), int(middle.get_id())))) == \
+                   [r.get_id() for r in best[18:]]
+            middle = worst[17]
+            assert list(ranking.worst((middle.get_net_vote(), int(middle.get_id())))) == \
+                   [r.get_id() for r in worst[18:]]
+
+    store.delete_item('3', 'review')
+    assert '3' not in ranking.best() and ranking.rank('3') is None
+    reviews[3].update_vote('9', 'positive')
+    assert len(ranking) == 39
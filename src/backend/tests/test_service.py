@@ -1,4 +1,5 @@
 import sys, os
+import asyncio
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import pytest
 from fastapi import FastAPI
@@ -241,7 +242,7 @@ def test_create_api(simple_user):
     assert response_info['tags'] == api_info['tags']
     assert response_info["versions"][0]["endpoints"] == api_info["endpoints"]
 
-    database_object = db_get_service(sid)
+    database_object = asyncio.run(db_get_service(sid))
     assert database_object['id'] == sid
     assert database_object['name'] == api_info['name']
     assert database_object['description'] == api_info['description']
@@ -383,7 +384,7 @@ def test_update_api_documents(simple_user):
     assert response.status_code == SUCCESS
     response_info = response.json()
     assert response_info["versions"][0]['docs'] == ["1"]
-    database_object = db_get_service(sid)
+    database_object = asyncio.run(db_get_service(sid))
 
     # path of file is accessible via get_service but internally
     # stored by document id instead of path
@@ -412,7 +413,7 @@ def test_update_api_documents(simple_user):
     response_info = response.json()
    
     assert response_info["versions"][0]['docs'] == ["1"]
-    database_object = db_get_service(sid)
+    database_object = asyncio.run(db_get_service(sid))
     assert database_object["versions"][0]['docs'] == [doc_id]
 
 # Delete non-existing service
@@ -457,7 +458,7 @@ def test_delete_api(simple_user):
     response_info = response.json()[0]
     assert response_info != {}
 
-    assert db_get_service(sid) is not None
+    assert asyncio.run(db_get_service(sid)) is not None
 
     response = client.delete("/service/delete",
                         headers={"Authorization": f"Bearer {simple_user['token']}"},
@@ -468,7 +469,7 @@ def test_delete_api(simple_user):
     response_info = response.json()
     assert response_info["name"] == api_info1['name']
     assert response_info["deleted"] == True
-    assert db_get_service(sid) is None
+    assert asyncio.run(db_get_service(sid)) is None
 
     response = client.get("/service/my_services",
                           headers={"Authorization": f"Bearer {simple_user['token']}"})
@@ -506,7 +507,7 @@ def test_delete_api_no_perm(simple_user):
     response_info = response.json()[0]
     assert response_info != {}
 
-    assert db_get_service(sid) is not None
+    assert asyncio.run(db_get_service(sid)) is not None
 
     response = client.delete("/service/delete",
                         headers={"Authorization": f"Bearer {simple_user['token']}"},
@@ -545,7 +546,7 @@ def test_delete_api_admin_perm(simple_user):
     response_info = response.json()[0]
     assert response_info != {}
 
-    assert db_get_service(sid) is not None
+    assert asyncio.run(db_get_service(sid)) is not None
 
     response = client.delete("/service/delete",
                         headers={"Authorization": f"Bearer {access_token}"},
@@ -1063,7 +1064,7 @@ def test_update_global_api_fields(simple_user):
     assert response_info['status'] == "LIVE"
     assert response_info['status_reason'] == reason
 
-    database_object = db_get_service(sid)
+    database_object = asyncio.run(db_get_service(sid))
     assert database_object['id'] == sid
     assert database_object['name'] == update_request_info['name']
     assert database_object['description'] == update_request_info['description']
@@ -1832,3 +1833,107 @@ def test_pay_model_update(simple_user):
     assert response.status_code == SUCCESS
     assert response.json()[0]['pay_model'] == 'Freemium'
     assert response.json()[0]['name'] == 'HAXORZED'
+
+def test_status_index(simple_user):
+    '''
+        Test that the status partitions match a scan of every service as
+        services and versions are added, updated, approved and deleted
+    '''
+    from src.backend.classes.datastore import data_store
+    from src.backend.classes.Service import ServiceStatus
+
+    def assert_indexed():
+        for status in ServiceStatus:
+            assert data_store.get_api_ids_by_status([status]) == \
+                   {api.get_id() for api in data_store.get_apis() if api.get_status() == status}
+            assert data_store.get_api_ids_by_status([status], versions=True) == \
+                   {api.get_id() for api in data_store.get_apis()
+                    if any(version.get_status() == status for version in api.get_all_versions())}
+
+    headers = {"Authorization": f"Bearer {simple_user['token']}"}
+    response = client.post("/auth/login", json={
+        "username": "superadmin",
+        "password": "superadminpassword"
+    })
+    admin = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    sids = []
+    for i in range(3):
+        response = client.post("/service/add", headers=headers, json={
+                                   'name': f"Test API {i}",
+                                   'description': 'This is a test API',
+                                   'tags': ['API'],
+                                   'endpoints': [simple_endpoint.model_dump()],
+                                   'version_name': 'v1'
+                               })
+        assert response.status_code == SUCCESS
+        sids.append(response.json()['id'])
+    assert data_store.get_api_ids_by_status([ServiceStatus.PENDING]) == set(sids)
+    assert_indexed()
+
+    for sid, approved in [(sids[0], True), (sids[1], False)]:
+        response = client.post("/admin/service/approve", headers=admin, json={
+                                   'sid': sid, 'reason': 'reason', 'approved': approved,
+                                   'version_name': 'v1', 'service_global': True
+                               })
+        assert response.status_code == SUCCESS
+    assert data_store.get_api_ids_by_status([ServiceStatus.LIVE]) == {sids[0]}
+    assert_indexed()
+
+    response = client.post("/service/update", headers=headers, json={
+                               'sid': sids[0], 'name': 'Renamed', 'description': 'new', 'tags': ['API']
+                           })
+    assert response.status_code == SUCCESS
+    assert data_store.get_api_ids_by_status([ServiceStatus.UPDATE_PENDING]) == {sids[0]}
+    assert_indexed()
+
+    response = client.post("/service/version/add", headers=headers, json={
+                               'sid': sids[0], 'version_name': 'v2', 'version_description': '',
+                               'endpoints': [simple_endpoint2.model_dump()]
+                           })
+    assert response.status_code == SUCCESS
+    assert sids[0] in data_store.get_api_ids_by_status([ServiceStatus.PENDING], versions=True)
+    assert_indexed()
+
+    response = client.get("/admin/get/services", headers=admin)
+    assert [service['id'] for service in response.json()['new_services']] == [sids[2]]
+    assert [service['id'] for service in response.json()['version_updates']] == [sids[0]]
+
+    response = client.delete("/service/version/delete", headers=headers,
+                             params={'sid': sids[0], 'version_name': 'v2'})
+    assert response.status_code == SUCCESS
+    assert sids[0] not in data_store.get_api_ids_by_status([ServiceStatus.PENDING], versions=True)
+    assert_indexed()
+
+    response = client.delete("/service/delete", headers=headers, params={'sid': sids[2]})
+    assert response.status_code == SUCCESS
+    assert data_store.get_api_ids_by_status([ServiceStatus.PENDING]) == set()
+    assert_indexed()
+
+
+def test_status_index_private_datastore():
+    '''
+        Test that services and versions update the status partitions of
+        the datastore holding them, rather than the global one
+    '''
+    from src.backend.classes.API import API
+    from src.backend.classes.User import User as Owner
+    from src.backend.classes.datastore import Datastore
+    from src.backend.classes.Service import ServiceStatus
+
+    store = Datastore()
+    owner = Owner('0', 'owner', 'owner', '', 'owner@test', False, False)
+    store.add_user(owner)
+    api = API('0', 'alpha', owner, '', 'first', [], [], 'v1', '', 'Free')
+    store.add_api(api)
+
+    api.update_status(ServiceStatus.LIVE, '')
+    api.get_latest_version().update_status(ServiceStatus.LIVE, '')
+    assert store.get_api_ids_by_status([ServiceStatus.LIVE]) == {'0'}
+    assert store.get_api_ids_by_status([ServiceStatus.PENDING], versions=True) == set()
+
+    api.update_newly_created()
+    api.add_service_version('v2', [], '')
+    assert store.get_api_ids_by_status([ServiceStatus.PENDING], versions=True) == {'0'}
+    api.remove_version('v2')
+    assert store.get_api_ids_by_status([ServiceStatus.PENDING], versions=True) == set()
@@ -8,7 +8,14 @@ from src.backend.classes.datastore import defaults
 from src.backend.classes.Endpoint import Endpoint
 from src.backend.classes.Parameter import Parameter 
 from src.backend.classes.Response import Response
-from src.backend.server.tags import n_tags_min, n_tags_max
+from src.backend.server.tags import n_tags_min, n_tags_max, TagGenerator, auto_generate_tags
+from src.backend.classes.TagSuggester import TagSuggester
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fastapi import HTTPException
+import asyncio
+import json
+import threading
+import time
 
 # test endpoint
 simple_parameter = Parameter(id="1", endpoint_link='https://api.example.com/users/12345', required=True, 
@@ -431,4 +438,351 @@ def test_ranked_tags_edit_shift(admin_user):
     assert response.json()['tags'][3]['tag'] == 'custom4'
     assert response.json()['tags'][3]['num'] == 1
     assert response.json()['tags'][4]['tag'] == 'custom5'
-    assert response.json()['tags'][4]['num'] == 1
\ No newline at end of file
+    assert response.json()['tags'][4]['num'] == 1
+
+def test_ranked_tags_live_only(admin_user):
+    '''
+        Test that only live services count towards tag rankings
+    '''
+    for tag in ['custom1', 'custom2']:
+        response = client.post("/tag/add",
+                            headers={"Authorization": f"Bearer {admin_user['token']}"},
+                            json={'tag': tag})
+        assert response.status_code == SUCCESS
+
+    sid = []
+    for i, tags in enumerate([['API', 'custom1'], ['custom1', 'custom2']]):
+        api_info = {
+                    'name' : f'Test API{i}',
+                    'description' : 'This is a test API',
+                    'tags' : tags,
+                    'endpoints': [simple_endpoint.model_dump()],
+                    'version_name': "some_version_name"
+                    }
+        response = client.post("/service/add",
+                           headers={"Authorization": f"Bearer {admin_user['token']}"},
+                           json=api_info)
+        assert response.status_code == SUCCESS
+        sid.append(response.json()['id'])
+
+    # Pending services are not counted
+    response = client.get("/tags/get/ranked", params={'num': -1})
+    assert response.status_code == SUCCESS
+    assert response.json()['tags'] == []
+
+    for _sid, approved in zip(sid, [True, False]):
+        response = client.post("/admin/service/approve",
+                            headers={"Authorization": f"Bearer {admin_user['token']}"},
+                                json={
+                                    'sid': _sid,
+                                    'reason': 'reason',
+                                    'approved': approved,
+                                    'version_name': "some_version_name",
+                                    'service_global': True
+                                })
+        assert response.status_code == SUCCESS
+
+    # Rejected service is not counted
+    response = client.get("/tags/get/ranked", params={'num': -1})
+    assert response.status_code == SUCCESS
+    assert [(tag['tag'], tag['num']) for tag in response.json()['tags']] == [('API', 1), ('custom1', 1)]
+
+    response = client.get("/tags/get/ranked", params={'num': -1, 'custom': True})
+    assert response.status_code == SUCCESS
+    assert [(tag['tag'], tag['num']) for tag in response.json()['tags']] == [('custom1', 1)]
+
+    # Service with a pending update is not counted until approved
+    response = client.post("/service/update",
+                           headers={"Authorization": f"Bearer {admin_user['token']}"},
+                            json={
+                                'name': 'Test API0',
+                                'description': 'This is a test API',
+                                'tags': ['custom2'],
+                                'sid': sid[0],
+                                'pay_model': 'Free'
+                            })
+    assert response.status_code == SUCCESS
+
+    response = client.get("/tags/get/ranked", params={'num': -1})
+    assert response.status_code == SUCCESS
+    assert response.json()['tags'] == []
+
+    response = client.post("/admin/service/approve",
+                        headers={"Authorization": f"Bearer {admin_user['token']}"},
+                            json={
+                                'sid': sid[0],
+                                'reason': 'reason',
+                                'approved': True,
+                                'version_name': "some_version_name",
+                                'service_global': True
+                            })
+    assert response.status_code == SUCCESS
+
+    response = client.get("/tags/get/ranked", params={'num': 1})
+    assert response.status_code == SUCCESS
+    assert [(tag['tag'], tag['num']) for tag in response.json()['tags']] == [('custom2', 1)]
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    '''
+        Streams a generation of the tags in the prompt, the way Ollama's
+        /api/generate does
+    '''
+    def do_POST(self):
+        server = self.server
+        prompt = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['prompt']
+        server.prompts.append(prompt)
+        time.sleep(server.delay)
+        if 'fail' in prompt:
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b'model failed')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        for chunk in ['weather, ', 'maps ,', 'geo']:
+            self.wfile.write(json.dumps({'response': chunk, 'done': False}).encode() + b'\n')
+        self.wfile.write(json.dumps({'response': '', 'done': True}).encode() + b'\n')
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def ollama():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOllama)
+    server.prompts = []
+    server.delay = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def ollama_url(server) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+
+def test_generate_tags_cached(ollama):
+    generator = TagGenerator(ollama_url(ollama), cache_size=2, ttl=60)
+
+    async def scenario():
+        assert await generator.generate('a weather api') == ['weather', 'maps', 'geo']
+        assert await generator.generate(' a weather api ') == ['weather', 'maps', 'geo']
+        assert len(ollama.prompts) == 1
+
+        # Least recently used descriptions are evicted
+        await generator.generate('second')
+        await generator.generate('a weather api')
+        await generator.generate('third')
+        assert len(ollama.prompts) == 3
+        await generator.generate('a weather api')
+        assert len(ollama.prompts) == 3
+        await generator.generate('second')
+        assert len(ollama.prompts) == 4
+        await generator.close()
+
+    asyncio.run(scenario())
+    assert generator.get_stats() == {'cached': 2, 'inflight': 0, 'calls': 4}
+
+def test_generate_tags_expire(ollama):
+    generator = TagGenerator(ollama_url(ollama), ttl=0.05)
+    asyncio.run(generator.generate('a weather api'))
+    asyncio.run(generator.generate('a weather api'))
+    assert len(ollama.prompts) == 1
+    time.sleep(0.06)
+    asyncio.run(generator.generate('a weather api'))
+    assert len(ollama.prompts) == 2
+
+def test_generate_tags_single_flight(ollama):
+    ollama.delay = 0.2
+    generator = TagGenerator(ollama_url(ollama))
+
+    async def scenario():
+        results = await asyncio.gather(*(generator.generate('a weather api') for _ in range(10)),
+                                       generator.generate('other'))
+        await generator.close()
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(tags == ['weather', 'maps', 'geo'] for tags in results)
+    assert len(ollama.prompts) == 2
+
+def test_generate_tags_leader_cancelled(ollama):
+    ollama.delay = 0.2
+    generator = TagGenerator(ollama_url(ollama))
+
+    async def scenario():
+        leader = asyncio.create_task(generator.generate('a weather api'))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(generator.generate('a weather api'))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        tags = await asyncio.wait_for(follower, 5)
+        await generator.close()
+        return leader, tags
+
+    leader, tags = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert tags == ['weather', 'maps', 'geo']
+    assert generator.get_stats()['inflight'] == 0
+
+def test_generate_tags_failure(ollama):
+    generator = TagGenerator(ollama_url(ollama))
+
+    async def scenario():
+        return await asyncio.gather(*(generator.generate('fail') for _ in range(3)),
+                                    return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+    assert [error.status_code for error in errors] == [500, 500, 500]
+    assert len(ollama.prompts) == 1
+
+    # Failures are not cached
+    with pytest.raises(HTTPException):
+        asyncio.run(generator.generate('fail'))
+    assert len(ollama.prompts) == 2
+
+def test_generate_tags_unavailable(ollama):
+    generator = TagGenerator(ollama_url(ollama))
+    ollama.shutdown()
+    ollama.server_close()
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(generator.generate('a weather api'))
+    assert error.value.status_code == 503
+
+def test_generate_tags_endpoint(ollama, simple_user, monkeypatch):
+    monkeypatch.setattr('src.backend.server.tags.tag_generator', TagGenerator(ollama_url(ollama)))
+    for _ in range(2):
+        response = client.post("/service/tags/generate",
+                               headers={"Authorization": f"Bearer {simple_user['token']}"},
+                               params={'description': 'a weather api'})
+        assert response.status_code == SUCCESS
+        assert response.json() == {'tags': ['weather', 'maps', 'geo']}
+    assert len(ollama.prompts) == 1
+
+def test_tag_suggester():
+    suggester = TagSuggester()
+    suggester.add('0', ['Sunny', 'Weather forecasts and rain radar'], ['Weather', 'Forecast'])
+    suggester.add('1', ['CityMaps', 'Rain radar maps for cities'], ['Maps', 'Weather'])
+    suggester.add('2', ['Stonks', 'Stock prices and currency rates'], ['Finance'])
+    suggester.add('3', ['Untagged', 'Weather for the untagged'], [])
+    assert len(suggester) == 3
+
+    tags = [tag for tag, _ in suggester.suggest('hourly weather forecast with rain radar', 10)]
+    assert tags == ['Forecast', 'Weather', 'Maps']
+    assert suggester.suggest('the and of', 10) == []
+    assert [tag for tag, _ in suggester.suggest('currency', 10)] == ['Finance']
+
+    # Retraining replaces what a service was trained with
+    suggester.add('2', ['Stonks', 'Crypto currency rates'], ['Crypto'])
+    assert [tag for tag, _ in suggester.suggest('currency', 10)] == ['Crypto']
+    suggester.remove('2')
+    suggester.remove('2')
+    assert suggester.suggest('currency', 10) == []
+    assert len(suggester.suggest('weather', 1)) == 1
+
+def test_tag_suggester_unrelated():
+    '''
+        Test that words common to every service don't suggest tags
+    '''
+    suggester = TagSuggester()
+    suggester.add('0', ['Sunny', 'A service for weather forecasts'], ['Weather'])
+    suggester.add('1', ['Payup', 'A service taking card payments'], ['Payments'])
+    suggester.add('2', ['CityMaps', 'A service for maps of cities'], ['Maps'])
+
+    assert suggester.suggest('A service that translates text between languages', 10) == []
+    assert [tag for tag, _ in suggester.suggest('Maps of cities', 10)] == ['Maps']
+
+def test_suggest_tags_live_services(admin_user, ollama, monkeypatch):
+    '''
+        Test that tags are suggested locally from live services, learning
+        as they are approved and deleted
+    '''
+    monkeypatch.setattr('src.backend.server.tags.tag_generator', TagGenerator(ollama_url(ollama)))
+    headers = {"Authorization": f"Bearer {admin_user['token']}"}
+    for tag in ['Weather', 'Forecast', 'Maps', 'Finance']:
+        response = client.post("/tag/add", headers=headers, json={'tag': tag})
+        assert response.status_code == SUCCESS
+
+    sid = []
+    for name, description, tags in [('Sunny', 'Weather forecasts and rain radar', ['Weather', 'Forecast']),
+                                    ('CityMaps', 'Rain radar maps for cities', ['Maps', 'Weather']),
+                                    ('Stonks', 'Stock prices and currency rates', ['Finance'])]:
+        response = client.post("/service/add", headers=headers, json={
+                                'name': name,
+                                'description': description,
+                                'tags': tags,
+                                'endpoints': [simple_endpoint.model_dump()],
+                                'version_name': "some_version_name"
+                            })
+        assert response.status_code == SUCCESS
+        sid.append(response.json()['id'])
+
+    description = {'description': 'hourly weather forecast with rain radar'}
+    assert asyncio.run(auto_generate_tags(description['description'], 'local')) == []
+
+    for _sid in sid:
+        response = client.post("/admin/service/approve", headers=headers, json={
+                                'sid': _sid,
+                                'reason': 'reason',
+                                'approved': True,
+                                'version_name': "some_version_name",
+                                'service_global': True
+                            })
+        assert response.status_code == SUCCESS
+
+    # Enough local suggestions, so the model is not asked
+    response = client.post("/service/tags/generate", headers=headers, params=description)
+    assert response.status_code == SUCCESS
+    assert response.json() == {'tags': ['Forecast', 'Weather', 'Maps']}
+    assert ollama.prompts == []
+
+    # A word in common with an unrelated description isn't enough
+    response = client.post("/service/tags/generate", headers=headers,
+                           params={'description': 'Translates text between languages, even in the rain'})
+    assert response.status_code == SUCCESS
+    assert response.json() == {'tags': ['weather', 'maps', 'geo']}
+    assert len(ollama.prompts) == 1
+
+    response = client.delete("/service/delete", headers=headers, params={'sid': sid[1]})
+    assert response.status_code == SUCCESS
+    assert asyncio.run(auto_generate_tags(description['description'], 'local')) == ['Forecast', 'Weather']
+
+    # Too few, so the model is asked
+    response = client.post("/service/tags/generate", headers=headers, params=description)
+    assert response.status_code == SUCCESS
+    assert response.json() == {'tags': ['weather', 'maps', 'geo']}
+    assert len(ollama.prompts) == 2
+
+    # Local suggestions are used if the model is unavailable
+    ollama.shutdown()
+    ollama.server_close()
+    assert asyncio.run(auto_generate_tags('a weather forecast', 'fallback')) == ['Forecast', 'Weather']
+    assert asyncio.run(auto_generate_tags('nothing similar', 'local')) == []
+    with pytest.raises(HTTPException):
+        asyncio.run(auto_generate_tags('nothing similar', 'fallback'))
+
+def test_private_datastore_tag_ranking():
+    '''
+        Test that a service's status changes recount its tags in the
+        datastore holding it, rather than the global one
+    '''
+    from src.backend.classes.API import API
+    from src.backend.classes.Service import ServiceStatus
+    from src.backend.classes.User import User as Owner
+    from src.backend.classes.datastore import Datastore, data_store
+
+    store = Datastore()
+    owner = Owner('0', 'owner', 'owner', '', 'owner@test', False, False)
+    store.add_user(owner)
+    tag = store.add_tag('weather')
+    api = API('0', 'Sunny', owner, '', 'Forecasts', ['weather'], [], 'v1', '', 'Free')
+    store.add_api(api)
+    tag.add_server('0')
+
+    api.update_status(ServiceStatus.LIVE, '')
+    assert [t['tag'] for t in store.get_tag_ranking(-1, True)['tags']] == ['weather']
+    assert data_store.get_tag_by_name('weather') is None
+
+    api.update_status(ServiceStatus.PENDING, '')
+    assert store.get_tag_ranking(-1, True)['tags'] == []
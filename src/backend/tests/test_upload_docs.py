@@ -1,8 +1,9 @@
+import os
+import hashlib
 import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from src.backend.app import app 
-from src.backend.classes.models import db
 from src.backend.classes.Endpoint import Endpoint
 from src.backend.classes.Parameter import Parameter 
 from src.backend.classes.Response import Response
@@ -31,7 +32,6 @@ def clear_all():
     response = client.post("/testing/clear")
     assert response.status_code == SUCCESS
     assert  response.json() == {"message" : "Clear Successful"}
-    db.users.delete_many({})
 
 @pytest.fixture
 def two_users():
@@ -210,4 +210,84 @@ def test_successful_upload(two_users):
                           })
     assert response.status_code == SUCCESS
     response_info = response.json()
-    assert response_info["versions"][0]['docs'] == ["1"]
\ No newline at end of file
+    assert response_info["versions"][0]['docs'] == ["1"]
+
+
+def test_upload_sniffs_type():
+    '''
+        Test that uploads are typed by their contents, not their content type
+    '''
+    clear_all()
+    with open("tests/resources/default_icon.png", 'rb') as f:
+        png = f.read()
+    response = client.post("/upload/pdfs", files={'file': ('icon.pdf', png, 'application/pdf')})
+    assert response.status_code == INPUT_ERROR
+    response = client.post("/upload/imgs", files={'file': ('notes.png', b'not an image', 'image/png')})
+    assert response.status_code == INPUT_ERROR
+
+    response = client.post("/upload/imgs", files={'file': ('icon.jpg', png, 'image/jpeg')})
+    assert response.status_code == SUCCESS
+    from src.backend.classes.datastore import data_store
+    doc = data_store.get_doc_by_id(response.json()['doc_id'])
+    assert doc.get_type() == 'image/png'
+    with open(doc.get_path(), 'rb') as f:
+        assert f.read() == png
+    os.remove(doc.get_path())
+
+
+def test_upload_size_limit(monkeypatch):
+    '''
+        Test that oversized uploads are rejected mid-stream, leaving no file
+    '''
+    from src.backend.server import upload
+    clear_all()
+    monkeypatch.setattr(upload, 'UPLOAD_CHUNK', 1024)
+    monkeypatch.setitem(upload.DOC_LIMITS, 'application/pdf', 4096)
+    before = set(os.listdir(upload.DOC_PATH))
+
+    response = client.post("/upload/pdfs", files={'file': ('big.pdf', b'%PDF-' + b'0' * 5000, 'application/pdf')})
+    assert response.status_code == 413
+    assert set(os.listdir(upload.DOC_PATH)) == before
+
+
+def test_upload_concurrent():
+    '''
+        Test that concurrent uploads of the same file share one stored file
+    '''
+    import asyncio
+    import io
+    from starlette.datastructures import UploadFile
+    from src.backend.server.upload import upload_file, DOC_PATH, DOC_LIMITS
+
+    with open("tests/resources/git_guide.pdf", 'rb') as f:
+        pdf = f.read()
+    before = set(os.listdir(DOC_PATH))
+
+    async def scenario():
+        return await asyncio.gather(*[upload_file(UploadFile(io.BytesIO(pdf), filename='git_guide.pdf'),
+                                                  DOC_PATH, DOC_LIMITS, "File uploaded is not PDF")
+                                      for _ in range(8)])
+
+    uploads = asyncio.run(scenario())
+    digest = hashlib.sha256(pdf).hexdigest()
+    assert {upload['path'] for upload in uploads} == {os.path.join(DOC_PATH, f"{digest}.pdf")}
+    assert all(upload['sha256'] == digest for upload in uploads)
+    with open(uploads[0]['path'], 'rb') as f:
+        assert f.read() == pdf
+    assert set(os.listdir(DOC_PATH)) - before <= {f"{digest}.pdf"}
+
+
+def test_upload_deduplicated():
+    '''
+        Test that identical uploads share a document, served with its digest
+    '''
+    clear_all()
+    file = ('git_guide.pdf', open("tests/resources/git_guide.pdf", 'rb').read(), 'application/pdf')
+    first = client.post("/upload/pdfs", files={'file': file}).json()['doc_id']
+    second = client.post("/upload/pdfs", files={'file': file}).json()['doc_id']
+    assert first == second
+
+    response = client.get("/get/doc", params={'doc_id': first})
+    assert response.status_code == SUCCESS
+    assert response.content == file[1]
+    assert response.headers['etag'] == f'"{hashlib.sha256(file[1]).hexdigest()}"'
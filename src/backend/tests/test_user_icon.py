@@ -3,6 +3,7 @@ from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from src.backend.app import app 
 from src.backend.classes.models import db
+from src.backend.server.documents import ICON_SIZES, VARIANT_PATH
 
 # Create a test client
 client = TestClient(app)
@@ -151,3 +152,90 @@ def test_successful_delete(simple_user):
                           headers={"Authorization": f"Bearer {data['token']}"},
                           params={})
     assert response.json()['icon'] == '0'
+
+def test_icon_collected(simple_user, monkeypatch):
+    '''
+        Test that an icon's file is deleted once nothing refers to it
+    '''
+    import io
+    import os
+    import random
+    from PIL import Image
+    from src.backend.classes import datastore
+    from src.backend.classes.datastore import data_store
+
+    monkeypatch.setattr(datastore, 'DOC_GRACE', 0)
+    headers = {"Authorization": f"Bearer {simple_user['token']}"}
+    image = io.BytesIO()
+    Image.new('RGB', (4, 4), tuple(random.randrange(256) for _ in range(3))).save(image, 'PNG')
+
+    doc_id = client.post("/upload/imgs", files={'file': ('icon.png', image.getvalue(), 'image/png')}).json()['doc_id']
+    path = data_store.get_doc_by_id(doc_id).get_path()
+    response = client.post("/service/add", headers=headers, json={
+                               'name': 'Iconic', 'description': 'service', 'tags': ['API'],
+                               'endpoints': [{'link': 'https://api.example.com', 'title_description': 'title',
+                                              'main_description': 'endpoint', 'tab': 'tab', 'parameters': [],
+                                              'method': 'GET', 'responses': []}]
+                           })
+    assert response.status_code == SUCCESS
+    sid = response.json()['id']
+    for response in [client.post("/user/add_icon", headers=headers, json={'doc_id': doc_id}),
+                     client.post("/service/add_icon", headers=headers, json={'sid': sid, 'doc_id': doc_id})]:
+        assert response.status_code == SUCCESS
+    assert data_store.get_doc_refs(doc_id) == 2
+
+    response = client.delete("/user/delete_icon", headers=headers)
+    assert response.status_code == SUCCESS
+    assert os.path.exists(path) and data_store.get_doc_refs(doc_id) == 1
+
+    response = client.get("/service/get/icon", params={'sid': sid, 'size': 64})
+    assert response.status_code == SUCCESS
+    variant = response.headers['etag'].strip('"')
+
+    response = client.delete("/service/delete", headers=headers, params={'sid': sid})
+    assert response.status_code == SUCCESS
+    assert not os.path.exists(path)
+    assert data_store.get_doc_by_id(doc_id) is None
+    assert not any(name.startswith(variant.split('_')[0]) for name in os.listdir(VARIANT_PATH))
+
+def test_icon_sizes(simple_user):
+    '''
+        Test that icons are served resized to each size, as WebP to clients
+        accepting it, and as they were uploaded without a size
+    '''
+    import io
+    from PIL import Image
+
+    headers = {"Authorization": f"Bearer {simple_user['token']}"}
+    image = io.BytesIO()
+    Image.new('RGBA', (600, 300), (10, 200, 30, 128)).save(image, 'PNG')
+
+    doc_id = client.post("/upload/imgs", files={'file': ('wide.png', image.getvalue(), 'image/png')}).json()['doc_id']
+    response = client.post("/user/add_icon", headers=headers, json={'doc_id': doc_id})
+    assert response.status_code == SUCCESS
+
+    response = client.get("/user/get/icon", headers=headers)
+    assert response.status_code == SUCCESS
+    assert response.content == image.getvalue()
+
+    for size in ICON_SIZES:
+        for accept, format in [('image/webp,image/*', 'WEBP'), ('image/*', 'PNG'), (None, 'PNG')]:
+            response = client.get("/user/get/icon", headers=headers | ({'Accept': accept} if accept else {}),
+                                  params={'size': size})
+            assert response.status_code == SUCCESS
+            assert response.headers['vary'] == 'Accept'
+            variant = Image.open(io.BytesIO(response.content))
+            assert variant.format == format
+            assert variant.size == (size, size // 2)
+            assert variant.mode == 'RGBA'
+
+    response = client.get("/user/get/icon", headers=headers, params={'size': 100})
+    assert response.status_code == INPUT_ERROR
+
+    # The default icon is rendered on first request, or returned as is if
+    # it can't be decoded
+    response = client.delete("/user/delete_icon", headers=headers)
+    assert response.status_code == SUCCESS
+    for _ in range(2):
+        response = client.get("/user/get/icon", headers=headers | {'Accept': 'image/webp'}, params={'size': 32})
+        assert response.status_code == SUCCESS